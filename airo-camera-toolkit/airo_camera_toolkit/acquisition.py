@@ -0,0 +1,250 @@
+"""Threaded frame acquisition for cameras.
+
+Grabbing a frame is a blocking call that takes up to a full frame period (e.g. 66ms for a camera at 15 fps).
+To avoid paying this latency on every read, a background thread can grab the frames and store them in a ring buffer
+of preallocated frames, from which the `get_*` methods of the camera can then read with near-zero latency.
+
+Typical usage is through the `Camera` interface:
+
+    camera.start_acquisition_thread(policy=FrameRingBuffer.LATEST_ONLY)
+    image = camera.get_rgb_image()  # returns the newest frame in the buffer
+    camera.stop_acquisition_thread()
+"""
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+@dataclass
+class BufferedFrame:
+    """A frame that was grabbed by the acquisition thread.
+
+    The data dict maps the name of a modality (e.g. "rgb" or "depth_map") to the array that was retrieved from the camera.
+    """
+
+    sequence_number: int
+    timestamp: float  # capture time of the frame, cf. Camera._retrieve_timestamp()
+    data: Dict[str, np.ndarray]
+
+
+class FrameRingBuffer:
+    """Fixed-size, thread-safe ring buffer of preallocated frames, written by a single producer.
+
+    The memory for the slots is allocated when the first frame is written, afterwards all frames are copied into the existing arrays
+    so that no allocations happen in the acquisition loop.
+
+    Two read policies are supported:
+    - LATEST_ONLY: a read returns the newest frame in the buffer. Frames that were overwritten before anyone read them are counted as dropped.
+    - QUEUE_ALL: a read returns the oldest unread frame (FIFO), so that every frame is consumed. If the reader cannot keep up and the buffer is full,
+     the oldest unread frame is overwritten and counted as dropped.
+    """
+
+    LATEST_ONLY = "latest_only"
+    QUEUE_ALL = "queue_all"
+    POLICIES = (LATEST_ONLY, QUEUE_ALL)
+
+    def __init__(self, size: int = 3, policy: str = LATEST_ONLY, copy_on_read: bool = True) -> None:
+        """
+        Args:
+            size: number of frame slots in the ring buffer, must be at least 2 so that the producer never writes into the newest frame.
+            policy: one of FrameRingBuffer.POLICIES.
+            copy_on_read: if False, reads return views on the slots of the buffer instead of copies. These views are only valid until the
+                producer wraps around the buffer (i.e. after size-1 new frames), so only use this if you process the frames faster than that.
+        """
+        if size < 2:
+            raise ValueError("the ring buffer needs at least 2 slots")
+        if policy not in self.POLICIES:
+            raise ValueError(f"policy must be one of {self.POLICIES}")
+
+        self.size = size
+        self.policy = policy
+        self.copy_on_read = copy_on_read
+
+        self._slots: List[Optional[Dict[str, np.ndarray]]] = [None] * size
+        self._sequence_numbers = [-1] * size
+        self._timestamps = [0.0] * size
+        self._is_read = [True] * size
+
+        self._condition = threading.Condition()
+        self._newest_slot = -1
+        self._oldest_unread_slot = -1
+        self._error: Optional[BaseException] = None
+        self._closed = False
+
+        self.written_frames = 0
+        self.dropped_frames = 0
+
+    @property
+    def newest_sequence_number(self) -> int:
+        """sequence number of the newest frame in the buffer, -1 if no frame was written yet."""
+        with self._condition:
+            return self._sequence_numbers[self._newest_slot] if self._newest_slot >= 0 else -1
+
+    def write(self, data: Dict[str, np.ndarray], timestamp: Optional[float] = None) -> None:
+        """Copy a new frame into the next slot of the buffer."""
+        timestamp = timestamp if timestamp is not None else time.time()
+        with self._condition:
+            slot = (self._newest_slot + 1) % self.size
+            if not self._is_read[slot] and self.policy == self.QUEUE_ALL:
+                # the reader did not keep up, drop the oldest unread frame.
+                self.dropped_frames += 1
+                self._oldest_unread_slot = (slot + 1) % self.size
+                self._is_read[slot] = True
+
+        # copy outside of the lock, the slot is not reachable for readers:
+        # in LATEST_ONLY mode readers only access the newest slot and in QUEUE_ALL mode this slot is marked as read.
+        slot_arrays = self._slots[slot]
+        if slot_arrays is None or not _have_same_layout(slot_arrays, data):
+            slot_arrays = {name: np.empty_like(array) for name, array in data.items()}
+            self._slots[slot] = slot_arrays
+        for name, array in data.items():
+            np.copyto(slot_arrays[name], array)
+
+        with self._condition:
+            if self.policy == self.LATEST_ONLY and self._newest_slot >= 0 and not self._is_read[self._newest_slot]:
+                # the previous frame will no longer be the newest, so it will never be read.
+                self.dropped_frames += 1
+                self._is_read[self._newest_slot] = True
+            self._sequence_numbers[slot] = self.written_frames
+            self._timestamps[slot] = timestamp
+            self._is_read[slot] = False
+            self._newest_slot = slot
+            if not self._has_unread_frame() or self.policy == self.LATEST_ONLY:
+                self._oldest_unread_slot = slot
+            self.written_frames += 1
+            self._condition.notify_all()
+
+    def read(
+        self,
+        wait_for_new_frame: bool = False,
+        timeout: Optional[float] = None,
+        modalities: Optional[Sequence[str]] = None,
+    ) -> BufferedFrame:
+        """Read a frame from the buffer, according to the policy of the buffer.
+
+        Args:
+            wait_for_new_frame: only relevant for LATEST_ONLY. If True, block until a frame is available that is newer than the last frame that was read.
+                Otherwise, the newest frame is returned immediately (even if it was read before), unless no frame has been written yet.
+                In QUEUE_ALL mode, reads always block until an unread frame is available.
+            timeout: maximum time to wait for a frame, raises a TimeoutError if exceeded.
+            modalities: the modalities to return, defaults to all. Only these are copied, so this avoids copying data you do not need.
+        """
+        with self._condition:
+            if self.policy == self.QUEUE_ALL or wait_for_new_frame:
+                is_available = self._has_unread_frame
+            else:
+                is_available = self._has_frame
+            if not self._condition.wait_for(
+                lambda: is_available() or self._error is not None or self._closed, timeout
+            ):
+                raise TimeoutError("no new frame was written to the buffer in time")
+            if self._error is not None:
+                raise RuntimeError("the acquisition thread stopped with an exception") from self._error
+            if not is_available():
+                raise RuntimeError("the buffer was closed")
+
+            slot = self._oldest_unread_slot if self.policy == self.QUEUE_ALL else self._newest_slot
+            slot_arrays = self._slots[slot]
+            assert slot_arrays is not None
+            names = slot_arrays.keys() if modalities is None else modalities
+            data = {name: slot_arrays[name].copy() if self.copy_on_read else slot_arrays[name] for name in names}
+            frame = BufferedFrame(self._sequence_numbers[slot], self._timestamps[slot], data)
+
+            self._is_read[slot] = True
+            if self.policy == self.QUEUE_ALL and slot != self._newest_slot:
+                self._oldest_unread_slot = (slot + 1) % self.size
+            return frame
+
+    def set_error(self, error: BaseException) -> None:
+        """Store an exception of the producer, it will be raised to all readers."""
+        with self._condition:
+            self._error = error
+            self._condition.notify_all()
+
+    def close(self) -> None:
+        """Wake up all blocked readers, subsequent reads only succeed if there is a frame available."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def _has_frame(self) -> bool:
+        return self._newest_slot >= 0
+
+    def _has_unread_frame(self) -> bool:
+        return self._newest_slot >= 0 and not self._is_read[self._oldest_unread_slot]
+
+
+def _have_same_layout(arrays: Dict[str, np.ndarray], other_arrays: Dict[str, np.ndarray]) -> bool:
+    if arrays.keys() != other_arrays.keys():
+        return False
+    return all(arrays[k].shape == other_arrays[k].shape and arrays[k].dtype == other_arrays[k].dtype for k in arrays)
+
+
+class AcquisitionThread:
+    """Background thread that repeatedly grabs frames and writes the requested modalities to a FrameRingBuffer."""
+
+    def __init__(
+        self,
+        grab: Callable[[], None],
+        retrievers: Dict[str, Callable[[], np.ndarray]],
+        buffer: FrameRingBuffer,
+        wait_for_new_frame: bool = False,
+        get_timestamp: Callable[[], float] = time.time,
+    ) -> None:
+        """
+        Args:
+            grab: blocking function that transfers the next frame of the camera to its memory buffer.
+            retrievers: maps each modality name to a function that returns the modality for the last grabbed frame.
+            buffer: the ring buffer to write to.
+            wait_for_new_frame: passed to FrameRingBuffer.read() by read_frame().
+            get_timestamp: returns the capture time of the last grabbed frame, defaults to the time right after the grab.
+        """
+        self._grab = grab
+        self._get_timestamp = get_timestamp
+        self._retrievers = retrievers
+        self.buffer = buffer
+        self.wait_for_new_frame = wait_for_new_frame
+
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="camera-acquisition", daemon=True)
+
+    @property
+    def modalities(self) -> Sequence[str]:
+        return tuple(self._retrievers.keys())
+
+    @property
+    def is_alive(self) -> bool:
+        return self._thread.is_alive()
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop_event.set()
+        self._thread.join(timeout)
+        self.buffer.close()
+
+    def read_frame(self, timeout: Optional[float] = None) -> BufferedFrame:
+        return self.buffer.read(self.wait_for_new_frame, timeout)
+
+    def read_modality(self, modality: str, timeout: Optional[float] = None) -> np.ndarray:
+        if modality not in self._retrievers:
+            raise ValueError(
+                f"modality {modality} is not acquired by the acquisition thread, the acquired modalities are {self.modalities}"
+            )
+        return self.buffer.read(self.wait_for_new_frame, timeout, (modality,)).data[modality]
+
+    def _run(self) -> None:
+        try:
+            while not self._stop_event.is_set():
+                self._grab()
+                timestamp = self._get_timestamp()
+                data = {modality: retrieve() for modality, retrieve in self._retrievers.items()}
+                self.buffer.write(data, timestamp)
+        except BaseException as e:  # noqa: B902 - propagate all errors to the readers
+            self.buffer.set_error(e)
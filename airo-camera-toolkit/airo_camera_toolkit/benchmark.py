@@ -0,0 +1,272 @@
+"""Benchmark of the throughput and latency of cameras, per stage of the image pipeline (grab, retrieve, format conversion, transforms).
+
+The results are JSON-serializable dicts, so that they can be stored and compared across versions of the camera SDKs and of this toolkit.
+Run this file to benchmark a camera for all its resolutions, with the int and float RGB retrieval paths and with depth on and off.
+It works with real cameras (ZED, Realsense) as well as with the fake and replay cameras, so that the overhead of the toolkit
+can also be measured without any hardware.
+"""
+from __future__ import annotations
+
+import functools
+import platform
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+from airo_camera_toolkit.image_transforms.image_transform import ImageTransform
+from airo_camera_toolkit.interfaces import DepthCamera, RGBCamera
+from airo_camera_toolkit.utils import ImageConverter
+
+STAGES = ("grab", "retrieve_rgb", "retrieve_depth", "convert", "transform", "total")
+"""the stages that are timed for each frame, total is the grab-to-return latency of the whole pipeline."""
+
+
+class StageTimer:
+    """Collects the durations of the stages of a pipeline."""
+
+    def __init__(self) -> None:
+        self.durations: Dict[str, List[float]] = defaultdict(list)
+
+    @contextmanager
+    def measure(self, stage: str) -> Iterator[None]:
+        start = time.perf_counter()
+        yield
+        self.durations[stage].append(time.perf_counter() - start)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """mean, percentiles and max of the duration of each stage, in milliseconds."""
+        summary = {}
+        for stage, durations in self.durations.items():
+            durations_ms = np.array(durations) * 1000
+            p50, p95, p99 = np.percentile(durations_ms, [50, 95, 99])
+            summary[stage] = {
+                "n": len(durations),
+                "mean_ms": float(durations_ms.mean()),
+                "p50_ms": float(p50),
+                "p95_ms": float(p95),
+                "p99_ms": float(p99),
+                "max_ms": float(durations_ms.max()),
+            }
+        return summary
+
+
+def benchmark_camera(
+    camera: RGBCamera,
+    n_frames: int = 100,
+    n_warmup_frames: int = 5,
+    rgb_as_int: bool = True,
+    depth: bool = False,
+    output_format: Optional[str] = ImageConverter.OPENCV_FORMAT,
+    transforms: Sequence[ImageTransform] = (),
+) -> Dict[str, Any]:
+    """Measure the fps and the latency of each stage of the pipeline that gets images from a camera.
+
+    Each frame is grabbed, the RGB image (and depth map) is retrieved, the RGB image is converted to the output format
+    and the transforms are applied to it.
+
+    Args:
+        camera: the camera to benchmark. Its acquisition thread should not be running, as this measures the blocking pipeline.
+        n_frames: number of frames to measure.
+        n_warmup_frames: number of frames to process before measuring, e.g. to allocate buffers.
+        rgb_as_int: retrieve the RGB images as uint8 (get_rgb_image_as_int) or as floats (get_rgb_image).
+        depth: retrieve the depth map as well. For cameras that can disable their depth computation (e.g. Zed2i.depth_enabled),
+            it is enabled or disabled accordingly during the benchmark.
+        output_format: ImageConverter format to convert the RGB images to, None to skip the conversion.
+        transforms: image transforms that are applied (in order) to the converted images.
+
+    Returns:
+        JSON-serializable dict with the configuration, the fps and the summary of each stage (cf. StageTimer.summary).
+    """
+    if camera.is_acquisition_thread_running:
+        raise RuntimeError("stop the acquisition thread of the camera before benchmarking it")
+    if depth and not isinstance(camera, DepthCamera):
+        raise ValueError("cannot benchmark depth for a camera that is not a DepthCamera")
+    if n_frames < 1:
+        raise ValueError(f"at least 1 frame should be measured, got n_frames={n_frames}")
+
+    original_depth_enabled = getattr(camera, "depth_enabled", None)
+    if original_depth_enabled is not None:
+        camera.depth_enabled = depth  # type: ignore[attr-defined]
+
+    try:
+        for _ in range(n_warmup_frames):
+            _process_frame(camera, StageTimer(), rgb_as_int, depth, output_format, transforms)
+        timer = StageTimer()
+        start = time.perf_counter()
+        for _ in range(n_frames):
+            image = _process_frame(camera, timer, rgb_as_int, depth, output_format, transforms)
+        duration = time.perf_counter() - start
+    finally:
+        if original_depth_enabled is not None:
+            camera.depth_enabled = original_depth_enabled  # type: ignore[attr-defined]
+
+    height, width = image.shape[:2] if output_format != ImageConverter.TORCH_FORMAT else image.shape[1:]
+    return {
+        "camera": type(camera).__name__,
+        "rgb_as_int": rgb_as_int,
+        "depth": depth,
+        "output_format": output_format,
+        "transforms": [type(transform).__name__ for transform in transforms],
+        "output_resolution": [int(width), int(height)],
+        "n_frames": n_frames,
+        "fps": n_frames / duration,
+        "stages": timer.summary(),
+    }
+
+
+def _process_frame(
+    camera: RGBCamera,
+    timer: StageTimer,
+    rgb_as_int: bool,
+    depth: bool,
+    output_format: Optional[str],
+    transforms: Sequence[ImageTransform],
+) -> np.ndarray:
+    # the stages are timed on the private methods behind the get_* methods, which grab and retrieve in one call
+    with timer.measure("total"):
+        with timer.measure("grab"):
+            camera._grab_new_frame()
+        with timer.measure("retrieve_rgb"):
+            if rgb_as_int:
+                image = camera._retrieve_rgb_image_as_int()
+                converter = ImageConverter.from_numpy_int_format(image)
+            else:
+                image = camera._retrieve_rgb_image()
+                converter = ImageConverter.from_numpy_format(image)
+        if depth:
+            assert isinstance(camera, DepthCamera)
+            with timer.measure("retrieve_depth"):
+                camera._retrieve_depth_map()
+        if output_format is not None:
+            with timer.measure("convert"):
+                image = converter.to_format(output_format)
+        if transforms:
+            with timer.measure("transform"):
+                for transform in transforms:
+                    image = transform.transform_image(image)
+    return image
+
+
+def environment_info() -> Dict[str, Any]:
+    """versions of the software that influences the benchmark results, to compare results across versions."""
+    info: Dict[str, Any] = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+    try:
+        from importlib.metadata import version
+
+        info["airo_camera_toolkit"] = version("airo_camera_toolkit")
+    except ImportError:
+        # also raised if the package is not installed (PackageNotFoundError), e.g. when running from a source checkout
+        pass
+    try:
+        import pyzed.sl as sl
+
+        info["zed_sdk"] = sl.Camera.get_sdk_version()
+    except ImportError:
+        pass
+    try:
+        import pyrealsense2 as rs  # type: ignore
+
+        info["realsense_sdk"] = rs.__version__
+    except (ImportError, AttributeError):
+        pass
+    return info
+
+
+def _camera_factories(camera_type: str, recording: Optional[str] = None) -> List[Tuple[str, Callable[[], RGBCamera]]]:
+    """(resolution name, function that creates the camera) for all resolutions of a camera type."""
+    if camera_type == "fake":
+        from airo_camera_toolkit.cameras.fake import FakeStereoRGBDCamera
+
+        # the ZED resolutions, without frame rate limit to measure the overhead of the toolkit
+        resolutions = [(672, 376), (1280, 720), (1920, 1080), (2208, 1242)]
+        return [(f"{w}x{h}", functools.partial(FakeStereoRGBDCamera, (w, h), fps=0)) for w, h in resolutions]
+    if camera_type == "zed":
+        from airo_camera_toolkit.cameras.zed2i import Zed2i
+
+        # the maximal fps for each resolution
+        zed_resolutions = [
+            ("VGA", Zed2i.RESOLUTION_VGA, 100),
+            ("720", Zed2i.RESOLUTION_720, 60),
+            ("1080", Zed2i.RESOLUTION_1080, 30),
+            ("2K", Zed2i.RESOLUTION_2K, 15),
+        ]
+        return [
+            (name, functools.partial(Zed2i, resolution, fps=fps, depth_mode=Zed2i.PERFORMANCE_DEPTH_MODE))
+            for name, resolution, fps in zed_resolutions
+        ]
+    if camera_type == "realsense":
+        from airo_camera_toolkit.cameras.realsense import Realsense
+
+        realsense_resolutions = [
+            (Realsense.RESOLUTION_240, 60),
+            (Realsense.RESOLUTION_480, 30),
+            (Realsense.RESOLUTION_720, 15),
+            (Realsense.RESOLUTION_1080, 8),
+        ]
+        return [(f"{r[0]}x{r[1]}", functools.partial(Realsense, r, fps=fps)) for r, fps in realsense_resolutions]
+    if camera_type == "replay":
+        from airo_camera_toolkit.cameras.replay import ReplayCamera
+
+        if recording is None:
+            raise ValueError("a recording is required for the replay camera")
+        return [("recording", functools.partial(ReplayCamera, recording, realtime=False, loop=True))]
+    raise ValueError(f"unknown camera type {camera_type}")
+
+
+if __name__ == "__main__":
+    import json
+
+    import click
+    from airo_camera_toolkit.image_transforms import Resize
+
+    @click.command()
+    @click.option("--camera", "camera_type", type=click.Choice(["fake", "zed", "realsense", "replay"]), default="fake")
+    @click.option("--recording", type=click.Path(exists=True), help="directory of the recording for the replay camera")
+    @click.option("--n_frames", default=100, help="number of frames to measure for each configuration")
+    @click.option(
+        "--resize/--no-resize", default=True, help="add a transform that resizes the images to half their size"
+    )
+    @click.option("--output", type=click.Path(), default=None, help="JSON file to write the results to")
+    def benchmark(
+        camera_type: str, recording: Optional[str], n_frames: int, resize: bool, output: Optional[str]
+    ) -> None:
+        """benchmarks a camera for all its resolutions, for the int and float RGB paths and with depth on and off."""
+        results = []
+        for resolution_name, camera_factory in _camera_factories(camera_type, recording):
+            camera = camera_factory()
+            try:
+                height, width, channels = camera.get_rgb_image_as_int().shape
+                transforms = [Resize((height, width, channels), height // 2, width // 2)] if resize else []
+                depth_options = [False, True] if isinstance(camera, DepthCamera) else [False]
+                for rgb_as_int in [True, False]:
+                    for depth in depth_options:
+                        result = benchmark_camera(
+                            camera, n_frames, rgb_as_int=rgb_as_int, depth=depth, transforms=transforms
+                        )
+                        result["resolution"] = resolution_name
+                        results.append(result)
+                        stages = result["stages"]
+                        print(
+                            f"{resolution_name:>10} int={rgb_as_int!s:5} depth={depth!s:5}: {result['fps']:7.1f} fps, "
+                            f"total p50={stages['total']['p50_ms']:6.2f} ms p99={stages['total']['p99_ms']:6.2f} ms"
+                        )
+            finally:
+                if hasattr(camera, "__exit__"):
+                    camera.__exit__(None, None, None)
+
+        if output is not None:
+            with open(output, "w") as file:
+                json.dump({"environment": environment_info(), "results": results}, file, indent=2)
+            print(f"results written to {output}")
+
+    benchmark()
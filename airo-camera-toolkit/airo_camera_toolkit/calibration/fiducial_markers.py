@@ -4,8 +4,10 @@ Use charuco whenever you can, as their checkerboard corners can be detected more
 This code is partially based on a codebase by Peter De Roovere (https://github.com/pderoovere),
 so part of the credit for this code goes to him.
 """
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import Any, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
 
 import cv2
 import numpy as np
@@ -44,13 +46,25 @@ class CharucoCornerDetectionResult(ArucoMarkerDetectionResult):
 #############
 
 
-def detect_aruco_markers(image: OpenCVIntImageType, dictionary: ArucoDictType) -> Optional[ArucoMarkerDetectionResult]:
-    """Detect markers from `aruco_dict` dictionary in the `image`."""
-    marker_corners, marker_ids, _ = aruco.detectMarkers(image, dictionary)
-    if marker_corners is None or marker_ids is None:
+def detect_aruco_markers(
+    image: OpenCVIntImageType, dictionary: ArucoDictType, pyramid_levels: int = 0
+) -> Optional[ArucoMarkerDetectionResult]:
+    """Detect markers from `aruco_dict` dictionary in the `image`.
+
+    Args:
+        image: the image.
+        dictionary: the aruco dictionary of the markers.
+        pyramid_levels: number of times the image is downscaled by a factor 2 before the markers are detected,
+            the corners are refined coarse-to-fine up to the full resolution. 1 or 2 levels are considerably faster
+            on high resolution images, as long as the markers remain large enough to be detected on the downscaled image.
+            Cf. benchmark_pyramid_detection for the speed and accuracy on your images.
+    """
+    detection = _detect_markers_coarse_to_fine(
+        lambda image: aruco.detectMarkers(image, dictionary), _to_gray(image), pyramid_levels
+    )
+    if detection is None:
         return None
-    marker_corners = np.stack(marker_corners)
-    marker_corners = refine_corner_detection(image, marker_corners)
+    marker_corners, marker_ids = detection
     result = ArucoMarkerDetectionResult(marker_corners, marker_ids, image)
     return result
 
@@ -79,7 +93,7 @@ def refine_corner_detection(image: OpenCVIntImageType, corners: np.ndarray) -> n
     term = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_COUNT, 100, 0.1)
     corners_shape = corners.shape
     corners = np.reshape(corners, (-1, 2))
-    gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    gray_image = _to_gray(image)
     # use a small window size, to avoid influence of a neighboring marker/ checkerboard tile
     # even then this sometimes gave worse results than without the refinement, so keep an eye on this
     corners = cv2.cornerSubPix(gray_image, corners, (3, 3), (-1, -1), term)
@@ -87,6 +101,257 @@ def refine_corner_detection(image: OpenCVIntImageType, corners: np.ndarray) -> n
     return corners
 
 
+def _detect_markers_coarse_to_fine(
+    detect_markers: Callable[[np.ndarray], Tuple[Any, Any, Any]],
+    gray_image: np.ndarray,
+    pyramid_levels: int,
+    refine_corners: bool = True,
+) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """Detect the markers on the coarsest level of an image pyramid and refine their corners on each finer level.
+
+    The refinement windows stay small at every level, as each level only has to correct the sub-pixel errors of the previous one.
+    If refine_corners is False, the corners are not refined on the finest level (the image itself), e.g. to refine them
+    together with other corners.
+    """
+    pyramid = [gray_image]
+    for _ in range(pyramid_levels):
+        pyramid.append(cv2.pyrDown(pyramid[-1]))
+    marker_corners, marker_ids, _ = detect_markers(pyramid[-1])
+    if marker_ids is None or len(marker_corners) == 0:
+        return None
+    # the corners are not refined on the coarsest level, where the windows would include the neighboring corners of small markers
+    marker_corners = np.stack(marker_corners)
+    for level in reversed(range(pyramid_levels)):
+        # the center of pixel i of a level is at 2i + 0.5 on the next finer level
+        marker_corners = (marker_corners + 0.5) * 2 - 0.5
+        if level > 0 or refine_corners:
+            marker_corners = refine_corner_detection(pyramid[level], marker_corners)
+    if pyramid_levels == 0 and refine_corners:
+        marker_corners = refine_corner_detection(gray_image, marker_corners)
+    return marker_corners, marker_ids
+
+
+def _to_gray(image: OpenCVIntImageType) -> np.ndarray:
+    """converts BGR images to grayscale, grayscale images are returned as is."""
+    if image.ndim == 2:
+        return image
+    if image.shape[2] == 1:
+        return image[..., 0]
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+
+class FiducialDetector:
+    """Stateful detector of aruco markers and charuco corners, for streams of images such as live marker tracking.
+
+    Compared to the detection functions above, the detector
+    - creates the cv2.aruco.ArucoDetector and CharucoDetector once instead of for every image,
+    - converts each image to grayscale only once, for the detection as well as for the sub-pixel refinement of all corners,
+    - tracks the markers: only a padded region of interest (ROI) around the markers of the previous image is searched,
+      which is considerably faster if the markers cover a small part of the image. The full image is searched if markers
+      of the previous image are lost and every `full_frame_interval` images, to find markers that enter the image.
+    The results are in the coordinates of the full image, as with the detection functions.
+    """
+
+    def __init__(
+        self,
+        dictionary: ArucoDictType = AIRO_DEFAULT_ARUCO_DICT,
+        charuco_board: Optional[CharucoDictType] = None,
+        detector_parameters: Optional[Any] = None,
+        track_markers: bool = True,
+        roi_padding: float = 0.5,
+        min_roi_padding: int = 32,
+        full_frame_interval: int = 30,
+        pyramid_levels: int = 0,
+    ) -> None:
+        """
+        Args:
+            dictionary: the aruco dictionary of the markers.
+            charuco_board: the charuco board, required to detect charuco corners.
+            detector_parameters: cv2.aruco.DetectorParameters, defaults to the OpenCV defaults.
+            track_markers: whether to search only the ROI around the markers of the previous image.
+            roi_padding: padding of the bounding box of the markers of the previous image, relative to the size of the box.
+            min_roi_padding: minimal padding in pixels, for small or distant markers.
+            full_frame_interval: number of images after which the full image is searched, even if all markers were found.
+            pyramid_levels: number of times the image (or ROI) is downscaled by a factor 2 before the markers are detected,
+                cf. detect_aruco_markers.
+        """
+        if detector_parameters is None:
+            detector_parameters = aruco.DetectorParameters()
+        self._aruco_detector = aruco.ArucoDetector(dictionary, detector_parameters)
+        self.charuco_board = charuco_board
+        self._charuco_detector = aruco.CharucoDetector(charuco_board) if charuco_board is not None else None
+        self.track_markers = track_markers
+        self.roi_padding = roi_padding
+        self.min_roi_padding = min_roi_padding
+        self.full_frame_interval = full_frame_interval
+        self.pyramid_levels = pyramid_levels
+        self.reset()
+
+    def reset(self) -> None:
+        """forgets the tracked markers, so that the next image is searched completely."""
+        self._roi: Optional[Tuple[int, int, int, int]] = None
+        self._n_tracked_markers = 0
+        self._n_images_since_full_frame = 0
+
+    @property
+    def roi(self) -> Optional[Tuple[int, int, int, int]]:
+        """(x_min, y_min, x_max, y_max) region that will be searched in the next image, None for the full image."""
+        return self._roi
+
+    def detect_aruco_markers(self, image: OpenCVIntImageType) -> Optional[ArucoMarkerDetectionResult]:
+        """Detect the markers of the dictionary in the image, cf. detect_aruco_markers."""
+        return self._detect_aruco_markers(image, _to_gray(image))
+
+    def detect_charuco_corners(self, image: OpenCVIntImageType) -> Optional[CharucoCornerDetectionResult]:
+        """Detect the corners of the charuco board in the image, cf. detect_charuco_corners."""
+        return self.detect(image)[1]
+
+    def detect(
+        self, image: OpenCVIntImageType
+    ) -> Tuple[Optional[ArucoMarkerDetectionResult], Optional[CharucoCornerDetectionResult]]:
+        """Detect the aruco markers and the charuco corners in the image, with a single grayscale conversion.
+
+        Returns:
+            the aruco markers and the charuco corners, each is None if they are not found.
+        """
+        if self._charuco_detector is None:
+            raise ValueError("the detector needs a charuco board to detect charuco corners")
+        gray_image = _to_gray(image)
+        # the marker corners are refined on the full image together with the charuco corners, in a single cornerSubPix call
+        markers_detection_result = self._detect_aruco_markers(image, gray_image, refine_corners=False)
+        if markers_detection_result is None:
+            return None, None
+        marker_corners = markers_detection_result.corners
+
+        # the CharucoDetector expects the marker ids as a row vector, the same size as the list of marker corners
+        charuco_corners, charuco_ids, _, _ = self._charuco_detector.detectBoard(
+            gray_image,
+            markerCorners=list(marker_corners),
+            markerIds=markers_detection_result.ids.reshape(1, -1),
+        )
+        if charuco_corners is None or charuco_ids is None or len(charuco_corners) == 0:
+            markers_detection_result.corners = refine_corner_detection(gray_image, marker_corners)
+            return markers_detection_result, None
+
+        n_marker_corners = marker_corners.size // 2
+        corners = np.concatenate([marker_corners.reshape(-1, 2), charuco_corners.reshape(-1, 2)])
+        corners = refine_corner_detection(gray_image, corners)
+        markers_detection_result.corners = corners[:n_marker_corners].reshape(marker_corners.shape)
+        charuco_corners = corners[n_marker_corners:].reshape(charuco_corners.shape)
+        return markers_detection_result, CharucoCornerDetectionResult(charuco_corners, charuco_ids, image)
+
+    def _detect_aruco_markers(
+        self, image: OpenCVIntImageType, gray_image: np.ndarray, refine_corners: bool = True
+    ) -> Optional[ArucoMarkerDetectionResult]:
+        detection = None
+        if self._roi is not None and self._n_images_since_full_frame < self.full_frame_interval:
+            detection = self._detect_markers_in_region(gray_image, self._roi, refine_corners)
+            self._n_images_since_full_frame += 1
+            if detection is not None and len(detection[1]) < self._n_tracked_markers:
+                detection = None  # some markers were lost, e.g. because they moved out of the ROI
+        if detection is None:
+            detection = self._detect_markers_in_region(gray_image, None, refine_corners)
+            self._n_images_since_full_frame = 0
+
+        if detection is None:
+            self._roi = None
+            self._n_tracked_markers = 0
+            return None
+
+        marker_corners, marker_ids = detection
+        if self.track_markers:
+            self._roi = self._get_padded_bounding_box(marker_corners, gray_image.shape)
+            self._n_tracked_markers = len(marker_ids)
+        return ArucoMarkerDetectionResult(marker_corners, marker_ids, image)
+
+    def _detect_markers_in_region(
+        self, gray_image: np.ndarray, roi: Optional[Tuple[int, int, int, int]], refine_corners: bool = True
+    ) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        x_min, y_min = 0, 0
+        if roi is not None:
+            x_min, y_min, x_max, y_max = roi
+            gray_image = gray_image[y_min:y_max, x_min:x_max]
+        detection = _detect_markers_coarse_to_fine(
+            self._aruco_detector.detectMarkers, gray_image, self.pyramid_levels, refine_corners
+        )
+        if detection is None:
+            return None
+        marker_corners, marker_ids = detection
+        marker_corners += np.array([x_min, y_min], dtype=marker_corners.dtype)
+        return marker_corners, marker_ids
+
+    def _get_padded_bounding_box(self, corners: np.ndarray, image_shape: Tuple[int, ...]) -> Tuple[int, int, int, int]:
+        corners = corners.reshape(-1, 2)
+        x_min, y_min = corners.min(axis=0)
+        x_max, y_max = corners.max(axis=0)
+        padding = max(self.min_roi_padding, self.roi_padding * max(x_max - x_min, y_max - y_min))
+        height, width = image_shape[:2]
+        return (
+            max(0, int(x_min - padding)),
+            max(0, int(y_min - padding)),
+            min(width, int(np.ceil(x_max + padding))),
+            min(height, int(np.ceil(y_max + padding))),
+        )
+
+
+def benchmark_pyramid_detection(
+    images: Sequence[OpenCVIntImageType],
+    dictionary: ArucoDictType = AIRO_DEFAULT_ARUCO_DICT,
+    pyramid_levels: Sequence[int] = (0, 1, 2),
+    n_repeats: int = 5,
+    tolerance: float = 0.5,
+) -> List[Dict[str, Any]]:
+    """Compare the duration and the accuracy of marker detection on different pyramid levels to the full resolution detection.
+
+    Args:
+        images: the images, e.g. of the markers in your setup.
+        dictionary: the aruco dictionary of the markers.
+        pyramid_levels: the pyramid levels to benchmark, level 0 (full resolution) is always included as the reference.
+        n_repeats: number of detections of which the fastest is reported.
+        tolerance: maximal distance in pixels between the corners of a pyramid level and the full resolution corners.
+
+    Returns:
+        a dict for each image and pyramid level, with the duration, the number of detected markers, the number of markers that
+        were missed compared to the full resolution, the maximal corner error in pixels and whether it is within the tolerance.
+    """
+    results = []
+    for image_index, image in enumerate(images):
+        reference_detection = None
+        for levels in sorted(set(pyramid_levels) | {0}):
+            durations = []
+            for _ in range(n_repeats):
+                start = time.perf_counter()
+                detection = detect_aruco_markers(image, dictionary, levels)
+                durations.append(time.perf_counter() - start)
+            if levels == 0:
+                reference_detection = detection
+            corners = _corners_by_id(detection)
+            reference_corners = _corners_by_id(reference_detection)
+            common_ids = corners.keys() & reference_corners.keys()
+            errors = [np.abs(corners[id] - reference_corners[id]).max() for id in common_ids]
+            max_corner_error = float(max(errors, default=0.0))
+            n_missed_markers = len(reference_corners.keys() - corners.keys())
+            results.append(
+                {
+                    "image": image_index,
+                    "resolution": [image.shape[1], image.shape[0]],
+                    "pyramid_levels": levels,
+                    "min_ms": min(durations) * 1000,
+                    "n_markers": len(corners),
+                    "n_missed_markers": n_missed_markers,
+                    "max_corner_error_px": max_corner_error,
+                    "within_tolerance": n_missed_markers == 0 and max_corner_error <= tolerance,
+                }
+            )
+    return results
+
+
+def _corners_by_id(detection: Optional[ArucoMarkerDetectionResult]) -> Dict[int, np.ndarray]:
+    if detection is None:
+        return {}
+    return {int(id): corners for id, corners in zip(detection.ids.ravel(), detection.corners)}
+
+
 ###################
 # pose estimation #
 ###################
@@ -110,12 +375,148 @@ def get_poses_of_aruco_markers(
     elif rvecs.shape != tvecs.shape:
         raise ValueError("rvecs and tvecs should have the same shape. Do you have multiple markers with the same ID?")
 
-    # combine the rvecs and tvecs into a single pose matrix
-    marker_poses_in_camera_frame = [
-        SE3Container.from_rotation_vector_and_translation(rvec[0], tvec).homogeneous_matrix
-        for rvec, tvec in zip(rvecs, tvecs)
-    ]
-    return marker_poses_in_camera_frame
+    # combine the rvecs and tvecs into pose matrices
+    marker_poses_in_camera_frame = _homogeneous_matrices(rvecs.reshape(-1, 3), tvecs.reshape(-1, 3))
+    return list(marker_poses_in_camera_frame)
+
+
+def get_stacked_poses_of_aruco_markers(
+    markers_detection_result: ArucoMarkerDetectionResult,
+    marker_size: float,
+    camera_matrix: CameraIntrinsicsMatrixType,
+    dist_coeffs: Optional[np.ndarray] = None,
+    num_workers: int = 1,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Get the poses of the detected markers in `markers_detection_result` as a single array, with their reprojection errors.
+
+    The poses are the same as those of get_poses_of_aruco_markers, cf. solve_pnp_batch.
+
+    Returns:
+        the (N,4,4) poses of the markers in the camera frame, in the order of `markers_detection_result.ids`,
+        and the (N,) RMS reprojection errors of their corners in pixels.
+    """
+    half_size = marker_size / 2
+    # the corners of a marker in its own frame, in the order of the detected corners (cf. cv2.aruco.estimatePoseSingleMarkers)
+    marker_points = np.array(
+        [
+            [-half_size, half_size, 0.0],
+            [half_size, half_size, 0.0],
+            [half_size, -half_size, 0.0],
+            [-half_size, -half_size, 0.0],
+        ]
+    )
+    image_points = markers_detection_result.corners.reshape(-1, 4, 2)
+    # SOLVEPNP_ITERATIVE is the default method of cv2.aruco.estimatePoseSingleMarkers, it is more accurate than IPPE_SQUARE
+    return solve_pnp_batch(
+        [marker_points] * len(image_points), list(image_points), camera_matrix, dist_coeffs, num_workers=num_workers
+    )
+
+
+def solve_pnp_batch(
+    object_points: Sequence[np.ndarray],
+    image_points: Sequence[np.ndarray],
+    camera_matrix: CameraIntrinsicsMatrixType,
+    dist_coeffs: Optional[np.ndarray] = None,
+    flags: int = cv2.SOLVEPNP_ITERATIVE,
+    num_workers: int = 1,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Solve the PnP problems of many objects (e.g. markers or boards) at once.
+
+    The rotation vectors of all solutions are converted to rotation matrices at once and the reprojection errors are computed
+    with a single projection of all points, instead of per object.
+
+    Args:
+        object_points: N arrays of (M_i,3) points in the frame of each object.
+        image_points: N arrays of the (M_i,2) corresponding pixels.
+        camera_matrix: the intrinsics matrix of the camera.
+        dist_coeffs: the distortion coefficients of the camera, in the OpenCV order.
+        flags: the cv2.SOLVEPNP_* method.
+        num_workers: number of threads to run solvePnP on. OpenCV releases the GIL, so this speeds up large batches on multi-core machines.
+
+    Returns:
+        the (N,4,4) poses of the objects in the camera frame (NaN if solvePnP fails)
+        and the (N,) RMS reprojection errors in pixels (NaN if solvePnP fails).
+    """
+    if len(object_points) != len(image_points):
+        raise ValueError("object_points and image_points should contain the same number of objects")
+    n_objects = len(object_points)
+    camera_matrix = np.asarray(camera_matrix, dtype=np.float64)
+
+    def solve(index: int) -> np.ndarray:
+        success, rvec, tvec = cv2.solvePnP(
+            np.asarray(object_points[index], dtype=np.float64),
+            np.asarray(image_points[index], dtype=np.float64).reshape(-1, 2),
+            camera_matrix,
+            dist_coeffs,
+            flags=flags,
+        )
+        if not success:
+            return np.full(6, np.nan)
+        return np.concatenate([rvec.ravel(), tvec.ravel()])
+
+    if num_workers == 1 or n_objects <= 1:
+        solutions = [solve(index) for index in range(n_objects)]
+    else:
+        with ThreadPoolExecutor(max_workers=num_workers) as pool:
+            solutions = list(pool.map(solve, range(n_objects)))
+
+    solutions_array = np.array(solutions).reshape(n_objects, 6)
+    poses = _homogeneous_matrices(solutions_array[:, :3], solutions_array[:, 3:])
+    reprojection_errors = _reprojection_errors(poses, object_points, image_points, camera_matrix, dist_coeffs)
+    return poses, reprojection_errors
+
+
+def _homogeneous_matrices(rotation_vectors: np.ndarray, translations: np.ndarray) -> np.ndarray:
+    """(N,4,4) homogeneous matrices of (N,3) rotation vectors and translations, with a vectorized Rodrigues formula."""
+    angles = np.linalg.norm(rotation_vectors, axis=1)
+    # the axis does not matter for (near) zero rotations, as their sine and 1 - cosine terms vanish
+    axes = rotation_vectors / np.where(angles > 1e-12, angles, 1.0)[:, np.newaxis]
+    x, y, z = axes[:, 0], axes[:, 1], axes[:, 2]
+    zeros = np.zeros_like(x)
+    cross_product_matrices = np.stack([zeros, -z, y, z, zeros, -x, -y, x, zeros], axis=1).reshape(-1, 3, 3)
+    sines = np.sin(angles)[:, np.newaxis, np.newaxis]
+    one_minus_cosines = (1 - np.cos(angles))[:, np.newaxis, np.newaxis]
+
+    matrices = np.zeros((len(rotation_vectors), 4, 4))
+    matrices[:, :3, :3] = (
+        np.eye(3)
+        + sines * cross_product_matrices
+        + one_minus_cosines * cross_product_matrices @ cross_product_matrices
+    )
+    matrices[:, :3, 3] = translations
+    matrices[:, 3, 3] = 1.0
+    return matrices
+
+
+def _reprojection_errors(
+    poses: np.ndarray,
+    object_points: Sequence[np.ndarray],
+    image_points: Sequence[np.ndarray],
+    camera_matrix: CameraIntrinsicsMatrixType,
+    dist_coeffs: Optional[np.ndarray],
+) -> np.ndarray:
+    """(N,) RMS distances in pixels between the image points and the projections of the object points with the poses."""
+    n_points_per_object = [len(points) for points in object_points]
+    object_indices = np.repeat(np.arange(len(poses)), n_points_per_object)
+    all_object_points = np.concatenate([np.asarray(points, dtype=np.float64) for points in object_points])
+    all_image_points = np.concatenate([np.asarray(points, dtype=np.float64).reshape(-1, 2) for points in image_points])
+
+    # transform all points to the camera frame at once and project them with a single call
+    rotations = poses[object_indices, :3, :3]
+    points_in_camera_frame = np.einsum("nij,nj->ni", rotations, all_object_points) + poses[object_indices, :3, 3]
+    squared_errors = np.full(len(all_object_points), np.nan)
+    is_solved = ~np.isnan(points_in_camera_frame).any(axis=1)
+    if is_solved.any():
+        projected_points, _ = cv2.projectPoints(
+            points_in_camera_frame[is_solved], np.zeros(3), np.zeros(3), camera_matrix, dist_coeffs
+        )
+        squared_errors[is_solved] = np.sum(
+            (projected_points.reshape(-1, 2) - all_image_points[is_solved]) ** 2, axis=1
+        )
+    mean_squared_errors = np.bincount(object_indices, weights=squared_errors, minlength=len(poses)) / np.maximum(
+        n_points_per_object, 1
+    )
+    return np.sqrt(mean_squared_errors)
 
 
 def get_pose_of_charuco_board(
@@ -183,6 +584,7 @@ if __name__ == "__main__":  # noqa: C901 - ignore complexity
     Defaults to the AIRO_DEFAULT_CHARUCO_BOARD.
     """
     import click
+    from airo_camera_toolkit.calibration.pose_filtering import MarkerPoseFilter
     from airo_camera_toolkit.cameras.zed2i import Zed2i
     from airo_camera_toolkit.utils import ImageConverter
 
@@ -191,11 +593,13 @@ if __name__ == "__main__":  # noqa: C901 - ignore complexity
     @click.option("--charuco_x_count", default=7, help="Number of checkerboard tiles in the x direction")
     @click.option("--charuco_y_count", default=5, help="Number of checkerboard tiles in the y direction")
     @click.option("--charuco_tile_size", default=0.04, help="Size of the charuco checkerboard tiles in meters")
+    @click.option("--pyramid_levels", default=0, help="Number of times the image is downscaled to detect the markers")
     def visualize_marker_detections(
         aruco_marker_size: float,
         charuco_x_count: Optional[int] = None,
         charuco_y_count: Optional[int] = None,
         charuco_tile_size: Optional[int] = None,
+        pyramid_levels: int = 0,
     ) -> None:
 
         aruco_dict = AIRO_DEFAULT_ARUCO_DICT
@@ -204,6 +608,11 @@ if __name__ == "__main__":  # noqa: C901 - ignore complexity
             charuco_board = aruco.CharucoBoard(
                 (charuco_x_count, charuco_y_count), charuco_tile_size, aruco_marker_size, aruco_dict
             )
+        detector = FiducialDetector(
+            aruco_dict, charuco_board if detect_charuco else None, pyramid_levels=pyramid_levels
+        )
+        # smooths the jitter of the charuco pose
+        pose_filter = MarkerPoseFilter()
 
         camera = Zed2i()
 
@@ -218,16 +627,18 @@ if __name__ == "__main__":  # noqa: C901 - ignore complexity
 
             intrinsics = camera.intrinsics_matrix()
 
-            aruco_result = detect_aruco_markers(image, aruco_dict)
+            if detect_charuco:
+                aruco_result, charuco_result = detector.detect(image)
+            else:
+                aruco_result = detector.detect_aruco_markers(image)
 
             if aruco_result:
                 aruco_poses = get_poses_of_aruco_markers(aruco_result, 0.04, intrinsics)
 
-            if aruco_result:
-                charuco_result = detect_charuco_corners(image, aruco_result, charuco_board)
-
-                if charuco_result:
-                    charuco_pose = get_pose_of_charuco_board(charuco_result, charuco_board, intrinsics)
+            if charuco_result:
+                charuco_pose = get_pose_of_charuco_board(charuco_result, charuco_board, intrinsics)
+                if charuco_pose is not None:
+                    charuco_pose = pose_filter.update([0], charuco_pose[np.newaxis], time.time()).get(0)
             if aruco_result:
                 image = visualize_aruco_detections(image, aruco_result)
                 if aruco_poses is not None:
@@ -0,0 +1,371 @@
+"""Offline intrinsics calibration of a camera from images of a charuco board, see __main__ for the CLI.
+
+The images are read from a folder or from a recording (cf. recording.py). The charuco corners are detected in a process pool,
+as the detection is by far the most expensive step. Views in which the board is blurry, or which (nearly) duplicate an earlier view,
+are rejected, as they only slow down the calibration without adding information. The remaining views are passed to
+cv2.aruco.calibrateCameraCharuco and the result can be stored in the CameraIntrinsics JSON format of airo-dataset-tools.
+"""
+from __future__ import annotations
+
+import glob
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import cv2
+import numpy as np
+from airo_camera_toolkit.calibration.fiducial_markers import (
+    AIRO_DEFAULT_CHARUCO_BOARD,
+    CharucoDictType,
+    FiducialDetector,
+)
+from airo_camera_toolkit.camera_calibration import CameraCalibration
+from airo_camera_toolkit.recording import METADATA_FILENAME, FrameStore
+from cv2 import aruco
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff")
+
+ImageSourceType = Union[str, Tuple[str, int]]
+"""the path of an image file, or the (path, frame index) of a frame of a recording."""
+
+# rejection reasons of views
+NO_BOARD = "no_board"
+TOO_FEW_CORNERS = "too_few_corners"
+BLURRY = "blurry"
+DUPLICATE = "duplicate"
+
+
+@dataclass
+class CharucoView:
+    """The charuco corners that were detected in an image."""
+
+    source: str
+    resolution: Tuple[int, int]
+    corners: Optional[np.ndarray] = None
+    """(M,1,2) charuco corners, None if the board was not found."""
+    ids: Optional[np.ndarray] = None
+    """(M,1) ids of the charuco corners."""
+    sharpness: float = 0.0
+    """variance of the Laplacian of the image within the bounding box of the corners, higher is sharper."""
+
+
+@dataclass
+class IntrinsicsCalibrationResult:
+    calibration: CameraCalibration
+    reprojection_error: float
+    """RMS reprojection error of the charuco corners in pixels."""
+    views: List[CharucoView]
+    """the views that were used for the calibration."""
+    rejected_views: Dict[str, List[str]] = field(default_factory=dict)
+    """the sources of the rejected views, per rejection reason."""
+
+
+def _board_parameters(board: CharucoDictType) -> Tuple[Any, ...]:
+    """picklable parameters of a charuco board, to create the board in the worker processes (cv2 boards cannot be pickled)."""
+    dictionary = board.getDictionary()
+    return (
+        tuple(board.getChessboardSize()),
+        board.getSquareLength(),
+        board.getMarkerLength(),
+        dictionary.bytesList,
+        dictionary.markerSize,
+        dictionary.maxCorrectionBits,
+    )
+
+
+def _create_board(board_parameters: Tuple[Any, ...]) -> CharucoDictType:
+    size, square_length, marker_length, bytes_list, marker_size, max_correction_bits = board_parameters
+    dictionary = aruco.Dictionary(bytes_list, marker_size, max_correction_bits)
+    return aruco.CharucoBoard(size, square_length, marker_length, dictionary)
+
+
+class _ViewDetector:
+    """Detects the charuco corners in images, one instance lives in each worker process."""
+
+    def __init__(self, board_parameters: Tuple[Any, ...], pyramid_levels: int, modality: str) -> None:
+        charuco_board = _create_board(board_parameters)
+        # the images are unrelated, so tracking the markers from image to image would only miss markers
+        self.detector = FiducialDetector(
+            charuco_board.getDictionary(), charuco_board, track_markers=False, pyramid_levels=pyramid_levels
+        )
+        self.modality = modality
+        self._frame_stores: Dict[str, FrameStore] = {}
+
+    def load_gray_image(self, source: ImageSourceType) -> np.ndarray:
+        if isinstance(source, str):
+            image = cv2.imread(source, cv2.IMREAD_GRAYSCALE)
+            if image is None:
+                raise ValueError(f"could not read image {source}")
+            return image
+        path, index = source
+        if path not in self._frame_stores:
+            self._frame_stores[path] = FrameStore(path)
+        image = self._frame_stores[path].get(self.modality, index)
+        if image.dtype != np.uint8:
+            image = (image * 255).astype(np.uint8)
+        # the recorded images are RGB
+        return cv2.cvtColor(image, cv2.COLOR_RGB2GRAY) if image.ndim == 3 else image
+
+    def detect(self, source: ImageSourceType) -> CharucoView:
+        gray_image = self.load_gray_image(source)
+        description = source if isinstance(source, str) else f"{source[0]}:{source[1]}"
+        view = CharucoView(description, (gray_image.shape[1], gray_image.shape[0]))
+        _, charuco_result = self.detector.detect(gray_image)
+        if charuco_result is None:
+            return view
+        view.corners = charuco_result.corners.astype(np.float32)
+        view.ids = charuco_result.ids.astype(np.int32)
+        # the sharpness is measured on the board only, a sharp background does not make a blurry board usable
+        x_min, y_min = np.floor(view.corners.reshape(-1, 2).min(axis=0)).astype(int)
+        x_max, y_max = np.ceil(view.corners.reshape(-1, 2).max(axis=0)).astype(int)
+        board_region = gray_image[max(y_min, 0) : y_max + 1, max(x_min, 0) : x_max + 1]
+        view.sharpness = float(cv2.Laplacian(board_region, cv2.CV_64F).var())
+        return view
+
+
+_worker_view_detector: Optional[_ViewDetector] = None
+
+
+def _initialize_worker(board_parameters: Tuple[Any, ...], pyramid_levels: int, modality: str) -> None:
+    global _worker_view_detector
+    # the workers run in parallel, so they should not use multiple threads each
+    cv2.setNumThreads(1)
+    _worker_view_detector = _ViewDetector(board_parameters, pyramid_levels, modality)
+
+
+def _detect_in_worker(source: ImageSourceType) -> CharucoView:
+    assert _worker_view_detector is not None
+    return _worker_view_detector.detect(source)
+
+
+def get_image_sources(path: str, modality: str = "rgb") -> List[ImageSourceType]:
+    """The image files in a folder (sorted by name), or the frames of a recording if the folder contains a recording."""
+    if os.path.exists(os.path.join(path, METADATA_FILENAME)):
+        frame_store = FrameStore(path)
+        if modality not in frame_store.modalities:
+            raise ValueError(
+                f"modality {modality} was not recorded, the recorded modalities are {frame_store.modalities}"
+            )
+        return [(path, index) for index in range(len(frame_store))]
+    image_paths = sorted(glob.glob(os.path.join(path, "*")))
+    return [image_path for image_path in image_paths if image_path.lower().endswith(IMAGE_EXTENSIONS)]
+
+
+def detect_charuco_views(
+    sources: Sequence[ImageSourceType],
+    charuco_board: CharucoDictType = AIRO_DEFAULT_CHARUCO_BOARD,
+    num_workers: Optional[int] = None,
+    pyramid_levels: int = 0,
+    modality: str = "rgb",
+) -> List[CharucoView]:
+    """Detect the charuco corners in all images, in a pool of worker processes.
+
+    Args:
+        sources: the images, cf. get_image_sources.
+        charuco_board: the charuco board.
+        num_workers: number of processes, defaults to the number of cores. Use 1 to detect in the calling process.
+        pyramid_levels: cf. detect_aruco_markers, 1 speeds up the detection on high resolution images.
+        modality: the modality of the frames of recordings.
+
+    Returns:
+        a view for each source, in the same order.
+    """
+    board_parameters = _board_parameters(charuco_board)
+    num_workers = num_workers or os.cpu_count() or 1
+    if num_workers == 1 or len(sources) <= 1:
+        view_detector = _ViewDetector(board_parameters, pyramid_levels, modality)
+        return [view_detector.detect(source) for source in sources]
+
+    with ProcessPoolExecutor(
+        max_workers=num_workers,
+        initializer=_initialize_worker,
+        initargs=(board_parameters, pyramid_levels, modality),
+    ) as pool:
+        # the views are small (only the corners), so returning them is cheap compared to the detection
+        return list(pool.map(_detect_in_worker, sources, chunksize=max(1, len(sources) // (4 * num_workers))))
+
+
+def select_views(
+    views: Sequence[CharucoView],
+    min_corners: int = 6,
+    min_relative_sharpness: float = 0.25,
+    min_corner_displacement: float = 5.0,
+) -> Tuple[List[CharucoView], Dict[str, List[str]]]:
+    """Reject the views without (enough) corners, with a blurry board or that duplicate an earlier view.
+
+    The board is blurry if its sharpness is below min_relative_sharpness times the median sharpness of the views,
+    as the absolute sharpness depends on the camera, the lighting and the distance to the board.
+
+    A view duplicates an earlier view if it contains (nearly) the same corners, of which none moved more than
+    min_corner_displacement pixels, e.g. because the camera and the board did not move between consecutive frames of a recording.
+    Tilting the board changes the corners near its center only slightly, so the largest displacement is compared rather than the mean.
+
+    Returns:
+        the selected views and the sources of the rejected views per rejection reason.
+    """
+    rejected_views: Dict[str, List[str]] = {NO_BOARD: [], TOO_FEW_CORNERS: [], BLURRY: [], DUPLICATE: []}
+    selected_views: List[CharucoView] = []
+    # the corners of the selected views in a dense (n_views, n_board_corners, 2) array, NaN for corners that were not detected
+    median_sharpness = np.median([view.sharpness for view in views if view.corners is not None] or [0.0])
+    n_board_corners = 1 + max(
+        (int(view.ids.max()) for view in views if view.ids is not None and len(view.ids)), default=0
+    )
+    selected_corners = np.empty((0, n_board_corners, 2))
+
+    for view in views:
+        if view.corners is None or view.ids is None:
+            rejected_views[NO_BOARD].append(view.source)
+            continue
+        if len(view.ids) < min_corners:
+            rejected_views[TOO_FEW_CORNERS].append(view.source)
+            continue
+        if view.sharpness < min_relative_sharpness * median_sharpness:
+            rejected_views[BLURRY].append(view.source)
+            continue
+
+        corners = np.full((n_board_corners, 2), np.nan)
+        corners[view.ids.ravel()] = view.corners.reshape(-1, 2)
+        if len(selected_corners) > 0:
+            is_common = ~np.isnan(selected_corners[:, :, 0]) & ~np.isnan(corners[:, 0])
+            n_common = is_common.sum(axis=1)
+            displacements = np.linalg.norm(selected_corners - corners, axis=2)
+            max_displacements = np.where(is_common, displacements, 0.0).max(axis=1)
+            is_duplicate = (n_common >= 0.8 * len(view.ids)) & (max_displacements < min_corner_displacement)
+            if is_duplicate.any():
+                rejected_views[DUPLICATE].append(view.source)
+                continue
+        selected_views.append(view)
+        selected_corners = np.concatenate([selected_corners, corners[np.newaxis]])
+    return selected_views, rejected_views
+
+
+def calibrate_intrinsics(
+    views: Sequence[CharucoView],
+    charuco_board: CharucoDictType = AIRO_DEFAULT_CHARUCO_BOARD,
+    max_views: Optional[int] = 60,
+    flags: int = 0,
+) -> Tuple[CameraCalibration, float]:
+    """Calibrate the intrinsics and distortion coefficients of a camera from views of a charuco board.
+
+    Args:
+        views: the (selected) views, all with the same resolution.
+        charuco_board: the charuco board.
+        max_views: the calibration uses at most this many views, evenly spread over the views, as its duration grows
+            quickly with the number of views while the result hardly improves beyond a few dozen diverse views. None for all views.
+        flags: cv2.CALIB_* flags of the calibration.
+
+    Returns:
+        the calibration and the RMS reprojection error in pixels.
+    """
+    if len(views) < 3:
+        raise ValueError(f"the calibration needs at least 3 views of the board, got {len(views)}")
+    resolutions = {view.resolution for view in views}
+    if len(resolutions) != 1:
+        raise ValueError(f"all views should have the same resolution, got {resolutions}")
+    if max_views is not None and len(views) > max_views:
+        indices = np.round(np.linspace(0, len(views) - 1, max_views)).astype(int)
+        views = [views[index] for index in indices]
+
+    resolution = resolutions.pop()
+    reprojection_error, intrinsics_matrix, distortion_coefficients, _, _ = aruco.calibrateCameraCharuco(
+        charucoCorners=[view.corners for view in views],
+        charucoIds=[view.ids for view in views],
+        board=charuco_board,
+        imageSize=resolution,
+        cameraMatrix=None,
+        distCoeffs=None,
+        flags=flags,
+    )
+    calibration = CameraCalibration(resolution, intrinsics_matrix, distortion_coefficients.ravel())
+    return calibration, float(reprojection_error)
+
+
+def calibrate_intrinsics_from_images(
+    sources: Sequence[ImageSourceType],
+    charuco_board: CharucoDictType = AIRO_DEFAULT_CHARUCO_BOARD,
+    num_workers: Optional[int] = None,
+    pyramid_levels: int = 0,
+    modality: str = "rgb",
+    min_corners: int = 6,
+    min_relative_sharpness: float = 0.25,
+    min_corner_displacement: float = 5.0,
+    max_views: Optional[int] = 60,
+) -> IntrinsicsCalibrationResult:
+    """Detect the charuco corners in the images, select the views and calibrate the intrinsics, cf. the functions of each step."""
+    views = detect_charuco_views(sources, charuco_board, num_workers, pyramid_levels, modality)
+    selected_views, rejected_views = select_views(views, min_corners, min_relative_sharpness, min_corner_displacement)
+    calibration, reprojection_error = calibrate_intrinsics(selected_views, charuco_board, max_views)
+    return IntrinsicsCalibrationResult(calibration, reprojection_error, selected_views, rejected_views)
+
+
+def save_camera_intrinsics(calibration: CameraCalibration, path: str) -> None:
+    """Store the calibration in the CameraIntrinsics JSON format of airo-dataset-tools."""
+    with open(path, "w") as file:
+        json.dump(calibration.to_camera_intrinsics().dict(exclude_none=True), file, indent=4)
+
+
+if __name__ == "__main__":
+    """CLI to calibrate the intrinsics of a camera from a folder of images or a recording of a charuco board.
+    run python -m <file-name> --help to see the available options in the terminal.
+    """
+    import time
+
+    import click
+    from airo_camera_toolkit.calibration.fiducial_markers import AIRO_DEFAULT_ARUCO_DICT
+
+    @click.command()
+    @click.argument("path", type=click.Path(exists=True, file_okay=False))
+    @click.option("--output", default="camera_intrinsics.json", help="Path of the CameraIntrinsics JSON file")
+    @click.option("--aruco_marker_size", default=0.031, help="Size of the aruco markers in meters")
+    @click.option("--charuco_x_count", default=7, help="Number of checkerboard tiles in the x direction")
+    @click.option("--charuco_y_count", default=5, help="Number of checkerboard tiles in the y direction")
+    @click.option("--charuco_tile_size", default=0.04, help="Size of the charuco checkerboard tiles in meters")
+    @click.option("--num_workers", default=None, type=int, help="Number of detection processes, defaults to all cores")
+    @click.option(
+        "--pyramid_levels", default=0, help="Number of times the images are downscaled to detect the markers"
+    )
+    @click.option("--modality", default="rgb", help="Modality of the frames of a recording")
+    @click.option(
+        "--min_relative_sharpness", default=0.25, help="Minimal sharpness of the board relative to the median"
+    )
+    @click.option("--max_views", default=60, help="Maximal number of views in the calibration")
+    def calibrate(
+        path: str,
+        output: str,
+        aruco_marker_size: float,
+        charuco_x_count: int,
+        charuco_y_count: int,
+        charuco_tile_size: float,
+        num_workers: Optional[int],
+        pyramid_levels: int,
+        modality: str,
+        min_relative_sharpness: float,
+        max_views: int,
+    ) -> None:
+        charuco_board = aruco.CharucoBoard(
+            (charuco_x_count, charuco_y_count), charuco_tile_size, aruco_marker_size, AIRO_DEFAULT_ARUCO_DICT
+        )
+        sources = get_image_sources(path, modality)
+        print(f"calibrating with {len(sources)} images from {path}")
+        start = time.perf_counter()
+        result = calibrate_intrinsics_from_images(
+            sources,
+            charuco_board,
+            num_workers=num_workers,
+            pyramid_levels=pyramid_levels,
+            modality=modality,
+            min_relative_sharpness=min_relative_sharpness,
+            max_views=max_views,
+        )
+        for reason, rejected_sources in result.rejected_views.items():
+            print(f"rejected {len(rejected_sources)} views: {reason}")
+        print(f"calibrated with {len(result.views)} views in {time.perf_counter() - start:.1f} s")
+        print(f"RMS reprojection error: {result.reprojection_error:.3f} pixels")
+        print(f"intrinsics matrix:\n{result.calibration.intrinsics_matrix}")
+        print(f"distortion coefficients: {result.calibration.distortion_coefficients}")
+        save_camera_intrinsics(result.calibration, output)
+        print(f"saved the intrinsics to {output}")
+
+    calibrate()
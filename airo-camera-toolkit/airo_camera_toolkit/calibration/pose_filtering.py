@@ -0,0 +1,232 @@
+"""Streaming filters to smooth the poses of tracked markers and boards, which jitter from frame to frame.
+
+The OneEuroPoseFilter applies a one-euro filter (Casiez et al., 2012) to the translation and the orientation (as a quaternion)
+of a single pose: it smooths strongly while the pose is (nearly) static and follows quickly when it moves, so it adds little lag.
+The MarkerPoseFilter keeps a OneEuroPoseFilter per marker (or board) ID and handles dropouts and outliers,
+so that it can be placed directly behind a detection loop. Both keep a constant amount of state per ID, regardless of the history.
+"""
+from __future__ import annotations
+
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+from airo_typing import HomogeneousMatrixType
+from scipy.spatial.transform import Rotation
+
+
+def _smoothing_factor(cutoff_frequency: float, time_step: float) -> float:
+    """the weight of a new value in an exponential smoothing with the cutoff frequency, cf. the one-euro filter paper."""
+    time_constant = 1.0 / (2 * np.pi * cutoff_frequency)
+    return 1.0 / (1.0 + time_constant / time_step)
+
+
+class _OneEuroFilter:
+    """One-euro filter of a vector, of which the cutoff frequency depends on the norm of its (filtered) derivative."""
+
+    def __init__(self, min_cutoff: float, beta: float, derivative_cutoff: float) -> None:
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.derivative_cutoff = derivative_cutoff
+        self.value: Optional[np.ndarray] = None
+        self.derivative: Optional[np.ndarray] = None
+
+    def update(self, value: np.ndarray, time_step: float) -> np.ndarray:
+        if self.value is None or self.derivative is None or time_step <= 0:
+            if self.value is None:
+                self.value = value.copy()
+                self.derivative = np.zeros_like(value)
+            return self.value
+
+        derivative = (value - self.value) / time_step
+        alpha = _smoothing_factor(self.derivative_cutoff, time_step)
+        self.derivative = alpha * derivative + (1 - alpha) * self.derivative
+
+        cutoff = self.min_cutoff + self.beta * float(np.linalg.norm(self.derivative))
+        alpha = _smoothing_factor(cutoff, time_step)
+        self.value = alpha * value + (1 - alpha) * self.value
+        return self.value
+
+
+class OneEuroPoseFilter:
+    """One-euro filter of a single pose: the translation and the orientation (as a unit quaternion) are filtered separately.
+
+    The quaternions of consecutive poses are kept in the same hemisphere (q and -q are the same orientation),
+    and the filtered quaternion is normalized, which is a good approximation of the rotation average for nearby orientations.
+    """
+
+    def __init__(
+        self,
+        min_cutoff: float = 1.0,
+        beta: float = 5.0,
+        derivative_cutoff: float = 1.0,
+        rotation_min_cutoff: Optional[float] = None,
+        rotation_beta: Optional[float] = None,
+    ) -> None:
+        """
+        Args:
+            min_cutoff: cutoff frequency (Hz) of the translation when the pose is static, lower values remove more jitter.
+            beta: increase of the cutoff frequency per m/s of translation speed, higher values reduce the lag of moving poses.
+            derivative_cutoff: cutoff frequency (Hz) of the speed estimates.
+            rotation_min_cutoff: min_cutoff of the orientation, defaults to min_cutoff.
+            rotation_beta: increase of the cutoff frequency per unit/s of quaternion change (about 0.5 per rad/s), defaults to beta.
+        """
+        rotation_min_cutoff = min_cutoff if rotation_min_cutoff is None else rotation_min_cutoff
+        rotation_beta = beta if rotation_beta is None else rotation_beta
+        self._translation_filter = _OneEuroFilter(min_cutoff, beta, derivative_cutoff)
+        self._quaternion_filter = _OneEuroFilter(rotation_min_cutoff, rotation_beta, derivative_cutoff)
+        self.timestamp: Optional[float] = None
+        """timestamp of the last update."""
+        self.pose: Optional[HomogeneousMatrixType] = None
+        """the filtered pose, None before the first update."""
+
+    def update(self, pose: HomogeneousMatrixType, timestamp: float) -> HomogeneousMatrixType:
+        """Add a measured pose and get the filtered pose.
+
+        Args:
+            pose: the measured pose.
+            timestamp: time of the measurement in seconds, e.g. of the camera frame.
+        """
+        time_step = 0.0 if self.timestamp is None else timestamp - self.timestamp
+        quaternion = Rotation.from_matrix(pose[:3, :3]).as_quat()
+        previous_quaternion = self._quaternion_filter.value
+        if previous_quaternion is not None and np.dot(quaternion, previous_quaternion) < 0:
+            quaternion = -quaternion
+
+        translation = self._translation_filter.update(np.asarray(pose[:3, 3], dtype=np.float64), time_step)
+        quaternion = self._quaternion_filter.update(quaternion, time_step)
+        quaternion = quaternion / np.linalg.norm(quaternion)
+        # keep the normalized quaternion as state, so that its norm does not drift
+        self._quaternion_filter.value = quaternion
+
+        filtered_pose = np.eye(4)
+        filtered_pose[:3, :3] = Rotation.from_quat(quaternion).as_matrix()
+        filtered_pose[:3, 3] = translation
+        self.timestamp = timestamp
+        self.pose = filtered_pose
+        return filtered_pose
+
+
+class MarkerPoseFilter:
+    """Filters the poses of the markers (or boards) of a detection loop, per ID.
+
+    Each ID has its own OneEuroPoseFilter. Measurements are rejected as outliers if their reprojection error is too large,
+    or if they jump too far from the filtered pose. A jump that persists for `max_consecutive_outliers` measurements is
+    accepted as a real motion (e.g. the marker was moved while it was occluded), and the filter of the ID restarts from it.
+    IDs that are not observed for `max_dropout_time` seconds are forgotten, so that their filters restart on the next
+    observation instead of smoothing across the gap.
+
+        pose_filter = MarkerPoseFilter()
+        while True:
+            markers = detector.detect_aruco_markers(image)
+            poses, reprojection_errors = get_stacked_poses_of_aruco_markers(markers, marker_size, intrinsics)
+            filtered_poses = pose_filter.update(markers.ids.ravel(), poses, timestamp, reprojection_errors)
+    """
+
+    def __init__(
+        self,
+        min_cutoff: float = 1.0,
+        beta: float = 5.0,
+        derivative_cutoff: float = 1.0,
+        max_reprojection_error: Optional[float] = 2.0,
+        max_translation_jump: Optional[float] = 0.05,
+        max_rotation_jump: Optional[float] = np.deg2rad(20),
+        max_consecutive_outliers: int = 5,
+        max_dropout_time: float = 1.0,
+    ) -> None:
+        """
+        Args:
+            min_cutoff, beta, derivative_cutoff: the parameters of the OneEuroPoseFilters.
+            max_reprojection_error: measurements with a larger reprojection error (in pixels) are rejected, None to disable.
+            max_translation_jump: measurements further from the filtered pose (in meters) are outliers, None to disable.
+            max_rotation_jump: measurements rotated further from the filtered pose (in radians) are outliers, None to disable.
+            max_consecutive_outliers: number of consecutive jumps after which the filter of an ID restarts from the measurement.
+            max_dropout_time: time in seconds after which an unobserved ID is forgotten.
+        """
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.derivative_cutoff = derivative_cutoff
+        self.max_reprojection_error = max_reprojection_error
+        self.max_translation_jump = max_translation_jump
+        self.max_rotation_jump = max_rotation_jump
+        self.max_consecutive_outliers = max_consecutive_outliers
+        self.max_dropout_time = max_dropout_time
+        self._filters: Dict[int, OneEuroPoseFilter] = {}
+        self._n_consecutive_outliers: Dict[int, int] = {}
+
+    def reset(self) -> None:
+        self._filters.clear()
+        self._n_consecutive_outliers.clear()
+
+    @property
+    def poses(self) -> Dict[int, HomogeneousMatrixType]:
+        """the filtered poses of all tracked IDs."""
+        return {id: pose_filter.pose for id, pose_filter in self._filters.items() if pose_filter.pose is not None}
+
+    def get_pose(self, id: int) -> Optional[HomogeneousMatrixType]:
+        """the filtered pose of an ID, None if it is not tracked."""
+        pose_filter = self._filters.get(id)
+        return None if pose_filter is None else pose_filter.pose
+
+    def update(
+        self,
+        ids: Sequence[int],
+        poses: np.ndarray,
+        timestamp: float,
+        reprojection_errors: Optional[np.ndarray] = None,
+    ) -> Dict[int, HomogeneousMatrixType]:
+        """Add the measured poses of a frame and get the filtered poses.
+
+        Args:
+            ids: the (N,) IDs of the markers or boards.
+            poses: the (N,4,4) measured poses (or a sequence of N poses), e.g. of get_stacked_poses_of_aruco_markers.
+            timestamp: time of the frame in seconds.
+            reprojection_errors: optional (N,) reprojection errors of the poses in pixels.
+
+        Returns:
+            the filtered poses of all IDs that are tracked, including recently occluded IDs (which keep their last pose).
+        """
+        self._forget_dropouts(timestamp)
+        for index, id in enumerate(ids):
+            id = int(id)
+            pose = np.asarray(poses[index])
+            if np.isnan(pose).any():
+                continue
+            if (
+                reprojection_errors is not None
+                and self.max_reprojection_error is not None
+                and not reprojection_errors[index] <= self.max_reprojection_error
+            ):
+                continue
+
+            pose_filter = self._filters.get(id)
+            if pose_filter is not None and pose_filter.pose is not None and self._is_jump(pose_filter.pose, pose):
+                self._n_consecutive_outliers[id] = self._n_consecutive_outliers.get(id, 0) + 1
+                if self._n_consecutive_outliers[id] < self.max_consecutive_outliers:
+                    continue
+                pose_filter = None  # the jump persists: restart from the new pose
+
+            if pose_filter is None:
+                pose_filter = OneEuroPoseFilter(self.min_cutoff, self.beta, self.derivative_cutoff)
+                self._filters[id] = pose_filter
+            self._n_consecutive_outliers[id] = 0
+            pose_filter.update(pose, timestamp)
+        return self.poses
+
+    def _is_jump(self, filtered_pose: HomogeneousMatrixType, pose: HomogeneousMatrixType) -> bool:
+        if self.max_translation_jump is not None:
+            if np.linalg.norm(pose[:3, 3] - filtered_pose[:3, 3]) > self.max_translation_jump:
+                return True
+        if self.max_rotation_jump is not None:
+            relative_rotation = filtered_pose[:3, :3].T @ pose[:3, :3]
+            # the rotation angle from the trace of the rotation matrix
+            angle = np.arccos(np.clip((np.trace(relative_rotation) - 1) / 2, -1.0, 1.0))
+            if angle > self.max_rotation_jump:
+                return True
+        return False
+
+    def _forget_dropouts(self, timestamp: float) -> None:
+        for id in list(self._filters.keys()):
+            last_timestamp = self._filters[id].timestamp
+            if last_timestamp is not None and timestamp - last_timestamp > self.max_dropout_time:
+                del self._filters[id]
+                self._n_consecutive_outliers.pop(id, None)
@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Dict, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from airo_typing import CameraIntrinsicsMatrixType, HomogeneousMatrixType
+
+if TYPE_CHECKING:
+    from airo_dataset_tools.data_parsers.camera_intrinsics import CameraIntrinsics
+
+
+def _read_only_array(array: Union[np.ndarray, Sequence[float]]) -> np.ndarray:
+    array = np.array(array, dtype=np.float64)
+    array.flags.writeable = False
+    return array
+
+
+@dataclass(frozen=True)
+class CameraCalibration:
+    """All calibration parameters of a (stereo) camera at a specific resolution.
+
+    Cameras cache this object, so that querying the intrinsics does not involve the camera SDK every time.
+    All arrays are read-only, as they are shared between all users of the calibration.
+
+    The reprojection functions accept this object wherever they take an intrinsics matrix.
+    """
+
+    resolution: Tuple[int, int]
+    """(width, height) of the images in pixels."""
+    intrinsics_matrix: CameraIntrinsicsMatrixType
+    distortion_coefficients: Optional[np.ndarray] = None
+    """OpenCV distortion coefficients (k1, k2, p1, p2[, k3,...]), None if the images are not distorted."""
+    right_intrinsics_matrix: Optional[CameraIntrinsicsMatrixType] = None
+    right_distortion_coefficients: Optional[np.ndarray] = None
+    pose_of_right_view_in_left_view: Optional[HomogeneousMatrixType] = None
+
+    _ARRAY_FIELDS = (
+        "intrinsics_matrix",
+        "distortion_coefficients",
+        "right_intrinsics_matrix",
+        "right_distortion_coefficients",
+        "pose_of_right_view_in_left_view",
+    )
+
+    def __post_init__(self) -> None:
+        # the dataclass is frozen, so use object.__setattr__ to store the read-only copies
+        for name in self._ARRAY_FIELDS:
+            value = getattr(self, name)
+            if value is not None:
+                object.__setattr__(self, name, _read_only_array(value))
+        object.__setattr__(self, "resolution", (int(self.resolution[0]), int(self.resolution[1])))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-serializable representation of the calibration, cf. `from_dict`."""
+        calibration_dict: Dict[str, Any] = {"resolution": list(self.resolution)}
+        for name in self._ARRAY_FIELDS:
+            value = getattr(self, name)
+            if value is not None:
+                calibration_dict[name] = value.tolist()
+        return calibration_dict
+
+    @classmethod
+    def from_dict(cls, calibration_dict: Dict[str, Any]) -> CameraCalibration:
+        return cls(**calibration_dict)
+
+    @classmethod
+    def from_camera_intrinsics(cls, camera_intrinsics: CameraIntrinsics) -> CameraCalibration:
+        """Create a calibration from the CameraIntrinsics format of airo-dataset-tools.
+
+        The radial (k1, k2[, k3,...]) and tangential (p1, p2) distortion coefficients are combined in the OpenCV order.
+        """
+        focal_lengths = camera_intrinsics.focal_lengths_in_pixels
+        principal_point = camera_intrinsics.principal_point_in_pixels
+        intrinsics_matrix = np.array(
+            [
+                [focal_lengths.fx, 0.0, principal_point.cx],
+                [0.0, focal_lengths.fy, principal_point.cy],
+                [0.0, 0.0, 1.0],
+            ]
+        )
+
+        distortion_coefficients = None
+        radial = list(camera_intrinsics.radial_distortion_coefficients or [])
+        tangential = list(camera_intrinsics.tangential_distortion_coefficients or [])
+        if radial or tangential:
+            radial += [0.0] * (2 - len(radial))
+            tangential += [0.0] * (2 - len(tangential))
+            distortion_coefficients = np.array(radial[:2] + tangential[:2] + radial[2:])
+
+        resolution = camera_intrinsics.image_resolution
+        return cls((resolution.width, resolution.height), intrinsics_matrix, distortion_coefficients)
+
+    def to_camera_intrinsics(self) -> CameraIntrinsics:
+        """Convert the (left view of the) calibration to the CameraIntrinsics format of airo-dataset-tools, cf. from_camera_intrinsics."""
+        from airo_dataset_tools.data_parsers.camera_intrinsics import (
+            CameraIntrinsics,
+            FocalLengths,
+            PrincipalPoint,
+            Resolution,
+        )
+
+        radial, tangential = None, None
+        if self.distortion_coefficients is not None:
+            coefficients = [float(coefficient) for coefficient in self.distortion_coefficients]
+            radial = coefficients[:2] + coefficients[4:]
+            tangential = coefficients[2:4]
+        return CameraIntrinsics(
+            image_resolution=Resolution(width=self.resolution[0], height=self.resolution[1]),
+            focal_lengths_in_pixels=FocalLengths(
+                fx=float(self.intrinsics_matrix[0, 0]), fy=float(self.intrinsics_matrix[1, 1])
+            ),
+            principal_point_in_pixels=PrincipalPoint(
+                cx=float(self.intrinsics_matrix[0, 2]), cy=float(self.intrinsics_matrix[1, 2])
+            ),
+            radial_distortion_coefficients=radial,
+            tangential_distortion_coefficients=tangential,
+        )
+
+    @property
+    def is_stereo(self) -> bool:
+        return self.right_intrinsics_matrix is not None
+
+    @property
+    def has_distortion(self) -> bool:
+        return self.distortion_coefficients is not None and bool(np.any(self.distortion_coefficients != 0))
+
+    def right_view(self) -> CameraCalibration:
+        """The calibration of the right view of a stereo camera, as a monocular calibration."""
+        if self.right_intrinsics_matrix is None:
+            raise ValueError("this is not a stereo calibration")
+        return CameraCalibration(self.resolution, self.right_intrinsics_matrix, self.right_distortion_coefficients)
+
+
+IntrinsicsType = Union[CameraIntrinsicsMatrixType, CameraCalibration]
+"""either a 3x3 intrinsics matrix or a CameraCalibration"""
+
+
+def get_intrinsics_matrix(intrinsics: IntrinsicsType) -> CameraIntrinsicsMatrixType:
+    """Get the intrinsics matrix from a CameraCalibration, or return the matrix itself."""
+    if isinstance(intrinsics, CameraCalibration):
+        return intrinsics.intrinsics_matrix
+    return intrinsics
@@ -0,0 +1,184 @@
+"""In-memory camera that implements the camera interfaces without any hardware.
+
+Useful for testing and benchmarking code that works with cameras (e.g. the acquisition thread) without a camera attached.
+"""
+from __future__ import annotations
+
+import math
+import time
+from typing import Any, Optional, Tuple
+
+import numpy as np
+from airo_camera_toolkit.camera_calibration import CameraCalibration
+from airo_camera_toolkit.interfaces import StereoRGBDCamera
+from airo_camera_toolkit.utils import ImageConverter
+from airo_typing import (
+    CameraIntrinsicsMatrixType,
+    HomogeneousMatrixType,
+    NumpyDepthMapType,
+    NumpyFloatImageType,
+    NumpyIntImageType,
+)
+
+
+class FakeStereoRGBDCamera(StereoRGBDCamera):
+    """Camera that generates synthetic frames at a fixed frame rate.
+
+    The camera runs a free-running frame clock, as real cameras do: frames are 'exposed' at fixed intervals, whether they are grabbed or not.
+    Each grab blocks until the next frame is available (`latency` seconds after its exposure) and then renders a new frame into reusable memory buffers,
+    similar to the buffers of the camera SDKs. RGB images are copied out of these buffers on retrieval, the depth map is returned
+    as a view on the buffer and is hence only valid until the next grab.
+
+    The frame index is written in the top-left pixel of both RGB images (modulo 256) so that frames can be identified.
+    The depth map is a fronto-parallel plane at the specified distance.
+    The exposure time of the frame is available as its (hardware) timestamp, which makes this camera suitable to simulate multi-camera rigs.
+    """
+
+    def __init__(
+        self,
+        resolution: Tuple[int, int] = (640, 480),
+        fps: float = 30.0,
+        depth: float = 1.0,
+        intrinsics_matrix: Optional[CameraIntrinsicsMatrixType] = None,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        phase: float = 0.0,
+        seed: Optional[int] = None,
+    ) -> None:
+        """
+        Args:
+            resolution: (width, height) of the images.
+            fps: frame rate at which the camera provides frames, set to 0 to return frames without any delay.
+            depth: distance of the plane that is observed by the camera, in meters.
+            intrinsics_matrix: defaults to a camera with a horizontal field of view of about 53 degrees and the principal point in the image center.
+            latency: time between the exposure of a frame and the moment it is available, in seconds.
+            jitter: standard deviation of the (gaussian) deviation of the exposure times from the frame clock, in seconds.
+            phase: offset of the frame clock in seconds. Cameras with the same fps and phase are 'hardware-synchronized',
+                use different phases to simulate cameras that are not.
+            seed: seed for the random generator of the jitter.
+        """
+        self.width, self.height = resolution
+        self.fps = fps
+        self.depth = depth
+        self.latency = latency
+        self.jitter = jitter
+        self._rng = np.random.default_rng(seed)
+        if intrinsics_matrix is None:
+            intrinsics_matrix = np.array(
+                [[self.width, 0.0, self.width / 2], [0.0, self.width, self.height / 2], [0.0, 0.0, 1.0]]
+            )
+        pose_of_right_view_in_left_view = np.eye(4)
+        pose_of_right_view_in_left_view[0, 3] = 0.12
+        self._calibration = CameraCalibration(
+            resolution=resolution,
+            intrinsics_matrix=intrinsics_matrix,
+            right_intrinsics_matrix=intrinsics_matrix,
+            pose_of_right_view_in_left_view=pose_of_right_view_in_left_view,
+        )
+
+        self.frame_index = -1
+        # all fake cameras share the same clock (the epoch), so that cameras with the same fps and phase are synchronized
+        self._clock_start = phase
+        self._clock_tick = -1  # number of frame periods since the start of the clock of the last grabbed frame
+        self._timestamp = 0.0
+
+        # gradient images, so that the images have some structure
+        u = np.linspace(0, 255, self.width, dtype=np.float32)[np.newaxis, :]
+        v = np.linspace(0, 255, self.height, dtype=np.float32)[:, np.newaxis]
+        base_image = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+        base_image[..., 0] = u
+        base_image[..., 1] = v
+        base_image[..., 2] = 128
+        self._base_image = base_image
+
+        # memory buffers that are overwritten on each grab
+        self._left_image = base_image.copy()
+        self._right_image = base_image.copy()
+        self._depth_map = np.full((self.height, self.width), depth, dtype=np.float32)
+
+    def intrinsics_matrix(self, view: str = StereoRGBDCamera.LEFT_RGB) -> CameraIntrinsicsMatrixType:
+        if view not in self._VIEWS:
+            raise ValueError(f"view must be one of {self._VIEWS}")
+        return self._calibration.intrinsics_matrix
+
+    @property
+    def calibration(self) -> CameraCalibration:
+        return self._calibration
+
+    @property
+    def pose_of_right_view_in_left_view(self) -> HomogeneousMatrixType:
+        assert self._calibration.pose_of_right_view_in_left_view is not None
+        return self._calibration.pose_of_right_view_in_left_view
+
+    def _grab_images(self) -> None:
+        if self.fps > 0:
+            # wait for the next frame that becomes available, older frames that were not grabbed are lost (as for real cameras)
+            period = 1 / self.fps
+            next_tick = math.ceil((time.time() - self.latency - self._clock_start) / period)
+            self._clock_tick = max(next_tick, self._clock_tick + 1)
+            exposure_time = self._clock_start + self._clock_tick * period
+        else:
+            exposure_time = time.time()
+        if self.jitter > 0:
+            exposure_time += self._rng.normal(0.0, self.jitter)
+        time.sleep(max(0.0, exposure_time + self.latency - time.time()))
+        self._timestamp = exposure_time
+
+        self.frame_index += 1
+        self._left_image[0, 0, :] = self.frame_index % 256
+        self._right_image[0, 0, :] = self.frame_index % 256
+
+    def _retrieve_timestamp(self) -> float:
+        return self._timestamp
+
+    def _retrieve_rgb_image(self, view: str = StereoRGBDCamera.LEFT_RGB) -> NumpyFloatImageType:
+        image = self._retrieve_rgb_image_as_int(view)
+        return ImageConverter.from_numpy_int_format(image).image_in_numpy_format
+
+    def _retrieve_rgb_image_as_int(
+        self, view: str = StereoRGBDCamera.LEFT_RGB, *, out: Optional[NumpyIntImageType] = None
+    ) -> NumpyIntImageType:
+        assert view in StereoRGBDCamera._VIEWS
+        image = self._right_image if view == StereoRGBDCamera.RIGHT_RGB else self._left_image
+        if out is None:
+            return image.copy()
+        np.copyto(out, image)
+        return out
+
+    def _retrieve_depth_map(self) -> NumpyDepthMapType:
+        return self._depth_map
+
+    def _retrieve_depth_image(self) -> NumpyIntImageType:
+        # closer is brighter, 255 at 0m and 0 at 10m
+        depth_image = np.clip(255 - self._depth_map * 25.5, 0, 255).astype(np.uint8)
+        return np.repeat(depth_image[..., np.newaxis], 3, axis=2)
+
+    def __enter__(self) -> FakeStereoRGBDCamera:
+        return self
+
+    def __exit__(self, exc_type: Any, exc_value: Any, traceback: Any) -> None:
+        self.stop_acquisition_thread()
+
+
+if __name__ == "__main__":
+    """compares the latency of get_rgb_image() with and without the acquisition thread,
+    while 'processing' each frame for half a frame period."""
+
+    fps = 15
+    n_frames = 30
+
+    def measure_latency(camera: FakeStereoRGBDCamera) -> float:
+        latencies = []
+        for _ in range(n_frames):
+            start = time.time()
+            camera.get_rgb_image_as_int()
+            latencies.append(time.time() - start)
+            time.sleep(0.5 / fps)
+        return float(np.mean(latencies))
+
+    with FakeStereoRGBDCamera(resolution=(2208, 1242), fps=fps) as camera:
+        print(f"blocking grab: mean latency = {measure_latency(camera) * 1000:.1f} ms")
+        camera.start_acquisition_thread()
+        camera.get_rgb_image_as_int()  # wait for the first frame
+        print(f"acquisition thread: mean latency = {measure_latency(camera) * 1000:.1f} ms")
+        print(f"dropped frames: {camera.dropped_frames}")
@@ -2,14 +2,16 @@ from __future__ import annotations
 
 from typing import Any, Optional, Tuple
 
+import cv2
 import numpy as np
 
 try:
     import pyrealsense2 as rs  # type: ignore
 except ImportError:
     print("install the Realsense SDK and pyrealsense2 first")
+from airo_camera_toolkit.camera_calibration import CameraCalibration
 from airo_camera_toolkit.interfaces import RGBCamera
-from airo_camera_toolkit.utils import ImageConverter
+from airo_camera_toolkit.utils import ImageConverter, check_out_buffer
 from airo_typing import CameraIntrinsicsMatrixType, NumpyFloatImageType, NumpyIntImageType, OpenCVIntImageType
 
 
@@ -64,6 +66,12 @@ class Realsense(RGBCamera):
             self._intrinsics_matrix[0, 2] = intrinsics.ppx
             self._intrinsics_matrix[1, 2] = intrinsics.ppy
             self._intrinsics_matrix[2, 2] = 1
+            # the color stream of the D4xx cameras uses the (inverse) Brown-Conrady model, the coefficients are in the OpenCV order.
+            self._calibration = CameraCalibration(
+                resolution=(self.width, self.height),
+                intrinsics_matrix=self._intrinsics_matrix,
+                distortion_coefficients=np.array(intrinsics.coeffs),
+            )
 
             config.enable_stream(
                 profile.stream_type(),
@@ -84,29 +92,39 @@ class Realsense(RGBCamera):
         return self
 
     def __exit__(self, exc_type: Any, exc_value: Any, traceback: Any) -> None:
+        self.stop_acquisition_thread()
         self.pipeline.stop()
 
     def intrinsics_matrix(self) -> CameraIntrinsicsMatrixType:
-        return self._intrinsics_matrix
+        return self._calibration.intrinsics_matrix
+
+    @property
+    def calibration(self) -> CameraCalibration:
+        return self._calibration
 
     def _grab_images(self) -> None:
         self._frames = self.pipeline.wait_for_frames()
 
+    def _retrieve_timestamp(self) -> float:
+        # capture time in ms, in the host time domain if global time is enabled (the default)
+        assert isinstance(self._frames, rs.composite_frame)
+        return self._frames.get_timestamp() / 1000
+
     def _retrieve_rgb_image(self) -> NumpyFloatImageType:
         image = self._retrieve_rgb_image_as_int()
         return ImageConverter.from_numpy_int_format(image).image_in_numpy_format
 
-    def _retrieve_rgb_image_as_int(self) -> NumpyIntImageType:
+    def _retrieve_rgb_image_as_int(self, *, out: Optional[NumpyIntImageType] = None) -> NumpyIntImageType:
         assert isinstance(self._frames, rs.composite_frame)
         color_frame = self._frames.get_color_frame()
         image: OpenCVIntImageType = np.asanyarray(color_frame.get_data())
-        image = image[..., ::-1]  # convert from BGR to RGB
-        return image
+        # convert from BGR to RGB in a contiguous array instead of a view with negative strides on the frame memory
+        if out is not None:
+            check_out_buffer(out, image.shape)
+        return cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=out)
 
 
 if __name__ == "__main__":
-    import cv2
-
     camera = Realsense(fps=15)
     print("Camera Intrinsics: \n", camera.intrinsics_matrix())
 
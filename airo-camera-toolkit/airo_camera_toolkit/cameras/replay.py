@@ -0,0 +1,135 @@
+"""Camera that replays a recording of the CameraRecorder, see recording.py for the format.
+
+This allows to run and benchmark code that uses cameras offline, e.g. in CI where no camera (or camera SDK) is available.
+"""
+from __future__ import annotations
+
+import time
+from typing import Any, Callable, Dict, Optional, Sequence
+
+import numpy as np
+from airo_camera_toolkit.camera_calibration import CameraCalibration
+from airo_camera_toolkit.interfaces import RGBDCamera
+from airo_camera_toolkit.recording import FrameStore
+from airo_camera_toolkit.utils import ImageConverter
+from airo_typing import CameraIntrinsicsMatrixType, NumpyDepthMapType, NumpyFloatImageType, NumpyIntImageType
+
+
+class ReplayCamera(RGBDCamera):
+    """Serves the frames of a recording through the camera interfaces.
+
+    The modalities are returned as read-only views on the memory-mapped recording (zero-copy),
+    unlike for real cameras they remain valid after the next grab as the recording is never overwritten.
+    Modalities that were not recorded raise a ValueError.
+    """
+
+    def __init__(self, path: str, realtime: bool = True, loop: bool = False) -> None:
+        """
+        Args:
+            path: directory of the recording.
+            realtime: replay the frames at the speed at which they were recorded (based on their timestamps),
+                otherwise each grab returns the next frame immediately.
+            loop: restart at the first frame after the last frame, otherwise grabbing after the last frame raises an IndexError.
+        """
+        self._store = FrameStore(path)
+        if len(self._store) == 0:
+            raise ValueError(f"the recording in {path} does not contain any frames")
+        calibration = self._store.calibration
+        # recordings with frames always have a calibration
+        assert calibration is not None
+        self._calibration = calibration
+        self.realtime = realtime
+        self.loop = loop
+        self.frame_index = -1
+        # time.time() - timestamp of the recording, for replaying in realtime
+        self._clock_offset: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._store)
+
+    @property
+    def recorded_modalities(self) -> Sequence[str]:
+        return self._store.modalities
+
+    def intrinsics_matrix(self) -> CameraIntrinsicsMatrixType:
+        return self._calibration.intrinsics_matrix
+
+    @property
+    def calibration(self) -> CameraCalibration:
+        return self._calibration
+
+    def _grab_images(self) -> None:
+        next_index = self.frame_index + 1
+        if next_index == len(self._store):
+            if not self.loop:
+                raise IndexError("Could not grab new camera frame, reached the end of the recording")
+            next_index = 0
+            self._clock_offset = None
+
+        if self.realtime:
+            timestamp = self._store.timestamps[next_index]
+            if self._clock_offset is None:
+                self._clock_offset = time.time() - timestamp
+            time.sleep(max(0.0, timestamp + self._clock_offset - time.time()))
+        self.frame_index = next_index
+
+    def _retrieve_timestamp(self) -> float:
+        return float(self._store.timestamps[self.frame_index])
+
+    def _retrieve_rgb_image(self) -> NumpyFloatImageType:
+        return ImageConverter.from_numpy_int_format(self._retrieve_rgb_image_as_int()).image_in_numpy_format
+
+    def _retrieve_rgb_image_as_int(self, *, out: Optional[NumpyIntImageType] = None) -> NumpyIntImageType:
+        image = self._store.get("rgb", self.frame_index)
+        if out is None:
+            return image
+        np.copyto(out, image)
+        return out
+
+    def _retrieve_depth_map(self) -> NumpyDepthMapType:
+        return self._store.get("depth_map", self.frame_index)
+
+    def _retrieve_depth_image(self) -> NumpyIntImageType:
+        return self._store.get("depth_image", self.frame_index)
+
+    def _acquisition_retrievers(self) -> Dict[str, Callable[[], np.ndarray]]:
+        retrievers = super()._acquisition_retrievers()
+        return {
+            modality: retriever for modality, retriever in retrievers.items() if modality in self._store.modalities
+        }
+
+    def _snapshot_retrievers(self) -> Dict[str, Callable[[], np.ndarray]]:
+        retrievers = super()._snapshot_retrievers()
+        if not {"rgb", "depth_map"}.issubset(self._store.modalities):
+            retrievers.pop("colored_point_cloud")
+        return retrievers
+
+    def __enter__(self) -> ReplayCamera:
+        return self
+
+    def __exit__(self, exc_type: Any, exc_value: Any, traceback: Any) -> None:
+        self.stop_acquisition_thread()
+
+
+if __name__ == "__main__":
+    """replays a recording in realtime and shows the RGB images and depth images."""
+    import sys
+
+    import cv2
+
+    if len(sys.argv) != 2:
+        print("usage: python replay.py <recording directory>")
+        sys.exit(1)
+
+    with ReplayCamera(sys.argv[1]) as camera:
+        print(f"{len(camera)} frames, intrinsics = \n{camera.intrinsics_matrix()}")
+        for _ in range(len(camera)):
+            snapshot = camera.capture()
+            cv2.imshow(
+                "RGB image", ImageConverter.from_numpy_int_format(snapshot.rgb_image_as_int).image_in_opencv_format
+            )
+            if "depth_map" in camera.recorded_modalities:
+                depth_map = snapshot.depth_map
+                cv2.imshow("depth map", depth_map / max(float(np.nanmax(depth_map)), 1e-6))
+            if cv2.waitKey(1) == ord("q"):
+                break
@@ -0,0 +1,394 @@
+"""Sharing the frames of a camera between processes through shared memory.
+
+Only a single process can open a camera. The SharedMemoryCameraPublisher wraps that camera and writes its frames into a ring of slots
+in a `multiprocessing.shared_memory` block, from which any number of processes can read with a SharedMemoryCamera.
+This is a lot faster than sending the frames over a multiprocessing.Queue, which pickles and copies every frame for every reader.
+
+Memory layout of the shared memory block:
+- a control block with 3 int64s: the sequence number of the latest published frame (-1 before the first frame),
+  a flag that is set when the publisher is closed and the length of the metadata.
+- the metadata: utf-8 encoded JSON with the calibration, the number of slots, the size of a slot
+  and the shape, dtype and offset of each modality within a slot.
+- the slots, each consisting of an int64 sequence number, a float64 timestamp and the modalities.
+
+Reader protocol (lock-free): the publisher writes frame i into slot i % n_slots. It first sets the sequence number of the slot to -1,
+then writes the frame, then sets the sequence number of the slot to i and finally sets the latest sequence number to i.
+A reader reads the latest sequence number i and uses slot i % n_slots if the sequence number of that slot equals i.
+Data that was read from the slot is valid if the sequence number of the slot still equals i afterwards.
+A slot is only overwritten n_slots frames after it was published, which is the time readers have to process a frame without copying it.
+"""
+from __future__ import annotations
+
+import functools
+import json
+import threading
+import time
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set
+
+import numpy as np
+from airo_camera_toolkit.camera_calibration import CameraCalibration
+from airo_camera_toolkit.interfaces import Camera, RGBDCamera
+from airo_camera_toolkit.utils import ImageConverter
+from airo_typing import (
+    CameraIntrinsicsMatrixType,
+    ColoredPointCloudType,
+    NumpyDepthMapType,
+    NumpyFloatImageType,
+    NumpyIntImageType,
+)
+
+_CONTROL_BLOCK_SIZE = 64  # bytes, padded to a cache line
+_SLOT_HEADER_SIZE = 16  # bytes, sequence number and timestamp
+_ALIGNMENT = 64
+
+# names of the blocks that were created by publishers in this process, cf. _attach_shared_memory
+_published_names: Set[str] = set()
+
+
+def _align(offset: int) -> int:
+    return (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+def _attach_shared_memory(name: str) -> SharedMemory:
+    shared_memory = SharedMemory(name)
+    # before python 3.13, attaching registers the block with the resource tracker of this process,
+    # which would unlink it when this process exits, while the block is owned by the publisher. cf. https://bugs.python.org/issue39959
+    if name not in _published_names:
+        resource_tracker.unregister(shared_memory._name, "shared_memory")  # type: ignore[attr-defined]
+    return shared_memory
+
+
+class _Slot:
+    """Views on a slot of the shared memory block."""
+
+    def __init__(
+        self, buffer: memoryview, offset: int, layout: Dict[str, Dict[str, Any]], writeable: bool = True
+    ) -> None:
+        self.sequence_number: np.ndarray = np.ndarray((1,), dtype=np.int64, buffer=buffer, offset=offset)
+        self.timestamp: np.ndarray = np.ndarray((1,), dtype=np.float64, buffer=buffer, offset=offset + 8)
+        self.data: Dict[str, np.ndarray] = {}
+        for modality, description in layout.items():
+            array: np.ndarray = np.ndarray(
+                tuple(description["shape"]), np.dtype(description["dtype"]), buffer, offset + description["offset"]
+            )
+            array.flags.writeable = writeable
+            self.data[modality] = array
+
+
+def _map_slots(buffer: memoryview, metadata: Dict[str, Any], slots_offset: int, writeable: bool = True) -> List[_Slot]:
+    return [
+        _Slot(buffer, slots_offset + index * metadata["slot_size"], metadata["modalities"], writeable)
+        for index in range(metadata["n_slots"])
+    ]
+
+
+class SharedMemoryCameraPublisher:
+    """Publishes the frames of a camera in a shared memory block, to be read by SharedMemoryCameras in other processes.
+
+    Use `start()` to publish frames in a background thread, or `run()` to publish in the calling thread
+    (e.g. in a dedicated publisher process).
+    """
+
+    def __init__(
+        self, camera: Camera, name: str, n_slots: int = 4, modalities: Optional[Sequence[str]] = None
+    ) -> None:
+        """
+        Args:
+            camera: the camera to publish.
+            name: name of the shared memory block, which the readers use to find it.
+            n_slots: number of frames in the ring of slots. Readers can process a frame without copying it
+                for (n_slots - 1) frame periods.
+            modalities: names of the modalities to publish, defaults to all modalities of the camera.
+        """
+        if n_slots < 2:
+            raise ValueError("the publisher needs at least 2 slots")
+        self.camera = camera
+        self.name = name
+        self.modalities = tuple(modalities) if modalities is not None else tuple(camera.available_modalities)
+
+        # grab a first frame to determine the layout of the slots
+        snapshot = camera.capture()
+        data = {modality: snapshot[modality] for modality in self.modalities}
+        layout = {}
+        offset = _SLOT_HEADER_SIZE
+        for modality, array in data.items():
+            offset = _align(offset)
+            layout[modality] = {"shape": list(array.shape), "dtype": array.dtype.str, "offset": offset}
+            offset += array.nbytes
+
+        try:
+            calibration = camera.calibration
+        except NotImplementedError:
+            height, width = next(array for array in data.values() if array.ndim >= 2).shape[:2]
+            calibration = CameraCalibration((width, height), camera.intrinsics_matrix())
+        slot_size = _align(offset)
+        metadata = {
+            "calibration": calibration.to_dict(),
+            "n_slots": n_slots,
+            "slot_size": slot_size,
+            "modalities": layout,
+        }
+        encoded_metadata = json.dumps(metadata).encode("utf-8")
+        slots_offset = _align(_CONTROL_BLOCK_SIZE + len(encoded_metadata))
+
+        self._shared_memory = SharedMemory(name, create=True, size=slots_offset + n_slots * slot_size)
+        _published_names.add(name)
+        buffer = self._shared_memory.buf
+        assert buffer is not None
+        self._control: np.ndarray = np.ndarray((3,), dtype=np.int64, buffer=buffer)
+        self._control[:] = (-1, 0, len(encoded_metadata))
+        buffer[_CONTROL_BLOCK_SIZE : _CONTROL_BLOCK_SIZE + len(encoded_metadata)] = encoded_metadata
+        self._slots = _map_slots(buffer, metadata, slots_offset)
+
+        self._sequence_number = -1
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._write(data, snapshot.timestamp)
+
+    @property
+    def published_frames(self) -> int:
+        return self._sequence_number + 1
+
+    def publish_frame(self) -> None:
+        """Grab a frame from the camera and publish it."""
+        snapshot = self.camera.capture()
+        self._write({modality: snapshot[modality] for modality in self.modalities}, snapshot.timestamp)
+
+    def _write(self, data: Dict[str, np.ndarray], timestamp: float) -> None:
+        sequence_number = self._sequence_number + 1
+        slot = self._slots[sequence_number % len(self._slots)]
+        # mark the slot as being written, so that readers of the previous frame in this slot can detect it was overwritten
+        slot.sequence_number[0] = -1
+        slot.timestamp[0] = timestamp
+        for modality, array in data.items():
+            np.copyto(slot.data[modality], array)
+        slot.sequence_number[0] = sequence_number
+        self._control[0] = sequence_number
+        self._sequence_number = sequence_number
+
+    def run(self) -> None:
+        """Publish frames until `stop()` is called (from another thread)."""
+        while not self._stop_event.is_set():
+            self.publish_frame()
+
+    def start(self) -> None:
+        """Publish frames in a background thread."""
+        if self._thread is not None:
+            raise RuntimeError("the publisher is already running")
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self.run, name="shared-memory-camera-publisher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def close(self) -> None:
+        """Stop publishing, notify the readers and remove the shared memory block."""
+        self.stop()
+        self._control[1] = 1
+        # the views on the shared memory have to be released before it can be closed
+        del self._control
+        self._slots = []
+        self._shared_memory.close()
+        self._shared_memory.unlink()
+        _published_names.discard(self.name)
+
+    def __enter__(self) -> SharedMemoryCameraPublisher:
+        return self
+
+    def __exit__(self, exc_type: Any, exc_value: Any, traceback: Any) -> None:
+        self.close()
+
+
+class SharedMemoryCamera(RGBDCamera):
+    """Reads the frames of a SharedMemoryCameraPublisher, which can run in another process.
+
+    Each grab waits for a frame that is newer than the previous one. By default the modalities are returned
+    as read-only views on the shared memory (zero-copy). These are valid until the publisher overwrites the slot,
+    i.e. for (n_slots - 1) frame periods: use `is_frame_valid()` after processing a frame to check that it was not overwritten
+    in the meantime, or set `zero_copy` to False to get copies. Copies (including the `out` buffers) are checked when they are made,
+    a RuntimeError is raised if the frame was overwritten while copying it.
+
+    Snapshots (`capture()`), the acquisition thread and thus recorders and rigs keep the frames after the publisher moves on,
+    so they always get checked copies, regardless of `zero_copy`.
+    """
+
+    def __init__(self, name: str, zero_copy: bool = True, timeout: float = 1.0, poll_interval: float = 0.0005) -> None:
+        """
+        Args:
+            name: name of the shared memory block of the publisher.
+            zero_copy: return views on the shared memory instead of copies.
+            timeout: maximal time to wait for a new frame in a grab, in seconds.
+            poll_interval: time between checks for a new frame, in seconds.
+        """
+        self.name = name
+        self.zero_copy = zero_copy
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+
+        self._shared_memory = _attach_shared_memory(name)
+        buffer = self._shared_memory.buf
+        assert buffer is not None
+        self._control: np.ndarray = np.ndarray((3,), dtype=np.int64, buffer=buffer)
+        metadata_length = int(self._control[2])
+        metadata = json.loads(bytes(buffer[_CONTROL_BLOCK_SIZE : _CONTROL_BLOCK_SIZE + metadata_length]))
+        self._calibration = CameraCalibration.from_dict(metadata["calibration"])
+        self._slots = _map_slots(buffer, metadata, _align(_CONTROL_BLOCK_SIZE + metadata_length), writeable=False)
+        self.published_modalities: Sequence[str] = tuple(metadata["modalities"].keys())
+
+        self._sequence_number = -1
+        self._slot: Optional[_Slot] = None
+
+    def intrinsics_matrix(self) -> CameraIntrinsicsMatrixType:
+        return self._calibration.intrinsics_matrix
+
+    @property
+    def calibration(self) -> CameraCalibration:
+        return self._calibration
+
+    def _grab_images(self) -> None:
+        deadline = time.time() + self.timeout
+        while True:
+            if self._control[1]:
+                raise IndexError("Could not grab new camera frame, the publisher was closed")
+            latest_sequence_number = int(self._control[0])
+            if latest_sequence_number > self._sequence_number:
+                slot = self._slots[latest_sequence_number % len(self._slots)]
+                if int(slot.sequence_number[0]) == latest_sequence_number:
+                    self._slot = slot
+                    self._sequence_number = latest_sequence_number
+                    return
+                # the publisher is already overwriting the slot, read the latest sequence number again
+                continue
+            if time.time() > deadline:
+                raise TimeoutError(f"no new frame was published in {self.timeout} seconds")
+            time.sleep(self.poll_interval)
+
+    def is_frame_valid(self) -> bool:
+        """Whether the current frame has not been overwritten by the publisher yet."""
+        return self._slot is not None and int(self._slot.sequence_number[0]) == self._sequence_number
+
+    def _check_frame_is_valid(self) -> None:
+        if not self.is_frame_valid():
+            raise RuntimeError(
+                "the frame was overwritten by the publisher, read the frames faster or increase the number of slots"
+            )
+
+    def _get(self, modality: str, copy: bool) -> np.ndarray:
+        if modality not in self.published_modalities:
+            raise ValueError(
+                f"modality {modality} is not published, the published modalities are {self.published_modalities}"
+            )
+        assert self._slot is not None
+        array = self._slot.data[modality]
+        if copy:
+            array = array.copy()
+        self._check_frame_is_valid()
+        return array
+
+    def _retrieve_timestamp(self) -> float:
+        assert self._slot is not None
+        return float(self._slot.timestamp[0])
+
+    def _retrieve_rgb_image(self) -> NumpyFloatImageType:
+        image = ImageConverter.from_numpy_int_format(self._get("rgb", copy=False)).image_in_numpy_format
+        self._check_frame_is_valid()
+        return image
+
+    def _retrieve_rgb_image_as_int(self, *, out: Optional[NumpyIntImageType] = None) -> NumpyIntImageType:
+        if out is None:
+            return self._get("rgb", copy=not self.zero_copy)
+        np.copyto(out, self._get("rgb", copy=False))
+        self._check_frame_is_valid()
+        return out
+
+    def _retrieve_depth_map(self) -> NumpyDepthMapType:
+        return self._get("depth_map", copy=not self.zero_copy)
+
+    def _retrieve_depth_image(self) -> NumpyIntImageType:
+        return self._get("depth_image", copy=not self.zero_copy)
+
+    def _retrieve_colored_point_cloud(self) -> ColoredPointCloudType:
+        point_cloud = super()._retrieve_colored_point_cloud()
+        # the point cloud is computed from views on the shared memory
+        self._check_frame_is_valid()
+        return point_cloud
+
+    def _acquisition_retrievers(self) -> Dict[str, Callable[[], np.ndarray]]:
+        # the retrieved modalities are kept after the publisher moved on, so they are copied (and checked) here.
+        # Copying a zero-copy view later on, as FrameSnapshot does, would not detect that the frame was overwritten meanwhile.
+        retrievers = super()._acquisition_retrievers()
+        return {
+            modality: functools.partial(self._get, modality, True)
+            for modality in retrievers.keys()
+            if modality in self.published_modalities
+        }
+
+    def _snapshot_retrievers(self) -> Dict[str, Callable[[], np.ndarray]]:
+        retrievers = super()._snapshot_retrievers()
+        if not {"rgb", "depth_map"}.issubset(self.published_modalities):
+            retrievers.pop("colored_point_cloud")
+        return retrievers
+
+    def close(self) -> None:
+        self.stop_acquisition_thread()
+        self._slot = None
+        self._slots = []
+        del self._control
+        try:
+            self._shared_memory.close()
+        except BufferError:
+            # views on the shared memory are still in use, the memory is unmapped when they are garbage collected
+            pass
+
+    def __enter__(self) -> SharedMemoryCamera:
+        return self
+
+    def __exit__(self, exc_type: Any, exc_value: Any, traceback: Any) -> None:
+        self.close()
+
+
+if __name__ == "__main__":
+    """publishes a fake 2K camera in a separate process and compares copying its frames out of shared memory (through a snapshot)
+    with the cost of pickling them, which is what sending them over a multiprocessing.Queue does (for each reader).
+    Reading the frames with the get_* methods does not even copy them."""
+    import multiprocessing
+    import pickle
+
+    from airo_camera_toolkit.cameras.fake import FakeStereoRGBDCamera
+
+    def publish(name: str, ready_event: Any, stop_event: Any) -> None:
+        with FakeStereoRGBDCamera(resolution=(2208, 1242), fps=15) as camera:
+            with SharedMemoryCameraPublisher(camera, name, modalities=["rgb", "depth_map"]) as publisher:
+                publisher.start()
+                ready_event.set()
+                stop_event.wait()
+
+    name = f"airo-camera-demo-{int(time.time())}"
+    ready_event, stop_event = multiprocessing.Event(), multiprocessing.Event()
+    process = multiprocessing.Process(target=publish, args=(name, ready_event, stop_event))
+    process.start()
+    ready_event.wait()
+
+    n_frames = 30
+    shared_memory_durations, pickle_durations = [], []
+    with SharedMemoryCamera(name) as camera:
+        for _ in range(n_frames):
+            snapshot = camera.capture()
+            start = time.time()
+            rgb, depth_map = snapshot.rgb_image_as_int, snapshot.depth_map
+            shared_memory_durations.append(time.time() - start)
+
+            start = time.time()
+            pickle.loads(pickle.dumps((rgb, depth_map), protocol=pickle.HIGHEST_PROTOCOL))
+            pickle_durations.append(time.time() - start)
+
+    stop_event.set()
+    process.join()
+    print(f"shared memory (copy): {np.mean(shared_memory_durations) * 1000:.3f} ms per frame")
+    print(f"pickling (lower bound for a Queue): {np.mean(pickle_durations) * 1000:.3f} ms per frame")
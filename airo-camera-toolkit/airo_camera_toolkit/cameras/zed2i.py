@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from typing import Any, List, Optional
+from typing import Any, Callable, Dict, List, Optional
 
 try:
     import pyzed.sl as sl
@@ -9,10 +9,12 @@ except ImportError:
         "You should install the ZED SDK and pip install the python bindings in your environment first, see the installation README."
     )
 
+import cv2
 import numpy as np
+from airo_camera_toolkit.camera_calibration import CameraCalibration
 from airo_camera_toolkit.cameras.test_hw import manual_test_stereo_rgbd_camera
 from airo_camera_toolkit.interfaces import StereoRGBDCamera
-from airo_camera_toolkit.utils import ImageConverter
+from airo_camera_toolkit.utils import ImageConverter, check_out_buffer
 from airo_typing import (
     CameraIntrinsicsMatrixType,
     ColoredPointCloudType,
@@ -66,9 +68,9 @@ class Zed2i(StereoRGBDCamera):
         serial_number: Optional[int] = None,
         svo_filepath: Optional[str] = None,
     ) -> None:
-        self.resolution = resolution
+        self._resolution = resolution
         self.fps = fps
-        self.depth_mode = depth_mode
+        self._depth_mode = depth_mode
         self.serial_number = serial_number
 
         self.camera = sl.Camera()
@@ -93,13 +95,7 @@ class Zed2i(StereoRGBDCamera):
         self.camera_params.depth_minimum_distance = 0.3
         self.camera_params.depth_maximum_distance = 10.0  # filter out far away objects
 
-        if self.camera.is_opened():
-            # close to open with correct params
-            self.camera.close()
-
-        status = self.camera.open(self.camera_params)
-        if status != sl.ERROR_CODE.SUCCESS:
-            raise IndexError(f"could not open camera, error = {status}")
+        self._open()
 
         # TODO: create a configuration class for the runtime parameters
         self.runtime_params = sl.RuntimeParameters()
@@ -120,38 +116,105 @@ class Zed2i(StereoRGBDCamera):
         self.depth_matrix = sl.Mat()
         self.pointcloud_matrix = sl.Mat()
 
-    def intrinsics_matrix(self, view: str = StereoRGBDCamera.LEFT_RGB) -> CameraIntrinsicsMatrixType:
+        # the calibration is read once from the SDK and cached, as querying it is slow.
+        self._calibration = self._read_calibration()
+
+    def _open(self) -> None:
+        if self.camera.is_opened():
+            # close to open with correct params
+            self.camera.close()
+
+        status = self.camera.open(self.camera_params)
+        if status != sl.ERROR_CODE.SUCCESS:
+            raise IndexError(f"could not open camera, error = {status}")
+
+    def _check_can_reopen(self) -> None:
+        # the acquisition thread grabs from the camera and its buffer holds frames of the old settings
+        if self.is_acquisition_thread_running:
+            raise RuntimeError("stop the acquisition thread before changing the camera settings")
+
+    @property
+    def resolution(self) -> sl.RESOLUTION:  # type: ignore[no-any-unimported]
+        """Setting the resolution reopens the camera and reads the calibration of the new resolution.
 
-        # get the 'rectified' intrinsics matrices.
-        # https://www.stereolabs.com/docs/api/python/classpyzed_1_1sl_1_1CameraParameters.html
+        The acquisition thread must be stopped first.
+        """
+        return self._resolution
+
+    @resolution.setter
+    def resolution(self, resolution: sl.RESOLUTION) -> None:  # type: ignore[no-any-unimported]
+        self._check_can_reopen()
+        self._resolution = resolution
+        self.camera_params.camera_resolution = resolution
+        self._open()
+        self.refresh_calibration()
+
+    @property
+    def depth_mode(self) -> sl.DEPTH_MODE:  # type: ignore[no-any-unimported]
+        """Setting the depth mode reopens the camera, after which the SDK can report a different rectified calibration.
+
+        The acquisition thread must be stopped first.
+        """
+        return self._depth_mode
+
+    @depth_mode.setter
+    def depth_mode(self, depth_mode: sl.DEPTH_MODE) -> None:  # type: ignore[no-any-unimported]
+        self._check_can_reopen()
+        self._depth_mode = depth_mode
+        self.camera_params.depth_mode = depth_mode
+        self._open()
+        self.refresh_calibration()
+
+    @property
+    def calibration(self) -> CameraCalibration:
+        return self._calibration
+
+    def refresh_calibration(self) -> None:
+        """Read the calibration from the SDK again, this is done automatically when the resolution or depth mode changes."""
+        self._calibration = self._read_calibration()
+
+    def _read_calibration(self) -> CameraCalibration:
+        # get the 'rectified' calibration parameters, the images are undistorted so the distortion coefficients are all zero.
+        # https://www.stereolabs.com/docs/api/python/classpyzed_1_1sl_1_1CalibrationParameters.html
+        calibration_parameters = self.camera.get_camera_information().camera_configuration.calibration_parameters
+
+        def intrinsics_matrix(camera_parameters: sl.CameraParameters) -> CameraIntrinsicsMatrixType:  # type: ignore[no-any-unimported]
+            # https://www.stereolabs.com/docs/api/python/classpyzed_1_1sl_1_1CameraParameters.html
+            cam_matrix = np.zeros((3, 3))
+            cam_matrix[0, 0] = camera_parameters.fx
+            cam_matrix[1, 1] = camera_parameters.fy
+            cam_matrix[2, 2] = 1
+            cam_matrix[0, 2] = camera_parameters.cx
+            cam_matrix[1, 2] = camera_parameters.cy
+            return cam_matrix
+
+        # the 'rectified' pose of the right view wrt to the left view
+        # should be approx a translation along the x-axis of 120mm (Zed2i camera), expressed in the unit of the coordinates, which we set to meters.
+        pose_of_right_view_in_left_view = np.eye(4)
+        pose_of_right_view_in_left_view[:3, 3] = calibration_parameters.T
+
+        image_size = calibration_parameters.left_cam.image_size
+        return CameraCalibration(
+            resolution=(image_size.width, image_size.height),
+            intrinsics_matrix=intrinsics_matrix(calibration_parameters.left_cam),
+            distortion_coefficients=np.array(calibration_parameters.left_cam.disto),
+            right_intrinsics_matrix=intrinsics_matrix(calibration_parameters.right_cam),
+            right_distortion_coefficients=np.array(calibration_parameters.right_cam.disto),
+            pose_of_right_view_in_left_view=pose_of_right_view_in_left_view,
+        )
+
+    def intrinsics_matrix(self, view: str = StereoRGBDCamera.LEFT_RGB) -> CameraIntrinsicsMatrixType:
         if view == self.LEFT_RGB:
-            fx = self.camera.get_camera_information().camera_configuration.calibration_parameters.left_cam.fx
-            fy = self.camera.get_camera_information().camera_configuration.calibration_parameters.left_cam.fy
-            cx = self.camera.get_camera_information().camera_configuration.calibration_parameters.left_cam.cx
-            cy = self.camera.get_camera_information().camera_configuration.calibration_parameters.left_cam.cy
+            return self.calibration.intrinsics_matrix
         elif view == self.RIGHT_RGB:
-            fx = self.camera.get_camera_information().camera_configuration.calibration_parameters.right_cam.fx
-            fy = self.camera.get_camera_information().camera_configuration.calibration_parameters.right_cam.fy
-            cx = self.camera.get_camera_information().camera_configuration.calibration_parameters.right_cam.cx
-            cy = self.camera.get_camera_information().camera_configuration.calibration_parameters.right_cam.cy
-        else:
-            raise ValueError(f"view must be one of {self._VIEWS}")
-        cam_matrix = np.zeros((3, 3))
-        cam_matrix[0, 0] = fx
-        cam_matrix[1, 1] = fy
-        cam_matrix[2, 2] = 1
-        cam_matrix[0, 2] = cx
-        cam_matrix[1, 2] = cy
-        return cam_matrix
+            assert self.calibration.right_intrinsics_matrix is not None
+            return self.calibration.right_intrinsics_matrix
+        raise ValueError(f"view must be one of {self._VIEWS}")
 
     @property
     def pose_of_right_view_in_left_view(self) -> HomogeneousMatrixType:
-        # get the 'rectified' pose of the right view wrt to the left view
-        # should be approx a translation along the x-axis of 120mm (Zed2i camera), expressed in the unit of the coordinates, which we set to meters.
-        # https://www.stereolabs.com/docs/api/python/classpyzed_1_1sl_1_1CalibrationParameters.html#a99ec1eeeb66c781c27b574fdc36881d2
-        matrix = np.eye(4)
-        matrix[:3, 3] = self.camera.get_camera_information().camera_configuration.calibration_parameters.T
-        return matrix
+        assert self.calibration.pose_of_right_view_in_left_view is not None
+        return self.calibration.pose_of_right_view_in_left_view
 
     @property
     def depth_enabled(self) -> bool:
@@ -166,11 +229,15 @@ class Zed2i(StereoRGBDCamera):
         """grabs (and waits for) the latest image(s) from the camera, rectifies them and computes the depth information (based on the depth mode setting)"""
         # this is a blocking call
         # https://www.stereolabs.com/docs/api/python/classpyzed_1_1sl_1_1Camera.html#a2338c15f49b5f132df373a06bd281822
-        # we might want to consider running this in a seperate thread and using a queue to store the images?
+        # use start_acquisition_thread() to run this in a separate thread and read the images from a ring buffer.
         error_code = self.camera.grab(self.runtime_params)
         if error_code != sl.ERROR_CODE.SUCCESS:
             raise IndexError("Could not grab new camera frame")
 
+    def _retrieve_timestamp(self) -> float:
+        # the time at which the image was captured by the sensor (in host time), i.e. without the transfer and processing latency
+        return self.camera.get_timestamp(sl.TIME_REFERENCE.IMAGE).get_nanoseconds() / 1e9
+
     def _retrieve_rgb_image(self, view: str = StereoRGBDCamera.LEFT_RGB) -> NumpyFloatImageType:
         image = self._retrieve_rgb_image_as_int(view)
         # convert from int to float image
@@ -178,7 +245,9 @@ class Zed2i(StereoRGBDCamera):
         image = ImageConverter.from_numpy_int_format(image).image_in_numpy_format
         return image
 
-    def _retrieve_rgb_image_as_int(self, view: str = StereoRGBDCamera.LEFT_RGB) -> NumpyIntImageType:
+    def _retrieve_rgb_image_as_int(
+        self, view: str = StereoRGBDCamera.LEFT_RGB, *, out: Optional[NumpyIntImageType] = None
+    ) -> NumpyIntImageType:
         assert view in StereoRGBDCamera._VIEWS
         if view == StereoRGBDCamera.RIGHT_RGB:
             view = sl.VIEW.RIGHT
@@ -186,9 +255,12 @@ class Zed2i(StereoRGBDCamera):
             view = sl.VIEW.LEFT
         self.camera.retrieve_image(self.image_matrix, view)
         image: OpenCVIntImageType = self.image_matrix.get_data()
-        image = image[..., :3]  # remove alpha channel
-        image = image[..., ::-1]  # convert from BGR to RGB
-        return image
+        # remove the alpha channel and convert from BGR to RGB in a single pass.
+        # slicing would return a view with negative strides on the sl.Mat memory, which is reused on the next retrieval
+        # and which would be copied anyway by any cv2 function that is called on it.
+        if out is not None:
+            check_out_buffer(out, (*image.shape[:2], 3))
+        return cv2.cvtColor(image, cv2.COLOR_BGRA2RGB, dst=out)
 
     def _retrieve_depth_map(self) -> NumpyDepthMapType:
         assert self.depth_mode != self.NONE_DEPTH_MODE, "Cannot retrieve depth data if depth mode is NONE"
@@ -205,11 +277,17 @@ class Zed2i(StereoRGBDCamera):
         image = image[..., :3]
         return image
 
-    def get_colored_point_cloud(self) -> ColoredPointCloudType:
+    def _acquisition_retrievers(self) -> Dict[str, Callable[[], np.ndarray]]:
+        retrievers = super()._acquisition_retrievers()
+        if self.depth_mode == self.NONE_DEPTH_MODE or not self.depth_enabled:
+            del retrievers["depth_map"]
+            del retrievers["depth_image"]
+        return retrievers
+
+    def _retrieve_colored_point_cloud(self) -> ColoredPointCloudType:
         assert self.depth_mode != self.NONE_DEPTH_MODE, "Cannot retrieve depth data if depth mode is NONE"
         assert self.depth_enabled, "Cannot retrieve depth data if depth is disabled"
 
-        self._grab_images()
         self.camera.retrieve_measure(self.pointcloud_matrix, sl.MEASURE.XYZRGBA)
         # shape (width, height, 4) with the 4th dim being x,y,z,(rgba packed into float)
         # can be nan,nan,nan, nan (no point in the pointcloud on this pixel)
@@ -248,6 +326,7 @@ class Zed2i(StereoRGBDCamera):
         return self
 
     def __exit__(self, exc_type: Any, exc_value: Any, traceback: Any) -> None:
+        self.stop_acquisition_thread()
         self.camera.close()
 
 
@@ -263,6 +342,8 @@ if __name__ == "__main__":
     # test rgbd stereo camera
     with Zed2i(Zed2i.RESOLUTION_2K, fps=15, depth_mode=Zed2i.PERFORMANCE_DEPTH_MODE) as zed:
         print(zed.get_colored_point_cloud()[0])  # TODO: test the pointcloud more explicity?
+        snapshot = zed.capture()
+        print(f"{snapshot.rgb_image.shape=}, {snapshot.depth_map.shape=}, {snapshot.colored_point_cloud.shape=}")
         manual_test_stereo_rgbd_camera(zed)
 
     # profile rgb throughput, should be at 60FPS, i.e. 0.017s
@@ -0,0 +1,238 @@
+"""Temporal filtering of streaming depth maps, to reduce the noise of single depth maps (e.g. at object edges).
+
+The TemporalDepthFilter keeps the last K depth maps and provides the per-pixel median, exponential moving average and
+number of valid values. The TemporallyFilteredDepthCamera wraps any DepthCamera to apply the filter to all its depth maps.
+"""
+from __future__ import annotations
+
+from typing import Any, Optional
+
+import numpy as np
+from airo_camera_toolkit.camera_calibration import CameraCalibration
+from airo_camera_toolkit.interfaces import DepthCamera
+from airo_typing import CameraIntrinsicsMatrixType, NumpyDepthMapType, NumpyIntImageType
+
+
+class TemporalDepthFilter:
+    """Per-pixel statistics over a sliding window of the last `window_size` depth maps.
+
+    All buffers are allocated on the first update, so updating does not allocate memory proportional to the window.
+    Pixels without a valid depth (NaN, inf or <= 0) are ignored: the statistics of each pixel only use its valid values.
+
+    Next to the (K,H,W) ring of the depth maps in the window, the filter keeps the values of each pixel sorted.
+    On each update, the value of the oldest depth map is removed and the new value is inserted in the sorted values,
+    which takes O(K) elementwise operations on the (H,W) planes instead of sorting the window, so the median is available at all times.
+    The update therefore costs O(K*H*W), which is linear in the window size: for 720p depth maps it takes about 25 ms for K=5
+    and 130 ms for K=15, compared to 80 ms and 150 ms to sort the window. Use a small window (or the EMA) for high frame rates.
+    """
+
+    MEDIAN = "median"
+    EMA = "ema"
+
+    def __init__(self, window_size: int = 5, ema_alpha: float = 0.5) -> None:
+        """
+        Args:
+            window_size: number of depth maps K in the window of the median and the valid count.
+            ema_alpha: weight of the new depth map in the exponential moving average, which is not limited to the window.
+        """
+        assert 1 <= window_size <= 255
+        assert 0.0 < ema_alpha <= 1.0
+        self.window_size = window_size
+        self.ema_alpha = ema_alpha
+        self.n_updates = 0
+        self._ring: Optional[np.ndarray] = None
+        self._median: Optional[np.ndarray] = None
+
+    def _allocate(self, shape: tuple) -> None:
+        # invalid values are stored as inf, so that they are sorted after all valid values
+        self._ring = np.full((self.window_size, *shape), np.inf, dtype=np.float32)
+        self._sorted_values = np.full((self.window_size, *shape), np.inf, dtype=np.float32)
+        self.valid_count = np.zeros(shape, dtype=np.int32)
+        """(H,W) number of valid values of each pixel in the window."""
+        self.ema = np.full(shape, np.nan, dtype=np.float32)
+        """(H,W) exponential moving average of the valid values of each pixel, NaN for pixels that were never valid."""
+        # buffers for the update
+        self._is_valid = np.empty(shape, dtype=bool)
+        self._mask = np.empty(shape, dtype=bool)
+        self._position = np.empty(shape, dtype=np.uint8)
+        self._new_values = np.empty(shape, dtype=np.float32)
+        self._lower = np.empty(shape, dtype=np.float32)
+
+    def reset(self) -> None:
+        self.n_updates = 0
+        self._ring = None
+        self._median = None
+
+    @property
+    def ring(self) -> Optional[np.ndarray]:
+        """(K,H,W) ring buffer with the depth maps of the window, in insertion order modulo K (invalid values are inf)."""
+        return self._ring
+
+    def update(self, depth_map: NumpyDepthMapType) -> None:
+        """Add a depth map to the window, which replaces the oldest depth map once the window is full."""
+        if self._ring is None:
+            self._allocate(depth_map.shape)
+        assert self._ring is not None
+        if depth_map.shape != self._ring.shape[1:]:
+            raise ValueError(f"depth map of shape {depth_map.shape} does not match the shape {self._ring.shape[1:]}")
+
+        index = self.n_updates % self.window_size
+        evicted_values = self._ring[index]
+        new_values = self._new_values
+        with np.errstate(invalid="ignore"):
+            np.greater(depth_map, 0, out=self._is_valid)
+        self._is_valid &= np.isfinite(depth_map)
+        np.copyto(new_values, np.inf)
+        np.copyto(new_values, depth_map, where=self._is_valid, casting="unsafe")
+
+        self.valid_count -= np.isfinite(evicted_values)
+        self.valid_count += self._is_valid
+        self._update_ema(depth_map)
+        self._replace_sorted_value(evicted_values, new_values)
+        self._ring[index] = new_values
+        self.n_updates += 1
+        self._median = None
+
+    def _update_ema(self, depth_map: NumpyDepthMapType) -> None:
+        is_first_valid = self._is_valid & np.isnan(self.ema)
+        np.copyto(self.ema, self.ema_alpha * depth_map + (1 - self.ema_alpha) * self.ema, where=self._is_valid)
+        np.copyto(self.ema, depth_map, where=is_first_valid, casting="unsafe")
+
+    def _replace_sorted_value(self, evicted_values: np.ndarray, new_values: np.ndarray) -> None:
+        """Replace the evicted value by the new value in the sorted values of each pixel, with about 7K passes over (H,W) planes.
+
+        The positions of the evicted and new values differ per pixel, so each pass handles one rank for all pixels:
+        restricting the passes to the ranks between both positions would need per-pixel loops, which numpy cannot vectorize.
+        """
+        values = self._sorted_values
+        n = self.window_size
+        # remove the evicted values: shift all values after their position one place down
+        # (all operations write into preallocated buffers, which is considerably faster than allocating temporary arrays)
+        self._position.fill(0)
+        for i in range(n):
+            np.less(values[i], evicted_values, out=self._mask)
+            np.add(self._position, self._mask, out=self._position)
+        for i in range(n - 1):
+            np.less_equal(self._position, i, out=self._mask)
+            np.copyto(values[i], values[i + 1], where=self._mask)
+        # insert the new values at the end and bubble them down to their position
+        np.copyto(values[n - 1], new_values)
+        for i in range(n - 2, -1, -1):
+            np.minimum(values[i], values[i + 1], out=self._lower)
+            np.maximum(values[i], values[i + 1], out=values[i + 1])
+            np.copyto(values[i], self._lower)
+
+    def median(self) -> np.ndarray:
+        """(H,W) median of the valid values of each pixel in the window, NaN for pixels without valid values."""
+        if self._ring is None:
+            raise RuntimeError("the filter has not received any depth maps yet")
+        if self._median is None:
+            lower = self._select_sorted_values(np.maximum(self.valid_count - 1, 0) // 2)
+            upper = self._select_sorted_values(self.valid_count // 2)
+            median = (lower + upper) / 2
+            median[self.valid_count == 0] = np.nan
+            self._median = median
+        return self._median
+
+    def _select_sorted_values(self, indices: np.ndarray) -> np.ndarray:
+        """the sorted value at the given index for each pixel, for small windows this is faster than np.take_along_axis."""
+        selected_values = self._sorted_values[0].copy()
+        for i in range(1, self.window_size):
+            np.equal(indices, i, out=self._mask)
+            np.copyto(selected_values, self._sorted_values[i], where=self._mask)
+        return selected_values
+
+    def filtered_depth_map(self, mode: str = MEDIAN, min_valid_count: int = 1) -> NumpyDepthMapType:
+        """The filtered depth map, with NaN for pixels that have fewer than min_valid_count valid values in the window.
+
+        Args:
+            mode: TemporalDepthFilter.MEDIAN or TemporalDepthFilter.EMA.
+            min_valid_count: minimal number of valid values in the window, higher values remove flickering pixels.
+        """
+        if mode == self.MEDIAN:
+            depth_map = self.median().copy()
+        elif mode == self.EMA:
+            if self._ring is None:
+                raise RuntimeError("the filter has not received any depth maps yet")
+            depth_map = self.ema.copy()
+        else:
+            raise ValueError(f"unknown mode {mode}")
+        depth_map[self.valid_count < min_valid_count] = np.nan
+        return depth_map
+
+
+class TemporallyFilteredDepthCamera(DepthCamera):
+    """Wraps a depth camera to apply a TemporalDepthFilter to its depth maps.
+
+    Every grab of this camera grabs a frame of the wrapped camera and adds its depth map to the filter,
+    get_depth_map() returns the filtered depth map. The depth images are those of the wrapped camera, they are not filtered.
+    The wrapped camera should not be used directly while it is wrapped, as the filter would miss its frames.
+    """
+
+    def __init__(
+        self,
+        camera: DepthCamera,
+        window_size: int = 5,
+        mode: str = TemporalDepthFilter.MEDIAN,
+        ema_alpha: float = 0.5,
+        min_valid_count: int = 1,
+    ) -> None:
+        """
+        Args:
+            camera: the depth camera to filter.
+            window_size: see TemporalDepthFilter.
+            mode: TemporalDepthFilter.MEDIAN or TemporalDepthFilter.EMA.
+            ema_alpha: see TemporalDepthFilter.
+            min_valid_count: see TemporalDepthFilter.filtered_depth_map.
+        """
+        if mode not in (TemporalDepthFilter.MEDIAN, TemporalDepthFilter.EMA):
+            raise ValueError(f"unknown mode {mode}")
+        self.camera = camera
+        self.filter = TemporalDepthFilter(window_size, ema_alpha)
+        self.mode = mode
+        self.min_valid_count = min_valid_count
+
+    def intrinsics_matrix(self) -> CameraIntrinsicsMatrixType:
+        return self.camera.intrinsics_matrix()
+
+    @property
+    def calibration(self) -> CameraCalibration:
+        return self.camera.calibration
+
+    def _grab_images(self) -> None:
+        self.camera._grab_new_frame()
+        self.filter.update(self.camera._retrieve_depth_map())
+
+    def _retrieve_timestamp(self) -> float:
+        return self.camera._retrieve_timestamp()
+
+    def _retrieve_depth_map(self) -> NumpyDepthMapType:
+        return self.filter.filtered_depth_map(self.mode, self.min_valid_count)
+
+    def _retrieve_depth_image(self) -> NumpyIntImageType:
+        return self.camera._retrieve_depth_image()
+
+    def __enter__(self) -> TemporallyFilteredDepthCamera:
+        return self
+
+    def __exit__(self, exc_type: Any, exc_value: Any, traceback: Any) -> None:
+        self.stop_acquisition_thread()
+        if hasattr(self.camera, "__exit__"):
+            self.camera.__exit__(exc_type, exc_value, traceback)
+
+
+if __name__ == "__main__":
+    """shows the raw and the temporally filtered depth maps of a ZED camera."""
+    import cv2
+    from airo_camera_toolkit.cameras.zed2i import Zed2i
+
+    with TemporallyFilteredDepthCamera(Zed2i(Zed2i.RESOLUTION_720, fps=30), window_size=5) as camera:
+        while True:
+            filtered_depth_map = camera.get_depth_map()
+            ring = camera.filter.ring
+            assert ring is not None
+            raw_depth_map = ring[(camera.filter.n_updates - 1) % camera.filter.window_size]
+            depth_maps = np.nan_to_num(np.hstack([raw_depth_map, filtered_depth_map]), nan=0.0, posinf=0.0)
+            cv2.imshow("raw | filtered depth", depth_maps / 2.0)
+            if cv2.waitKey(1) == ord("q"):
+                break
@@ -1,14 +1,38 @@
-from typing import List
+import numbers
+from functools import reduce
+from typing import List, Optional
 
+import cv2
+import numpy as np
 from airo_camera_toolkit.image_transforms.image_transform import (
     HWCImageType,
     ImagePointType,
     ImageShapeType,
     ImageTransform,
+    _copy_into,
+    _opencv_dst,
 )
 
+# the affine matrices of 0, 1, 2 and 3 counter-clockwise rotations of 90 degrees (without translation)
+_ROTATION_MATRICES = [np.array([[1, 0], [0, 1]]), np.array([[0, 1], [-1, 0]]), -np.eye(2), np.array([[0, -1], [1, 0]])]
+
 
 class ComposedTransform(ImageTransform):
+    """Applies a list of transforms in order.
+
+    The affine matrices of the transforms are multiplied into a single matrix on construction, so an image is transformed
+    in a single pass instead of allocating an intermediate image for each transform:
+    - chains of crops and rotations are a single crop followed by a rotation, which is done with slicing and one copy (exact).
+    - chains of crops and resizes without rotations are a single (possibly fractional) crop followed by a resize;
+      if the crop is on whole pixels, this is done with slicing and cv2.resize.
+    - all other chains are done with a single cv2.warpAffine.
+    Points are transformed with the same matrix. If any of the transforms rounds its transformed points,
+    the composed transform rounds them once, after the last transform. This can differ by a pixel from applying the transforms
+    one by one (which rounds after each transform that rounds), but it does not accumulate the rounding errors.
+
+    If any of the transforms does not implement affine_matrix, the transforms are applied one by one instead.
+    """
+
     def __init__(self, transforms: List[ImageTransform]):
         if len(transforms) == 0:
             raise ValueError("transforms must be a non-empty list.")
@@ -16,22 +40,130 @@ class ComposedTransform(ImageTransform):
         super().__init__(transforms[0]._input_shape)
         self.transforms = transforms
 
+        # the points are rounded once at the end, instead of after each transform that rounds its points
+        self.round_transformed_points = any(transform.round_transformed_points for transform in transforms)
+        try:
+            self._affine_matrix: Optional[np.ndarray] = reduce(
+                lambda matrix, transform: transform.affine_matrix @ matrix, transforms, np.eye(3)
+            )
+        except NotImplementedError:
+            self._affine_matrix = None
+            return
+
+        self._inverse_affine_matrix = np.linalg.inv(self._affine_matrix)
+        self._is_integer_matrix = bool(np.all(self._affine_matrix == np.round(self._affine_matrix)))
+
+        # the region of the original image that is transformed into the transformed image, as slices if it is on whole pixels
+        h, w = self.shape[:2]
+        corners = self._inverse_affine_matrix @ np.array([[0.0, w], [0.0, h], [1.0, 1.0]])
+        x_min, x_max = np.sort(corners[0])
+        y_min, y_max = np.sort(corners[1])
+        self._region = None
+        if np.allclose([x_min, x_max, y_min, y_max], np.round([x_min, x_max, y_min, y_max])):
+            self._region = (slice(round(y_min), round(y_max)), slice(round(x_min), round(x_max)))
+        self._num_rotations = self._get_num_rotations()
+        self._is_scaling = not np.allclose(np.abs(self._affine_matrix[:2, :2]).sum(axis=0), 1.0)
+
     @property
     def shape(self) -> ImageShapeType:
         return self.transforms[-1].shape
 
+    @property
+    def affine_matrix(self) -> np.ndarray:
+        if self._affine_matrix is None:
+            raise NotImplementedError("not all transforms implement affine_matrix")
+        return self._affine_matrix
+
+    @property
+    def inverse_affine_matrix(self) -> np.ndarray:
+        if self._affine_matrix is None:
+            raise NotImplementedError("not all transforms implement affine_matrix")
+        return self._inverse_affine_matrix
+
+    def _get_num_rotations(self) -> int:
+        """the number of 90 degree rotations of the composed transform, -1 if it is not a multiple of 90 degrees."""
+        # remove the (positive) scaling of the axes
+        linear = self.affine_matrix[:2, :2]
+        scales = np.abs(linear).sum(axis=0)
+        for num_rotations, rotation in enumerate(_ROTATION_MATRICES):
+            if np.allclose(linear / scales, rotation):
+                return num_rotations
+        return -1
+
+    def _center_affine_matrix(self) -> np.ndarray:
+        """The affine matrix for the coordinates of the pixel centers, as used by cv2.warpAffine.
+
+        transform_point uses coordinates in which the center of pixel (i, j) is (i + 0.5, j + 0.5).
+        """
+        to_corner = np.array([[1.0, 0.0, 0.5], [0.0, 1.0, 0.5], [0.0, 0.0, 1.0]])
+        from_corner = np.array([[1.0, 0.0, -0.5], [0.0, 1.0, -0.5], [0.0, 0.0, 1.0]])
+        return from_corner @ self.affine_matrix @ to_corner
+
     def transform_image(self, image: HWCImageType) -> HWCImageType:
-        for transform in self.transforms:
-            image = transform.transform_image(image)
-        return image
+        if self._affine_matrix is None:
+            for transform in self.transforms:
+                image = transform.transform_image(image)
+            return image
+        transformed_image = np.empty(self.shape, dtype=image.dtype)
+        self._transform_image_into(image, transformed_image)
+        return transformed_image
+
+    def _transform_image_into(self, image: HWCImageType, out: HWCImageType) -> None:
+        if self._affine_matrix is None:
+            _copy_into(out, self.transform_image(image))
+            return
+        h, w = self.shape[:2]
+        if self._region is not None and not self._is_scaling and self._num_rotations >= 0:
+            # only crops and rotations: exact and a single copy
+            np.copyto(out, np.rot90(image[self._region], self._num_rotations))
+            return
+        if self._region is not None and self._num_rotations == 0:
+            # cv2.resize reads the cropped region directly from the original image
+            transformed_image = cv2.resize(image[self._region], (w, h), dst=_opencv_dst(out))
+        else:
+            transformed_image = cv2.warpAffine(
+                image,
+                self._center_affine_matrix()[:2],
+                (w, h),
+                dst=_opencv_dst(out),
+                flags=cv2.INTER_LINEAR,
+                borderMode=cv2.BORDER_REPLICATE,
+            )
+        _copy_into(out, transformed_image)
+
+    def _apply_matrix(self, matrix: np.ndarray, point: ImagePointType) -> ImagePointType:
+        x, y = point
+        x_float, y_float = matrix[:2] @ np.array([x, y, 1.0])
+        if self.round_transformed_points or (
+            self._is_integer_matrix and isinstance(x, numbers.Integral) and isinstance(y, numbers.Integral)
+        ):
+            return round(x_float), round(y_float)
+        return float(x_float), float(y_float)
 
     def transform_point(self, point: ImagePointType) -> ImagePointType:
-        for transform in self.transforms:
-            point = transform.transform_point(point)
-            print(point)
-        return point
+        if self._affine_matrix is None:
+            for transform in self.transforms:
+                point = transform.transform_point(point)
+            return point
+        _assert_inside_image(point, self._input_shape)
+        transformed_point = self._apply_matrix(self._affine_matrix, point)
+        # the point must also lie inside the intermediate images, e.g. inside the region of a crop
+        _assert_inside_image(transformed_point, self.shape)
+        return transformed_point
 
     def reverse_transform_point(self, point: ImagePointType) -> ImagePointType:
-        for transform in reversed(self.transforms):
-            point = transform.reverse_transform_point(point)
-        return point
+        if self._affine_matrix is None:
+            for transform in reversed(self.transforms):
+                point = transform.reverse_transform_point(point)
+            return point
+        _assert_inside_image(point, self.shape)
+        transformed_point = self._apply_matrix(self._inverse_affine_matrix, point)
+        _assert_inside_image(transformed_point, self._input_shape)
+        return transformed_point
+
+
+def _assert_inside_image(point: ImagePointType, image_shape: ImageShapeType) -> None:
+    x, y = point
+    h, w = image_shape[:2]
+    assert x >= 0 and x < w
+    assert y >= 0 and y < h
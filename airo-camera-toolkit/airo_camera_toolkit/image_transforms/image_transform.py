@@ -1,16 +1,27 @@
+import os
 from abc import ABC
-from typing import Tuple, Union
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Optional, Sequence, Tuple, Union
 
+import numpy as np
 from airo_typing import NumpyFloatImageType, NumpyIntImageType, OpenCVIntImageType
 
 HWCImageType = Union[OpenCVIntImageType, NumpyFloatImageType, NumpyIntImageType]
 """an image with shape (H,W,C)"""
+HWCImageBatchType = np.ndarray
+"""a stack of images with shape (N,H,W,C)"""
 
 ImageShapeType = Union[Tuple[int, int, int], Tuple[int, int]]
 ImagePointType = Union[Tuple[int, int], Tuple[float, float]]
+ImagePointsType = np.ndarray
+"""(N,2) array of (x, y) points"""
 
 
 class ImageTransform(ABC):
+    round_transformed_points: bool = False
+    """whether transform_points and reverse_transform_points round the transformed points by default."""
+
     def __init__(self, input_shape: ImageShapeType):
         self._input_shape = input_shape
 
@@ -31,6 +42,20 @@ class ImageTransform(ABC):
         """
         raise NotImplementedError
 
+    @property
+    def affine_matrix(self) -> np.ndarray:
+        """The 3x3 homogeneous matrix that maps (x, y) points of the original image to the transformed image.
+
+        The matrix uses the same coordinates as transform_point, in which the image covers [0, w] x [0, h].
+        ComposedTransform uses these matrices to fuse a chain of transforms into a single transform.
+        """
+        raise NotImplementedError
+
+    @property
+    def inverse_affine_matrix(self) -> np.ndarray:
+        """The 3x3 homogeneous matrix that maps (x, y) points of the transformed image back to the original image."""
+        return np.linalg.inv(self.affine_matrix)
+
     def transform_image(self, image: HWCImageType) -> HWCImageType:
         """Apply the image transform to an image to get a new image.
 
@@ -45,6 +70,48 @@ class ImageTransform(ABC):
         """
         raise NotImplementedError
 
+    def transform_images(
+        self,
+        images: Union[HWCImageBatchType, Sequence[HWCImageType]],
+        out: Optional[HWCImageBatchType] = None,
+        num_workers: Optional[int] = None,
+    ) -> HWCImageBatchType:
+        """Apply the image transform to a stack of images, e.g. a stereo pair or the images of a multi-camera rig.
+
+        The transformed images are written directly into a single output stack of shape (N, *self.shape).
+        The images are transformed in parallel on a thread pool, which scales because OpenCV and numpy release the GIL.
+
+        Args:
+            images: (N,H,W,C) array or sequence of N images with the input shape of the transform.
+            out: optional (N, *self.shape) array to write the transformed images into, e.g. to reuse it for every batch.
+            num_workers: number of threads, defaults to the number of cores. Use 1 to transform the images sequentially.
+
+        Returns:
+            HWCImageBatchType: The (N, *self.shape) stack of transformed images (out, if it was provided).
+        """
+        if len(images) == 0:
+            raise ValueError("images must contain at least one image.")
+        for image in images:
+            if image.shape[:2] != tuple(self._input_shape[:2]):
+                raise ValueError(f"image of shape {image.shape} does not match the input shape {self._input_shape}")
+        if out is None:
+            out = np.empty((len(images), *self.shape), dtype=images[0].dtype)
+        elif out.shape != (len(images), *self.shape):
+            raise ValueError(f"out should have shape {(len(images), *self.shape)}, got {out.shape}")
+
+        if num_workers == 1 or len(images) == 1:
+            for image, transformed_image in zip(images, out):
+                self._transform_image_into(image, transformed_image)
+        else:
+            pool = _get_thread_pool(num_workers or os.cpu_count() or 1)
+            # consume the iterator to wait for all images and raise their exceptions
+            list(pool.map(self._transform_image_into, images, out))
+        return out
+
+    def _transform_image_into(self, image: HWCImageType, out: HWCImageType) -> None:
+        """Transform an image and write the result into out, subclasses can override this to avoid a copy."""
+        _copy_into(out, self.transform_image(image))
+
     def transform_point(self, point: ImagePointType) -> ImagePointType:
         """Transform the coordinates of a point from original image to transformed image."""
         raise NotImplementedError
@@ -53,6 +120,85 @@ class ImageTransform(ABC):
         """Transform the coordinates of a point in the transformed image back to the original image."""
         raise NotImplementedError
 
+    def transform_points(
+        self, points: ImagePointsType, round_transformed_points: Optional[bool] = None
+    ) -> Tuple[ImagePointsType, np.ndarray]:
+        """Transform an (N,2) array of points from original image to transformed image, in a few vectorized operations.
+
+        Unlike transform_point, points outside the images do not raise an error, they are marked as invalid instead.
+
+        Args:
+            points: (N,2) array of (x, y) points in the original image.
+            round_transformed_points: whether to round the transformed points to the nearest integer,
+                defaults to the round_transformed_points of the transform.
+
+        Returns:
+            the (N,2) transformed points and an (N,) boolean mask that is True for the points that lie inside both
+            the original image and the transformed image, i.e. 0 <= x < w and 0 <= y < h as in transform_point.
+        """
+        return self._transform_points(
+            self.affine_matrix, points, self._input_shape, self.shape, round_transformed_points
+        )
+
+    def reverse_transform_points(
+        self, points: ImagePointsType, round_transformed_points: Optional[bool] = None
+    ) -> Tuple[ImagePointsType, np.ndarray]:
+        """Transform an (N,2) array of points in the transformed image back to the original image, cf. transform_points."""
+        return self._transform_points(
+            self.inverse_affine_matrix, points, self.shape, self._input_shape, round_transformed_points
+        )
+
+    def _transform_points(
+        self,
+        matrix: np.ndarray,
+        points: ImagePointsType,
+        from_shape: ImageShapeType,
+        to_shape: ImageShapeType,
+        round_transformed_points: Optional[bool],
+    ) -> Tuple[ImagePointsType, np.ndarray]:
+        points = np.asarray(points)
+        if points.ndim != 2 or points.shape[1] != 2:
+            raise ValueError(f"points should be an (N,2) array, got shape {points.shape}")
+        if round_transformed_points is None:
+            round_transformed_points = self.round_transformed_points
+
+        transformed_points = points @ matrix[:2, :2].T + matrix[:2, 2]
+        is_valid = _is_inside_image(points, from_shape) & _is_inside_image(transformed_points, to_shape)
+
+        if round_transformed_points:
+            transformed_points = np.rint(transformed_points).astype(int)
+        elif np.issubdtype(points.dtype, np.integer) and np.all(matrix == np.round(matrix)):
+            # crops and rotations map integer points to integer points, which can be negative (outside the image)
+            signed_dtype = points.dtype if np.issubdtype(points.dtype, np.signedinteger) else np.int64
+            transformed_points = np.rint(transformed_points).astype(signed_dtype)
+        return transformed_points, is_valid
+
     def __call__(self, image: HWCImageType) -> HWCImageType:
         """Shorthand to transform an image."""
         return self.transform_image(image)
+
+
+def _is_inside_image(points: ImagePointsType, image_shape: ImageShapeType) -> np.ndarray:
+    """the borders are exclusive, as in the assertions of transform_point: x in [0, w) and y in [0, h)."""
+    h, w = image_shape[:2]
+    x, y = points[:, 0], points[:, 1]
+    return (x >= 0) & (x < w) & (y >= 0) & (y < h)
+
+
+@lru_cache(maxsize=None)
+def _get_thread_pool(num_workers: int) -> ThreadPoolExecutor:
+    """the thread pools are shared between all transforms, to avoid starting new threads for every batch."""
+    return ThreadPoolExecutor(max_workers=num_workers, thread_name_prefix="image_transforms")
+
+
+def _opencv_dst(out: HWCImageType) -> HWCImageType:
+    """a view of out that OpenCV can write into: OpenCV drops the channel dimension of single channel images."""
+    if out.ndim == 3 and out.shape[2] == 1:
+        return out[..., 0]
+    return out
+
+
+def _copy_into(out: HWCImageType, result: HWCImageType) -> None:
+    """copy the result into out, unless it was already written into out (e.g. as the dst of an OpenCV function)."""
+    if not np.shares_memory(result, out):
+        np.copyto(out, result.reshape(out.shape))
@@ -1,4 +1,8 @@
+from typing import Optional, Sequence, Union
+
+import numpy as np
 from airo_camera_toolkit.image_transforms.image_transform import (
+    HWCImageBatchType,
     HWCImageType,
     ImagePointType,
     ImageShapeType,
@@ -23,12 +27,21 @@ def crop(image: HWCImageType, x: int, y: int, h: int, w: int) -> HWCImageType:
 class Crop(ImageTransform):
     """"""
 
-    def __init__(self, input_shape: ImageShapeType, x: int, y: int, h: int, w: int):
+    def __init__(self, input_shape: ImageShapeType, x: int, y: int, h: int, w: int, copy: bool = True):
+        """Create a new Crop transform.
+
+        Args:
+            input_shape: Shape of the images that will be cropped.
+            x, y, h, w: The crop rectangle, see the crop function.
+            copy: Whether the cropped images are copies. If False, they are views into the original images,
+                which avoids copying the pixels but the original images must not be modified while the crops are used.
+        """
         super().__init__(input_shape)
         self.x = x
         self.y = y
         self.h = h
         self.w = w
+        self.copy = copy
 
     @property
     def shape(self) -> ImageShapeType:
@@ -38,9 +51,29 @@ class Crop(ImageTransform):
         c = self._input_shape[2]  # type: ignore
         return self.h, self.w, c
 
+    @property
+    def affine_matrix(self) -> np.ndarray:
+        return np.array([[1.0, 0.0, -self.x], [0.0, 1.0, -self.y], [0.0, 0.0, 1.0]])
+
     def transform_image(self, image: HWCImageType) -> HWCImageType:
+        if not self.copy:
+            return image[self.y : self.y + self.h, self.x : self.x + self.w]
         return crop(image, self.x, self.y, self.h, self.w)
 
+    def transform_images(
+        self,
+        images: Union[HWCImageBatchType, Sequence[HWCImageType]],
+        out: Optional[HWCImageBatchType] = None,
+        num_workers: Optional[int] = None,
+    ) -> HWCImageBatchType:
+        if not self.copy and out is None and isinstance(images, np.ndarray):
+            # a single view into the stack of images
+            return images[:, self.y : self.y + self.h, self.x : self.x + self.w]
+        return super().transform_images(images, out, num_workers)
+
+    def _transform_image_into(self, image: HWCImageType, out: HWCImageType) -> None:
+        np.copyto(out, image[self.y : self.y + self.h, self.x : self.x + self.w])
+
     def transform_point(self, point: ImagePointType) -> ImagePointType:
         x, y = point
         assert x >= self.x and x < self.x + self.w
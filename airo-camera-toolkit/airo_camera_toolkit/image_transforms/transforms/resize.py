@@ -1,9 +1,12 @@
 import cv2
+import numpy as np
 from airo_camera_toolkit.image_transforms.image_transform import (
     HWCImageType,
     ImagePointType,
     ImageShapeType,
     ImageTransform,
+    _copy_into,
+    _opencv_dst,
 )
 
 
@@ -35,9 +38,16 @@ class Resize(ImageTransform):
         c = self._input_shape[2]  # type: ignore
         return self.h, self.w, c
 
+    @property
+    def affine_matrix(self) -> np.ndarray:
+        return np.diag([self.w / self._input_w, self.h / self._input_h, 1.0])
+
     def transform_image(self, image: HWCImageType) -> HWCImageType:
         return cv2.resize(image, (self.w, self.h))
 
+    def _transform_image_into(self, image: HWCImageType, out: HWCImageType) -> None:
+        _copy_into(out, cv2.resize(image, (self.w, self.h), dst=_opencv_dst(out)))
+
     def transform_point(self, point: ImagePointType) -> ImagePointType:
         x, y = point
         assert x >= 0 and x < self._input_w
@@ -1,5 +1,8 @@
+from typing import Optional, Sequence, Union
+
 import numpy as np
 from airo_camera_toolkit.image_transforms.image_transform import (
+    HWCImageBatchType,
     HWCImageType,
     ImagePointType,
     ImageShapeType,
@@ -14,11 +17,14 @@ class Rotate90(ImageTransform):
         self,
         input_shape: ImageShapeType,
         num_rotations: int = 1,
+        copy: bool = True,
     ):
         """Create a new Rotate transform.
 
         Args:
             num_rotations: the number of 90-degree rotations to apply. Positive values rotate counter-clockwise.
+            copy: whether the rotated images are copies. If False, they are (non-contiguous) views into the original images,
+                which avoids copying the pixels but the original images must not be modified while the rotated images are used.
         """
         super().__init__(input_shape)
 
@@ -26,6 +32,7 @@ class Rotate90(ImageTransform):
             raise TypeError("num_rotations must be an int")
 
         self._num_rotations = num_rotations % 4
+        self.copy = copy
 
     @property
     def shape(self) -> ImageShapeType:
@@ -40,10 +47,37 @@ class Rotate90(ImageTransform):
         c = self._input_shape[2]  # type: ignore
         return h, w, c
 
+    @property
+    def affine_matrix(self) -> np.ndarray:
+        w, h = self._input_w, self._input_h
+        matrices = [
+            [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]],
+            [[0.0, 1.0, 0.0], [-1.0, 0.0, w]],
+            [[-1.0, 0.0, w], [0.0, -1.0, h]],
+            [[0.0, -1.0, h], [1.0, 0.0, 0.0]],
+        ]
+        return np.array(matrices[self._num_rotations] + [[0.0, 0.0, 1.0]])
+
     def transform_image(self, image: HWCImageType) -> HWCImageType:
+        if not self.copy:
+            return np.rot90(image, self._num_rotations)
         # The copy here ensure the result is not a view into the original image.
         return np.rot90(image, self._num_rotations).copy()
 
+    def transform_images(
+        self,
+        images: Union[HWCImageBatchType, Sequence[HWCImageType]],
+        out: Optional[HWCImageBatchType] = None,
+        num_workers: Optional[int] = None,
+    ) -> HWCImageBatchType:
+        if not self.copy and out is None and isinstance(images, np.ndarray):
+            # a single view into the stack of images
+            return np.rot90(images, self._num_rotations, axes=(1, 2))
+        return super().transform_images(images, out, num_workers)
+
+    def _transform_image_into(self, image: HWCImageType, out: HWCImageType) -> None:
+        np.copyto(out, np.rot90(image, self._num_rotations))
+
     def transform_point(self, point: ImagePointType) -> ImagePointType:
         x, y = point
         assert x >= 0 and x < self._input_w
@@ -1,5 +1,13 @@
 import abc
-
+import time
+from typing import Callable, Dict, Optional, Sequence
+
+import numpy as np
+from airo_camera_toolkit.acquisition import AcquisitionThread, BufferedFrame, FrameRingBuffer
+from airo_camera_toolkit.camera_calibration import CameraCalibration
+from airo_camera_toolkit.reprojection import unproject_depth_map
+from airo_camera_toolkit.snapshot import FrameSnapshot
+from airo_camera_toolkit.utils import ImageConverter
 from airo_typing import (
     CameraIntrinsicsMatrixType,
     ColoredPointCloudType,
@@ -28,8 +36,15 @@ class Camera(abc.ABC):
     keep in mind though that images are indexed column-row in numpy, which corresponds to y-x in the cartesian image coordinates
     so to get the value of the pixel at (u,v) you need to do image[v,u] and the shape of the numpy array is (height, width)
     cf https://scikit-image.org/docs/stable/user_guide/numpy_images.html#numpy-indexing
+
+    All cameras can optionally grab their frames in a background thread, see `start_acquisition_thread`.
     """
 
+    # set as class attribute, so that implementations do not have to call super().__init__()
+    _acquisition_thread: Optional[AcquisitionThread] = None
+    # number of frames grabbed by this camera, used to detect whether the memory buffer still holds a given frame
+    _grab_count: int = 0
+
     @abc.abstractmethod
     def intrinsics_matrix(self) -> CameraIntrinsicsMatrixType:
         """returns the intrinsics matrix of the camera:
@@ -42,26 +57,166 @@ class Camera(abc.ABC):
         """
         raise NotImplementedError
 
+    @property
+    def calibration(self) -> CameraCalibration:
+        """All calibration parameters of the camera (intrinsics, distortion, resolution and the stereo extrinsics for stereo cameras).
+
+        Implementations should read these from the camera once and cache them, as they are queried often (e.g. every frame for reprojection).
+        """
+        raise NotImplementedError
+
     @abc.abstractmethod
     def _grab_images(self) -> None:
         """Transfer the latest camera data (RGB, stereo RGB, depth) from the camera to a memory buffer."""
         raise NotImplementedError
 
+    def _grab_new_frame(self) -> None:
+        """Grab a new frame and keep track of the number of grabs, use this instead of calling _grab_images() directly."""
+        self._grab_images()
+        self._grab_count += 1
+
+    def _retrieve_timestamp(self) -> float:
+        """Returns the time at which the current frame in the memory buffer was captured, in seconds since the epoch.
+
+        Cameras that provide hardware timestamps should override this, as these are needed to time-align the frames of multiple cameras
+        (cf. MultiCameraRig). The default is the time of the call, i.e. right after the grab.
+        """
+        return time.time()
+
+    def capture(self) -> FrameSnapshot:
+        """Grab a single frame and return a snapshot from which all modalities (RGB, depth, point cloud,...) can be accessed.
+
+        Using the get_* methods to get multiple modalities grabs a frame for each of them, which is slower
+        and results in modalities that come from different frames (e.g. RGB and depth are not aligned).
+        With a snapshot, each modality is retrieved at most once, on first access.
+
+        If the acquisition thread is running, the snapshot contains the modalities of a frame from its buffer.
+        """
+        if self.is_acquisition_thread_running:
+            frame = self.get_buffered_frame()
+            return FrameSnapshot({}, lambda: False, frame.timestamp, frame.data)
+
+        self._grab_new_frame()
+        grab_count = self._grab_count
+        return FrameSnapshot(
+            self._snapshot_retrievers(), lambda: self._grab_count == grab_count, self._retrieve_timestamp()
+        )
+
+    def start_acquisition_thread(
+        self,
+        buffer_size: int = 3,
+        policy: str = FrameRingBuffer.LATEST_ONLY,
+        modalities: Optional[Sequence[str]] = None,
+        wait_for_new_frame: bool = False,
+        copy_on_read: bool = True,
+    ) -> None:
+        """Start grabbing frames in a background thread.
+
+        The thread grabs frames as fast as the camera provides them and stores the requested modalities in a ring buffer.
+        While the thread is running, the `get_*` methods read from this buffer instead of grabbing a new frame themselves.
+        Use `get_buffered_frame` to get all modalities of a single frame.
+
+        Args:
+            buffer_size: number of frames in the ring buffer.
+            policy: FrameRingBuffer.LATEST_ONLY to always read the newest frame, or FrameRingBuffer.QUEUE_ALL to read every frame in order.
+            modalities: names of the modalities to store for each frame, defaults to all modalities the camera provides (see `_acquisition_retrievers`).
+            wait_for_new_frame: for LATEST_ONLY, block on each read until a frame is available that was not read before.
+            copy_on_read: see FrameRingBuffer.
+        """
+        if self.is_acquisition_thread_running:
+            raise RuntimeError("the acquisition thread is already running")
+
+        retrievers = self._acquisition_retrievers()
+        if modalities is not None:
+            unknown_modalities = set(modalities) - set(retrievers.keys())
+            if unknown_modalities:
+                raise ValueError(
+                    f"unknown modalities {unknown_modalities}, this camera provides {tuple(retrievers.keys())}"
+                )
+            retrievers = {modality: retrievers[modality] for modality in modalities}
+
+        buffer = FrameRingBuffer(buffer_size, policy, copy_on_read)
+        self._acquisition_thread = AcquisitionThread(
+            self._grab_new_frame, retrievers, buffer, wait_for_new_frame, self._retrieve_timestamp
+        )
+        self._acquisition_thread.start()
+
+    def stop_acquisition_thread(self) -> None:
+        """Stop the background acquisition thread (if it is running), afterwards the `get_*` methods grab frames themselves again."""
+        if self._acquisition_thread is None:
+            return
+        self._acquisition_thread.stop()
+        self._acquisition_thread = None
+
+    @property
+    def is_acquisition_thread_running(self) -> bool:
+        return self._acquisition_thread is not None
+
+    @property
+    def dropped_frames(self) -> int:
+        """number of frames grabbed by the acquisition thread that were never read."""
+        if self._acquisition_thread is None:
+            return 0
+        return self._acquisition_thread.buffer.dropped_frames
+
+    def get_buffered_frame(self, timeout: Optional[float] = None) -> BufferedFrame:
+        """Read a frame with all acquired modalities from the buffer of the acquisition thread."""
+        if self._acquisition_thread is None:
+            raise RuntimeError("the acquisition thread is not running, call start_acquisition_thread() first")
+        return self._acquisition_thread.read_frame(timeout)
+
+    @property
+    def available_modalities(self) -> Sequence[str]:
+        """names of the modalities that the camera provides with its current settings, e.g. ("rgb", "depth_map")."""
+        return tuple(self._acquisition_retrievers().keys())
+
+    def _acquisition_retrievers(self) -> Dict[str, Callable[[], np.ndarray]]:
+        """Maps the names of the modalities that can be stored by the acquisition thread to the functions that retrieve them from the memory buffer.
+        Subclasses extend this dict (cooperatively, by calling super()) with the modalities they provide."""
+        return {}
+
+    def _snapshot_retrievers(self) -> Dict[str, Callable[[], np.ndarray]]:
+        """The modalities that can be accessed on a snapshot, cf. `capture`.
+        These are the modalities of the acquisition thread, and those that are too expensive to compute for every frame."""
+        return self._acquisition_retrievers()
+
+    def _read_acquired_modality(self, modality: str) -> np.ndarray:
+        assert self._acquisition_thread is not None
+        return self._acquisition_thread.read_modality(modality)
+
 
 class RGBCamera(Camera, abc.ABC):
     """Base class for all RGB cameras"""
 
     def get_rgb_image(self) -> NumpyFloatImageType:
         """Get a new RGB image from the camera."""
-        self._grab_images()
+        if self.is_acquisition_thread_running:
+            return ImageConverter.from_numpy_int_format(self._read_acquired_modality("rgb")).image_in_numpy_format
+        self._grab_new_frame()
         return self._retrieve_rgb_image()
 
-    def get_rgb_image_as_int(self) -> NumpyIntImageType:
+    def get_rgb_image_as_int(self, out: Optional[NumpyIntImageType] = None) -> NumpyIntImageType:
         """Get a new RGB image from the camera as uint8.
         This is faster to retrieve as images are typically stored as ints in the buffer.
-        It is also more compact, so recommended for communication."""
-        self._grab_images()
-        return self._retrieve_rgb_image_as_int()
+        It is also more compact, so recommended for communication.
+
+        Args:
+            out: optional C-contiguous (H,W,3) uint8 array to write the image into, e.g. from an ImageBufferPool.
+                This avoids allocating a new image for every frame.
+        """
+        if self.is_acquisition_thread_running:
+            image = self._read_acquired_modality("rgb")
+            if out is None:
+                return image
+            np.copyto(out, image)
+            return out
+        self._grab_new_frame()
+        return self._retrieve_rgb_image_as_int(out=out)
+
+    def _acquisition_retrievers(self) -> Dict[str, Callable[[], np.ndarray]]:
+        retrievers = super()._acquisition_retrievers()
+        retrievers["rgb"] = self._retrieve_rgb_image_as_int
+        return retrievers
 
     @abc.abstractmethod
     def _retrieve_rgb_image(self) -> NumpyFloatImageType:
@@ -69,10 +224,13 @@ class RGBCamera(Camera, abc.ABC):
         raise NotImplementedError
 
     @abc.abstractmethod
-    def _retrieve_rgb_image_as_int(self) -> NumpyIntImageType:
+    def _retrieve_rgb_image_as_int(self, *, out: Optional[NumpyIntImageType] = None) -> NumpyIntImageType:
         """Returns the current RGB image in the memory buffer as uint8.
         This is typically the format in which it is stored in memory.
-        Returning it directly avoids the overhead of converting it to floats first, which is what _retrieve_rgb_image() does."""
+        Returning it directly avoids the overhead of converting it to floats first, which is what _retrieve_rgb_image() does.
+
+        Implementations should return a C-contiguous array that is not shared with the memory buffer of the camera
+        (which is reused for the next frame), and write it into `out` if provided."""
         raise NotImplementedError
 
 
@@ -87,14 +245,24 @@ class DepthCamera(Camera, abc.ABC):
         Returns:
             np.ndarray: _description_
         """
-        self._grab_images()
+        if self.is_acquisition_thread_running:
+            return self._read_acquired_modality("depth_map")
+        self._grab_new_frame()
         return self._retrieve_depth_map()
 
     def get_depth_image(self) -> NumpyIntImageType:
         """an 8-bit (int) quantization of the latest depth map, which can be used for visualization"""
-        self._grab_images()
+        if self.is_acquisition_thread_running:
+            return self._read_acquired_modality("depth_image")
+        self._grab_new_frame()
         return self._retrieve_depth_image()
 
+    def _acquisition_retrievers(self) -> Dict[str, Callable[[], np.ndarray]]:
+        retrievers = super()._acquisition_retrievers()
+        retrievers["depth_map"] = self._retrieve_depth_map
+        retrievers["depth_image"] = self._retrieve_depth_image
+        return retrievers
+
     def get_colored_point_cloud(self) -> ColoredPointCloudType:
         """Get the latest point cloud of the camera.
         The point cloud contains 6D arrays of floats, that provide the estimated position in the camera frame
@@ -103,7 +271,14 @@ class DepthCamera(Camera, abc.ABC):
         Returns:
             np.ndarray: Nx6 array containing PointCloud with color information. Each entry is (x,y,z,r,g,b)
         """
-        # TODO: offer a base implementation that uses the depth map and the rgb image to construct this pointcloud?
+        if self.is_acquisition_thread_running:
+            raise RuntimeError("point clouds are not stored by the acquisition thread")
+        self._grab_new_frame()
+        return self._retrieve_colored_point_cloud()
+
+    def _retrieve_colored_point_cloud(self) -> ColoredPointCloudType:
+        """Returns the point cloud for the current frame in the memory buffer.
+        RGBD cameras have a default implementation that constructs it from the depth map and the RGB image."""
         raise NotImplementedError
 
     @abc.abstractmethod
@@ -120,6 +295,18 @@ class DepthCamera(Camera, abc.ABC):
 class RGBDCamera(RGBCamera, DepthCamera):
     """Base class for all RGBD cameras"""
 
+    def _snapshot_retrievers(self) -> Dict[str, Callable[[], np.ndarray]]:
+        retrievers = super()._snapshot_retrievers()
+        retrievers["colored_point_cloud"] = self._retrieve_colored_point_cloud
+        return retrievers
+
+    def _retrieve_colored_point_cloud(self) -> ColoredPointCloudType:
+        """Unprojects the depth map and colors the points with the RGB image, cf. reprojection.unproject_depth_map.
+        Override this if the camera SDK provides point clouds itself."""
+        return unproject_depth_map(
+            self._retrieve_depth_map(), self.intrinsics_matrix(), self._retrieve_rgb_image_as_int()
+        )
+
 
 class StereoRGBDCamera(RGBDCamera):
     """Base class for all stereo RGBD cameras"""
@@ -129,13 +316,27 @@ class StereoRGBDCamera(RGBDCamera):
     _VIEWS = (LEFT_RGB, RIGHT_RGB)
 
     def get_rgb_image(self, view: str = LEFT_RGB) -> NumpyFloatImageType:
-        self._grab_images()
+        if self.is_acquisition_thread_running:
+            image = self._read_acquired_modality("rgb" if view == self.LEFT_RGB else "rgb_right")
+            return ImageConverter.from_numpy_int_format(image).image_in_numpy_format
+        self._grab_new_frame()
         return self._retrieve_rgb_image(view)
 
     @abc.abstractmethod
     def _retrieve_rgb_image(self, view: str = LEFT_RGB) -> NumpyFloatImageType:
         raise NotImplementedError
 
+    @abc.abstractmethod
+    def _retrieve_rgb_image_as_int(
+        self, view: str = LEFT_RGB, *, out: Optional[NumpyIntImageType] = None
+    ) -> NumpyIntImageType:
+        raise NotImplementedError
+
+    def _acquisition_retrievers(self) -> Dict[str, Callable[[], np.ndarray]]:
+        retrievers = super()._acquisition_retrievers()
+        retrievers["rgb_right"] = lambda: self._retrieve_rgb_image_as_int(self.RIGHT_RGB)
+        return retrievers
+
     # TODO: check view argument value?
     @abc.abstractmethod
     def intrinsics_matrix(self, view: str = LEFT_RGB) -> CameraIntrinsicsMatrixType:
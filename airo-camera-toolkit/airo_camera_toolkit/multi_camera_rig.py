@@ -0,0 +1,225 @@
+"""Synchronized capture with multiple cameras.
+
+The cameras are grabbed concurrently in a thread pool (the camera SDKs release the GIL while waiting for frames),
+and the frames are time-aligned based on their (hardware) capture timestamps, cf. `Camera._retrieve_timestamp()`.
+"""
+from __future__ import annotations
+
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Deque, List, Optional, Sequence
+
+import numpy as np
+from airo_camera_toolkit.interfaces import Camera
+from airo_camera_toolkit.snapshot import FrameSnapshot
+
+
+@dataclass
+class CameraStatistics:
+    """Statistics of a single camera in a MultiCameraRig."""
+
+    n_frames: int = 0
+    """number of frames that were returned in a frame set."""
+    dropped_frames: int = 0
+    """number of frames that were grabbed but discarded to align the camera with the other cameras."""
+    fps: float = 0.0
+    """rate at which frames of this camera were returned, over the last frame sets."""
+    mean_skew: float = 0.0
+    """mean absolute offset of the timestamps of this camera from the (median) timestamp of the frame sets, in seconds."""
+    max_skew: float = 0.0
+    """maximal absolute offset of the timestamps of this camera from the (median) timestamp of the frame sets, in seconds."""
+
+
+@dataclass
+class MultiCameraFrameSet:
+    """Time-aligned frames of all cameras of a rig, in the order of the cameras."""
+
+    snapshots: List[FrameSnapshot]
+    is_synchronized: bool
+    """whether the skew of the frame set is within the max_skew of the rig."""
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        return np.array([snapshot.timestamp for snapshot in self.snapshots])
+
+    @property
+    def timestamp(self) -> float:
+        """the median timestamp of the frames"""
+        return float(np.median(self.timestamps))
+
+    @property
+    def skew(self) -> float:
+        """the time between the first and the last frame of the set, in seconds."""
+        timestamps = self.timestamps
+        return float(timestamps.max() - timestamps.min())
+
+    def __len__(self) -> int:
+        return len(self.snapshots)
+
+    def __getitem__(self, index: int) -> FrameSnapshot:
+        return self.snapshots[index]
+
+
+class _CameraStatisticsTracker:
+    def __init__(self, window_size: int) -> None:
+        self.n_frames = 0
+        self.dropped_frames = 0
+        self._sum_skew = 0.0
+        self._max_skew = 0.0
+        self._returned_timestamps: Deque[float] = deque(maxlen=window_size)
+        # intervals between consecutive grabs, the smallest one estimates the frame period of the camera
+        self._grab_intervals: Deque[float] = deque(maxlen=window_size)
+        self._last_grab_timestamp: Optional[float] = None
+
+    def on_grab(self, timestamp: float) -> None:
+        if self._last_grab_timestamp is not None and timestamp > self._last_grab_timestamp:
+            self._grab_intervals.append(timestamp - self._last_grab_timestamp)
+        self._last_grab_timestamp = timestamp
+
+    def on_frame_set(self, timestamp: float, reference_timestamp: float) -> None:
+        self.n_frames += 1
+        skew = abs(timestamp - reference_timestamp)
+        self._sum_skew += skew
+        self._max_skew = max(self._max_skew, skew)
+        self._returned_timestamps.append(timestamp)
+
+    @property
+    def frame_period(self) -> Optional[float]:
+        if not self._grab_intervals:
+            return None
+        return min(self._grab_intervals)
+
+    def statistics(self) -> CameraStatistics:
+        fps = 0.0
+        if len(self._returned_timestamps) > 1:
+            duration = self._returned_timestamps[-1] - self._returned_timestamps[0]
+            fps = (len(self._returned_timestamps) - 1) / duration if duration > 0 else 0.0
+        mean_skew = self._sum_skew / self.n_frames if self.n_frames > 0 else 0.0
+        return CameraStatistics(self.n_frames, self.dropped_frames, fps, mean_skew, self._max_skew)
+
+
+class MultiCameraRig:
+    """Owns a number of cameras and captures time-aligned frame sets from them.
+
+    All cameras are grabbed concurrently. If the frames of the cameras are further apart than `max_skew`,
+    the cameras with the oldest frames grab again, as long as their next frame is expected to be closer to the newest frame
+    (based on the frame period that is estimated from the timestamps). This is repeated at most `max_regrabs` times.
+    Hardware-synchronized cameras will hence always be aligned, unsynchronized cameras are aligned up to their phase difference.
+
+    The timestamps of all cameras should be in the same time domain (e.g. host time), as is the case for the hardware timestamps
+    of the ZED and Realsense cameras. Cameras with a running acquisition thread should use `wait_for_new_frame`,
+    as otherwise they cannot grab a newer frame to catch up with the other cameras.
+
+    The rig is not thread-safe: call `capture` from a single thread.
+    """
+
+    def __init__(
+        self, cameras: Sequence[Camera], max_skew: float = 0.005, max_regrabs: int = 3, statistics_window: int = 30
+    ) -> None:
+        """
+        Args:
+            cameras: the cameras of the rig.
+            max_skew: maximal time between the frames of a frame set, in seconds.
+            max_regrabs: maximal number of times cameras grab again to align their frames for a single frame set.
+            statistics_window: number of frames over which the frame rate and frame period are estimated.
+        """
+        if len(cameras) == 0:
+            raise ValueError("a rig needs at least one camera")
+        self.cameras = list(cameras)
+        self.max_skew = max_skew
+        self.max_regrabs = max_regrabs
+        self.unsynchronized_frame_sets = 0
+
+        self._trackers = [_CameraStatisticsTracker(statistics_window) for _ in self.cameras]
+        self._executor = ThreadPoolExecutor(max_workers=len(self.cameras), thread_name_prefix="multi-camera-rig")
+        self._lock = threading.Lock()
+
+    def capture(self, modalities: Optional[Sequence[str]] = None) -> MultiCameraFrameSet:
+        """Grab all cameras concurrently and return a time-aligned frame set.
+
+        Args:
+            modalities: names of the modalities (e.g. "rgb", "depth_map") to retrieve in the worker threads, so that they are retrieved
+                for all cameras in parallel. Other modalities are retrieved from the snapshots on first access.
+        """
+        modalities = tuple(modalities) if modalities is not None else ()
+        indices = list(range(len(self.cameras)))
+        snapshots = list(self._executor.map(lambda index: self._capture(index, modalities), indices))
+
+        for _ in range(self.max_regrabs):
+            lagging_indices = self._lagging_cameras(snapshots)
+            if not lagging_indices:
+                break
+            new_snapshots = self._executor.map(lambda index: self._capture(index, modalities), lagging_indices)
+            for index, snapshot in zip(lagging_indices, new_snapshots):
+                self._trackers[index].dropped_frames += 1
+                snapshots[index] = snapshot
+
+        timestamps = [snapshot.timestamp for snapshot in snapshots]
+        frame_set = MultiCameraFrameSet(snapshots, max(timestamps) - min(timestamps) <= self.max_skew)
+        if not frame_set.is_synchronized:
+            self.unsynchronized_frame_sets += 1
+        reference_timestamp = frame_set.timestamp
+        for tracker, snapshot in zip(self._trackers, snapshots):
+            tracker.on_frame_set(snapshot.timestamp, reference_timestamp)
+        return frame_set
+
+    def _capture(self, index: int, modalities: Sequence[str]) -> FrameSnapshot:
+        snapshot = self.cameras[index].capture()
+        snapshot.retrieve(modalities)
+        with self._lock:
+            self._trackers[index].on_grab(snapshot.timestamp)
+        return snapshot
+
+    def _lagging_cameras(self, snapshots: List[FrameSnapshot]) -> List[int]:
+        """cameras whose frame is too old to align with the newest frame, and whose next frame is expected to be closer to it."""
+        newest_timestamp = max(snapshot.timestamp for snapshot in snapshots)
+        lagging_indices = []
+        for index, snapshot in enumerate(snapshots):
+            lag = newest_timestamp - snapshot.timestamp
+            if lag <= self.max_skew:
+                continue
+            frame_period = self._trackers[index].frame_period
+            if frame_period is None or abs(lag - frame_period) < lag:
+                lagging_indices.append(index)
+        return lagging_indices
+
+    @property
+    def statistics(self) -> List[CameraStatistics]:
+        """the statistics of each camera, in the order of the cameras."""
+        return [tracker.statistics() for tracker in self._trackers]
+
+    def close(self) -> None:
+        """Shut down the thread pool, the rig can no longer capture afterwards."""
+        self._executor.shutdown()
+
+    def __enter__(self) -> MultiCameraRig:
+        return self
+
+    def __exit__(self, exc_type: Any, exc_value: Any, traceback: Any) -> None:
+        self.close()
+        # the rig owns the cameras, so close them as well
+        for camera in self.cameras:
+            if hasattr(camera, "__exit__"):
+                camera.__exit__(exc_type, exc_value, traceback)
+
+
+if __name__ == "__main__":
+    """captures frame sets from three simulated 30 fps cameras, of which the last is not synchronized with the others."""
+    from airo_camera_toolkit.cameras.fake import FakeStereoRGBDCamera
+
+    cameras = [
+        FakeStereoRGBDCamera(fps=30, latency=0.02, jitter=0.0005),
+        FakeStereoRGBDCamera(fps=30, latency=0.03, jitter=0.0005),
+        FakeStereoRGBDCamera(fps=30, latency=0.02, jitter=0.0005, phase=0.012),
+    ]
+    with MultiCameraRig(cameras, max_skew=0.005) as rig:
+        for _ in range(60):
+            frame_set = rig.capture(modalities=["rgb"])
+        print(f"unsynchronized frame sets: {rig.unsynchronized_frame_sets}")
+        for index, statistics in enumerate(rig.statistics):
+            print(
+                f"camera {index}: {statistics.fps:.1f} fps, mean skew {statistics.mean_skew * 1000:.1f} ms, "
+                f"max skew {statistics.max_skew * 1000:.1f} ms, {statistics.dropped_frames} dropped frames"
+            )
@@ -0,0 +1,277 @@
+"""Vectorized operations on (colored) point clouds: cropping, voxel-grid downsampling and outlier removal.
+
+All functions take (N,3) point clouds (PointCloudType) or (N,3+C) point clouds of which the first three columns are the positions,
+such as the (x,y,z,r,g,b) ColoredPointCloudType of the cameras. The other columns are kept (or averaged) along with the positions.
+
+Run this file to benchmark the operations on point clouds of 1M to 5M points.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+from airo_typing import HomogeneousMatrixType, PointCloudType, Vector3DType
+from scipy.spatial import cKDTree
+
+_MAX_DENSE_VOXEL_GRID_SIZE_PER_POINT = 4
+"""voxel grids with at most this many voxels per point are indexed with a lookup table, larger grids are hashed with np.unique."""
+
+
+def box_mask(point_cloud: np.ndarray, min_corner: Vector3DType, max_corner: Vector3DType) -> np.ndarray:
+    """boolean mask of the points inside the axis-aligned box between min_corner and max_corner (inclusive)."""
+    mask = np.ones(len(point_cloud), dtype=bool)
+    for axis in range(3):
+        # per axis, to avoid (N,3) temporary arrays
+        coordinates = point_cloud[:, axis]
+        mask &= coordinates >= min_corner[axis]
+        mask &= coordinates <= max_corner[axis]
+    return mask
+
+
+def crop_box(point_cloud: np.ndarray, min_corner: Vector3DType, max_corner: Vector3DType) -> np.ndarray:
+    """Crops a point cloud to an axis-aligned box, e.g. the workspace of a robot."""
+    return point_cloud[box_mask(point_cloud, min_corner, max_corner)]
+
+
+def oriented_box_mask(point_cloud: np.ndarray, box_pose: HomogeneousMatrixType, box_size: Vector3DType) -> np.ndarray:
+    """boolean mask of the points inside an oriented box.
+
+    Args:
+        point_cloud: the point cloud.
+        box_pose: pose of the center of the box in the frame of the point cloud.
+        box_size: size of the box along its x, y and z axes.
+    """
+    # the positions of the points in the frame of the box: R^T (p - t)
+    points_in_box_frame = (point_cloud[:, :3] - box_pose[:3, 3]) @ box_pose[:3, :3]
+    half_size = np.asarray(box_size) / 2
+    return box_mask(points_in_box_frame, -half_size, half_size)
+
+
+def crop_oriented_box(point_cloud: np.ndarray, box_pose: HomogeneousMatrixType, box_size: Vector3DType) -> np.ndarray:
+    """Crops a point cloud to an oriented box, cf. oriented_box_mask."""
+    return point_cloud[oriented_box_mask(point_cloud, box_pose, box_size)]
+
+
+def voxel_downsample(point_cloud: np.ndarray, voxel_size: float) -> np.ndarray:
+    """Downsamples a point cloud by replacing all points in each voxel of a grid by their average.
+
+    The positions and all other columns (e.g. colors) are averaged. The voxels are indexed by a hash of their integer
+    coordinates, so this takes a few linear passes over the points (and a sort of the hashes for sparse clouds in large volumes).
+
+    Args:
+        point_cloud: (N,3+C) point cloud, points with non-finite (NaN or infinite) positions are dropped.
+        voxel_size: size of the voxels, in the units of the point cloud (usually meters).
+
+    Returns:
+        (M,3+C) point cloud with one point per occupied voxel, in the dtype of the input.
+    """
+    is_finite = _finite_mask(point_cloud)
+    if not is_finite.all():
+        point_cloud = point_cloud[is_finite]
+    if len(point_cloud) == 0:
+        return point_cloud.copy()
+
+    inverse, counts = _voxelize(point_cloud[:, :3], voxel_size)
+    n_voxels = len(counts)
+    downsampled_point_cloud = np.empty((n_voxels, point_cloud.shape[1]), dtype=point_cloud.dtype)
+    for column in range(point_cloud.shape[1]):
+        downsampled_point_cloud[:, column] = (
+            np.bincount(inverse, weights=point_cloud[:, column], minlength=n_voxels) / counts
+        )
+    return downsampled_point_cloud
+
+
+def _finite_mask(point_cloud: np.ndarray) -> np.ndarray:
+    """boolean mask of the points with finite positions, computed per axis like box_mask."""
+    mask = np.isfinite(point_cloud[:, 0])
+    for axis in range(1, 3):
+        mask &= np.isfinite(point_cloud[:, axis])
+    return mask
+
+
+def _voxelize(points: PointCloudType, voxel_size: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Assigns the (finite) points to the voxels of a grid.
+
+    Returns:
+        the index of the voxel of each point and the number of points in each voxel.
+    """
+    voxel_coordinates = []
+    grid_shape = []
+    for axis in range(3):
+        axis_coordinates = np.floor(points[:, axis] * (1.0 / voxel_size)).astype(np.int64)
+        axis_coordinates -= axis_coordinates.min()
+        voxel_coordinates.append(axis_coordinates)
+        grid_shape.append(int(axis_coordinates.max()) + 1)
+
+    # python ints, so that the size of the grid itself cannot overflow
+    grid_size = grid_shape[0] * grid_shape[1] * grid_shape[2]
+    if grid_size >= 2**63:
+        # the linear index would overflow int64 (e.g. for tiny voxels and far outliers), so the coordinates are sorted instead
+        _, inverse, counts = np.unique(
+            np.stack(voxel_coordinates, axis=1), axis=0, return_inverse=True, return_counts=True
+        )
+        return inverse.ravel(), counts
+
+    # the linear index in the grid is a perfect hash of the voxel coordinates, it is computed per axis (on contiguous columns),
+    # which is considerably faster than operating on the (N,3) array
+    hashes = voxel_coordinates[0]
+    for axis in range(1, 3):
+        hashes *= grid_shape[axis]
+        hashes += voxel_coordinates[axis]
+
+    if grid_size > _MAX_DENSE_VOXEL_GRID_SIZE_PER_POINT * len(points):
+        _, inverse, counts = np.unique(hashes, return_inverse=True, return_counts=True)
+        return inverse.ravel(), counts
+
+    # for compact grids, a lookup table avoids sorting the hashes
+    counts = np.bincount(hashes, minlength=grid_size)
+    occupied_voxels = np.flatnonzero(counts)
+    voxel_index_lookup = np.empty(grid_size, dtype=np.intp)
+    voxel_index_lookup[occupied_voxels] = np.arange(len(occupied_voxels))
+    return voxel_index_lookup[hashes], counts[occupied_voxels]
+
+
+def radius_outlier_mask(point_cloud: np.ndarray, radius: float, min_neighbors: int, workers: int = -1) -> np.ndarray:
+    """boolean mask of the inliers: the points that have at least min_neighbors other points within the radius.
+
+    Args:
+        workers: number of threads for the neighbor queries, -1 to use all cores.
+    """
+    tree = cKDTree(point_cloud[:, :3])
+    # the counts include the point itself
+    n_neighbors = tree.query_ball_point(point_cloud[:, :3], radius, workers=workers, return_length=True)
+    return n_neighbors > min_neighbors
+
+
+def remove_radius_outliers(
+    point_cloud: np.ndarray, radius: float, min_neighbors: int, workers: int = -1
+) -> np.ndarray:
+    """Removes the points with fewer than min_neighbors other points within the radius, cf. radius_outlier_mask."""
+    return point_cloud[radius_outlier_mask(point_cloud, radius, min_neighbors, workers)]
+
+
+def statistical_outlier_mask(
+    point_cloud: np.ndarray, n_neighbors: int = 20, std_ratio: float = 2.0, workers: int = -1
+) -> np.ndarray:
+    """boolean mask of the inliers of a statistical outlier test.
+
+    The mean distance of each point to its n_neighbors nearest neighbors is compared to the distribution of these
+    distances over all points: points for which it is larger than mean + std_ratio * std are outliers.
+
+    Args:
+        workers: number of threads for the neighbor queries, -1 to use all cores.
+    """
+    if len(point_cloud) <= n_neighbors:
+        return np.ones(len(point_cloud), dtype=bool)
+    tree = cKDTree(point_cloud[:, :3])
+    # the nearest neighbor of each point is the point itself
+    distances, _ = tree.query(point_cloud[:, :3], k=n_neighbors + 1, workers=workers)
+    mean_distances = distances[:, 1:].mean(axis=1)
+    return mean_distances <= mean_distances.mean() + std_ratio * mean_distances.std()
+
+
+def remove_statistical_outliers(
+    point_cloud: np.ndarray, n_neighbors: int = 20, std_ratio: float = 2.0, workers: int = -1
+) -> np.ndarray:
+    """Removes the outliers of a statistical outlier test, cf. statistical_outlier_mask."""
+    return point_cloud[statistical_outlier_mask(point_cloud, n_neighbors, std_ratio, workers)]
+
+
+@dataclass
+class PointCloudFilter:
+    """Crops, downsamples and removes outliers from point clouds in a single pass.
+
+    The operations are applied in order of increasing cost per point, so that each operation processes as few points as possible:
+    the masks of all crops are combined so that the points are only copied once, then the cropped cloud is downsampled
+    and finally the outliers are removed from the downsampled cloud (the neighbor queries are by far the most expensive).
+
+    Points with non-finite (NaN or infinite) positions, e.g. of pixels without depth, are always removed.
+    Operations that are None are skipped, e.g.
+
+        filter = PointCloudFilter(
+            min_corner=np.array([-0.5, -0.5, 0.0]), max_corner=np.array([0.5, 0.5, 0.5]), voxel_size=0.005
+        )
+        filtered_point_cloud = filter(camera.get_colored_point_cloud())
+    """
+
+    min_corner: Optional[Vector3DType] = None
+    max_corner: Optional[Vector3DType] = None
+    box_pose: Optional[HomogeneousMatrixType] = None
+    box_size: Optional[Vector3DType] = None
+    voxel_size: Optional[float] = None
+    outlier_radius: Optional[float] = None
+    min_neighbors: int = 5
+    """minimal number of neighbors within the outlier_radius for the radius outlier removal."""
+    n_neighbors: Optional[int] = None
+    """number of neighbors for the statistical outlier removal."""
+    std_ratio: float = 2.0
+
+    def __post_init__(self) -> None:
+        if (self.min_corner is None) != (self.max_corner is None):
+            raise ValueError("both the min and max corner of the box are required")
+        if (self.box_pose is None) != (self.box_size is None):
+            raise ValueError("both the pose and the size of the oriented box are required")
+
+    def __call__(self, point_cloud: np.ndarray) -> np.ndarray:
+        masks = []
+        if self.min_corner is not None and self.max_corner is not None:
+            masks.append(box_mask(point_cloud, self.min_corner, self.max_corner))
+        if self.box_pose is not None and self.box_size is not None:
+            masks.append(oriented_box_mask(point_cloud, self.box_pose, self.box_size))
+        if masks:
+            point_cloud = point_cloud[np.logical_and.reduce(masks)]
+        else:
+            # the crops already exclude the non-finite points, as all comparisons with NaN are False
+            is_finite = _finite_mask(point_cloud)
+            if not is_finite.all():
+                point_cloud = point_cloud[is_finite]
+
+        if self.voxel_size is not None:
+            point_cloud = voxel_downsample(point_cloud, self.voxel_size)
+        if self.outlier_radius is not None:
+            point_cloud = remove_radius_outliers(point_cloud, self.outlier_radius, self.min_neighbors)
+        if self.n_neighbors is not None:
+            point_cloud = remove_statistical_outliers(point_cloud, self.n_neighbors, self.std_ratio)
+        return point_cloud
+
+
+def _random_colored_point_cloud(n_points: int, rng: np.random.Generator) -> np.ndarray:
+    """points on a 2x2m table top with a few objects and some noise, similar to point clouds of a camera above a workspace."""
+    point_cloud = rng.random((n_points, 6), dtype=np.float32)
+    point_cloud[:, :2] = point_cloud[:, :2] * 2 - 1
+    point_cloud[:, 2] = rng.normal(0.0, 0.002, n_points)
+    on_objects = rng.random(n_points) < 0.3
+    point_cloud[on_objects, 2] += rng.random(np.count_nonzero(on_objects)) * 0.3
+    return point_cloud
+
+
+def _benchmark(n_points_list: Sequence[int] = (1_000_000, 2_000_000, 5_000_000), n_repeats: int = 3) -> None:
+    import time
+
+    rng = np.random.default_rng(2023)
+    operations: Dict[str, Callable[[np.ndarray], np.ndarray]] = {
+        "crop_box": lambda cloud: crop_box(cloud, np.array([-0.5, -0.5, -0.1]), np.array([0.5, 0.5, 0.5])),
+        "crop_oriented_box": lambda cloud: crop_oriented_box(cloud, np.eye(4), np.array([1.0, 1.0, 0.6])),
+        "voxel_downsample(5mm)": lambda cloud: voxel_downsample(cloud, 0.005),
+        "voxel_downsample(1cm)": lambda cloud: voxel_downsample(cloud, 0.01),
+        "filter(crop+5mm+statistical)": PointCloudFilter(
+            min_corner=np.array([-0.5, -0.5, -0.1]),
+            max_corner=np.array([0.5, 0.5, 0.5]),
+            voxel_size=0.005,
+            n_neighbors=10,
+        ),
+    }
+    for n_points in n_points_list:
+        point_cloud = _random_colored_point_cloud(n_points, rng)
+        for name, operation in operations.items():
+            durations = []
+            for _ in range(n_repeats):
+                start = time.perf_counter()
+                result = operation(point_cloud)
+                durations.append(time.perf_counter() - start)
+            print(f"{n_points:>9} points {name:>30}: {min(durations) * 1000:8.1f} ms -> {len(result):>9} points")
+
+
+if __name__ == "__main__":
+    _benchmark()
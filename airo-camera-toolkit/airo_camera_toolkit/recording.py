@@ -0,0 +1,278 @@
+"""Recording camera frames to disk, use `cameras.replay.ReplayCamera` to replay them through the camera interfaces.
+
+A recording is a directory with a metadata.json file (calibration and the shape and dtype of each modality,
+which are null for a recording without frames if the camera does not provide them) and, for each modality, a sequence of chunk files `<modality>_<chunk index>.bin` that each contain up to `chunk_size` frames
+as raw C-contiguous arrays. The chunks are memory-mapped when replaying, so frames are read from disk (or the page cache)
+without copies or decoding. The capture timestamps are stored as the "timestamp" modality.
+"""
+from __future__ import annotations
+
+import json
+import os
+import queue
+import threading
+from typing import Any, BinaryIO, Dict, List, Optional, Sequence
+
+import numpy as np
+from airo_camera_toolkit.camera_calibration import CameraCalibration
+from airo_camera_toolkit.interfaces import RGBDCamera
+from airo_camera_toolkit.snapshot import FrameSnapshot
+from airo_typing import CameraIntrinsicsMatrixType
+
+METADATA_FILENAME = "metadata.json"
+TIMESTAMP_MODALITY = "timestamp"
+
+
+def _chunk_path(path: str, modality: str, chunk_index: int) -> str:
+    return os.path.join(path, f"{modality}_{chunk_index:05d}.bin")
+
+
+class _ChunkWriter:
+    """Appends the frames of a single modality to consecutive chunk files."""
+
+    def __init__(self, path: str, modality: str, chunk_size: int) -> None:
+        self.path = path
+        self.modality = modality
+        self.chunk_size = chunk_size
+        self._chunk_index = -1
+        self._frames_in_chunk = chunk_size
+        self._file: Optional[BinaryIO] = None
+
+    def write(self, array: np.ndarray) -> None:
+        if self._frames_in_chunk == self.chunk_size:
+            self.close()
+            self._chunk_index += 1
+            self._file = open(_chunk_path(self.path, self.modality, self._chunk_index), "wb")
+            self._frames_in_chunk = 0
+        assert self._file is not None
+        self._file.write(np.ascontiguousarray(array).data)
+        self._frames_in_chunk += 1
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class FrameStore:
+    """Read-only access to the frames of a recording, cf. CameraRecorder.
+
+    Frames are returned as read-only views on the memory-mapped chunk files.
+    The calibration is None for a recording without frames of a camera that does not provide a calibration.
+    """
+
+    def __init__(self, path: str) -> None:
+        with open(os.path.join(path, METADATA_FILENAME)) as file:
+            metadata = json.load(file)
+        self.path = path
+        self.chunk_size: int = metadata["chunk_size"]
+        self.calibration: Optional[CameraCalibration] = None
+        if metadata["calibration"] is not None:
+            self.calibration = CameraCalibration.from_dict(metadata["calibration"])
+
+        self._chunks: Dict[str, List[np.ndarray]] = {}
+        for modality, description in metadata["modalities"].items():
+            if description is None:
+                # the recording has no frames, so the shape and dtype are unknown
+                self._chunks[modality] = []
+                continue
+            shape = tuple(description["shape"])
+            dtype = np.dtype(description["dtype"])
+            frame_size = int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+            chunks: List[np.ndarray] = []
+            chunk_index = 0
+            while os.path.exists(_chunk_path(path, modality, chunk_index)):
+                chunk_path = _chunk_path(path, modality, chunk_index)
+                # a recording that was interrupted can end with an incomplete frame, which is ignored
+                n_frames = os.path.getsize(chunk_path) // frame_size
+                if n_frames == 0:
+                    break
+                chunks.append(np.memmap(chunk_path, dtype=dtype, mode="r", shape=(n_frames,) + shape))
+                chunk_index += 1
+            self._chunks[modality] = chunks
+
+        # all modalities are written for each frame, but not necessarily flushed if the recording was interrupted
+        self._n_frames = min(sum(len(chunk) for chunk in chunks) for chunks in self._chunks.values())
+        self.timestamps = np.zeros(0, dtype=np.float64)
+        if self._n_frames > 0:
+            self.timestamps = np.concatenate(self._chunks[TIMESTAMP_MODALITY])[: self._n_frames]
+
+    @property
+    def modalities(self) -> Sequence[str]:
+        """the recorded modalities, without the timestamps."""
+        return tuple(modality for modality in self._chunks.keys() if modality != TIMESTAMP_MODALITY)
+
+    def __len__(self) -> int:
+        return self._n_frames
+
+    def get(self, modality: str, index: int) -> np.ndarray:
+        """Get a modality of a frame as a read-only view on the memory-mapped chunk file."""
+        if modality not in self._chunks:
+            raise ValueError(f"modality {modality} was not recorded, the recorded modalities are {self.modalities}")
+        if not 0 <= index < self._n_frames:
+            raise IndexError(f"frame {index} is out of range, the recording has {self._n_frames} frames")
+        # np.asarray drops the memmap subclass, the result is still a view on the mapped memory
+        return np.asarray(self._chunks[modality][index // self.chunk_size][index % self.chunk_size])
+
+
+class CameraRecorder:
+    """Records the frames of a camera to disk, in the format that is described in the module docstring.
+
+    Frames are captured on the calling thread and written to disk by a background writer thread,
+    so that the disk writes do not slow down the capture. If the writer falls behind by more than `queue_size` frames,
+    recording a frame blocks until there is room in the queue, so no frames are lost.
+    The writer thread does not access the camera: the calibration is read on construction and the metadata is written
+    on the calling thread, when the first frame is recorded or on close() if no frames were recorded.
+    """
+
+    def __init__(
+        self,
+        camera: RGBDCamera,
+        path: str,
+        modalities: Sequence[str] = ("rgb", "depth_map"),
+        chunk_size: int = 100,
+        queue_size: int = 30,
+    ) -> None:
+        """
+        Args:
+            camera: the camera to record.
+            path: directory to store the recording in, is created if it does not exist yet.
+            modalities: names of the modalities to record, cf. `Camera.capture()`.
+            chunk_size: number of frames per chunk file.
+            queue_size: maximal number of frames that wait to be written.
+        """
+        if TIMESTAMP_MODALITY in modalities:
+            raise ValueError(f"the {TIMESTAMP_MODALITY} modality is always recorded")
+        os.makedirs(path, exist_ok=True)
+        if os.path.exists(os.path.join(path, METADATA_FILENAME)):
+            raise FileExistsError(f"{path} already contains a recording")
+
+        self.camera = camera
+        self.path = path
+        self.modalities = tuple(modalities)
+        self.chunk_size = chunk_size
+        self.n_recorded_frames = 0
+
+        self._intrinsics_matrix: Optional[CameraIntrinsicsMatrixType] = None
+        try:
+            self._calibration: Optional[CameraCalibration] = camera.calibration
+        except NotImplementedError:
+            # the resolution is taken from the first frame
+            self._calibration = None
+            self._intrinsics_matrix = camera.intrinsics_matrix()
+        self._is_metadata_written = False
+        self._queue: queue.Queue[Optional[Dict[str, np.ndarray]]] = queue.Queue(maxsize=queue_size)
+        self._error: Optional[BaseException] = None
+        self._writer_thread = threading.Thread(target=self._write_frames, name="camera-recorder", daemon=True)
+        self._writer_thread.start()
+
+    def record_frame(self) -> FrameSnapshot:
+        """Capture a frame from the camera and queue it for writing, returns the snapshot of the frame."""
+        self._raise_writer_error()
+        if not self._writer_thread.is_alive():
+            raise RuntimeError("the recorder is closed")
+        snapshot = self.camera.capture()
+        # the modalities of a snapshot are copies, so they can be written after the camera grabs its next frame
+        data = {modality: snapshot[modality] for modality in self.modalities}
+        data[TIMESTAMP_MODALITY] = np.array(snapshot.timestamp, dtype=np.float64)
+        if not self._is_metadata_written:
+            self._write_metadata(data)
+        while True:
+            try:
+                self._queue.put(data, timeout=0.1)
+                break
+            except queue.Full:
+                # do not block forever if the writer thread stopped
+                self._raise_writer_error()
+        self.n_recorded_frames += 1
+        return snapshot
+
+    def record(self, n_frames: int) -> None:
+        for _ in range(n_frames):
+            self.record_frame()
+
+    def close(self) -> None:
+        """Wait until all queued frames are written and stop the writer thread."""
+        if self._writer_thread.is_alive():
+            self._queue.put(None)
+            self._writer_thread.join()
+        if not self._is_metadata_written:
+            # a recording without frames, which can still be opened with FrameStore
+            self._write_metadata(None)
+        self._raise_writer_error()
+
+    def __enter__(self) -> CameraRecorder:
+        return self
+
+    def __exit__(self, exc_type: Any, exc_value: Any, traceback: Any) -> None:
+        self.close()
+
+    def _raise_writer_error(self) -> None:
+        if self._error is not None:
+            raise RuntimeError("the writer thread of the recorder stopped with an exception") from self._error
+
+    def _write_metadata(self, data: Optional[Dict[str, np.ndarray]]) -> None:
+        """write the metadata, based on the first frame or on None if no frames were recorded."""
+        calibration = self._calibration
+        if calibration is None and data is not None:
+            assert self._intrinsics_matrix is not None
+            height, width = next(array for array in data.values() if array.ndim >= 2).shape[:2]
+            calibration = CameraCalibration((width, height), self._intrinsics_matrix)
+
+        modalities: Dict[str, Optional[Dict[str, Any]]] = {
+            modality: None for modality in self.modalities + (TIMESTAMP_MODALITY,)
+        }
+        if data is not None:
+            modalities = {
+                modality: {"shape": list(array.shape), "dtype": array.dtype.str} for modality, array in data.items()
+            }
+        metadata = {
+            "chunk_size": self.chunk_size,
+            "calibration": None if calibration is None else calibration.to_dict(),
+            "modalities": modalities,
+        }
+        with open(os.path.join(self.path, METADATA_FILENAME), "w") as file:
+            json.dump(metadata, file, indent=2)
+        self._is_metadata_written = True
+
+    def _write_frames(self) -> None:
+        writers = {
+            modality: _ChunkWriter(self.path, modality, self.chunk_size)
+            for modality in self.modalities + (TIMESTAMP_MODALITY,)
+        }
+        try:
+            while True:
+                data = self._queue.get()
+                if data is None:
+                    break
+                for modality, array in data.items():
+                    writers[modality].write(array)
+        except BaseException as e:  # noqa: B902 - propagate all errors to the recording thread
+            self._error = e
+        finally:
+            for writer in writers.values():
+                writer.close()
+
+
+if __name__ == "__main__":
+    """records a fake camera and replays the recording at full speed."""
+    import tempfile
+    import time
+
+    from airo_camera_toolkit.cameras.fake import FakeStereoRGBDCamera
+    from airo_camera_toolkit.cameras.replay import ReplayCamera
+
+    n_frames = 100
+    with tempfile.TemporaryDirectory() as recording_path:
+        with FakeStereoRGBDCamera(resolution=(1280, 720), fps=0) as camera:
+            with CameraRecorder(camera, recording_path) as recorder:
+                start = time.time()
+                recorder.record(n_frames)
+            print(f"recorded {n_frames} frames at {n_frames / (time.time() - start):.1f} fps")
+
+        replay_camera = ReplayCamera(recording_path, realtime=False)
+        start = time.time()
+        for _ in range(n_frames):
+            # the get_* methods return views on the memory-mapped recording, snapshots copy the modalities
+            replay_camera.get_rgb_image_as_int()
+        print(f"replayed {n_frames} frames at {n_frames / (time.time() - start):.1f} fps")
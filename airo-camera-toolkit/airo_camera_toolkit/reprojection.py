@@ -1,20 +1,27 @@
-from typing import Optional, Union
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional, Sequence, Tuple, Union
 
+import cv2
 import numpy as np
+from airo_camera_toolkit.camera_calibration import CameraCalibration, IntrinsicsType, get_intrinsics_matrix
 from airo_spatial_algebra.operations import _HomogeneousPoints
 from airo_typing import (
     CameraIntrinsicsMatrixType,
     HomogeneousMatrixType,
     NumpyDepthMapType,
+    NumpyFloatImageType,
+    NumpyIntImageType,
     Vector2DArrayType,
     Vector3DArrayType,
     Vector3DType,
 )
+from numpy.typing import DTypeLike
 
 
 def reproject_to_frame_z_plane(
     image_coords: Vector2DArrayType,
-    camera_intrinsics: CameraIntrinsicsMatrixType,
+    camera_intrinsics: IntrinsicsType,
     camera_in_frame_pose: HomogeneousMatrixType,
     height: float = 0.0,
 ) -> Vector3DArrayType:
@@ -24,30 +31,19 @@ def reproject_to_frame_z_plane(
     which is the case for 2D items (cloth!) or for rigid, known 3D objects with a fixed orientation.
 
     If the target frame is the world frame, the camera_in_frame_pose is the extrinsics matrix.
+    Use a Reprojector instead to reproject points of the same camera multiple times.
 
     Returns:
         positions in the world frame on the Z=height plane wrt to the frame.
     """
-    # convert to homogeneous coordinates and transpose to column vectors
-    homogeneous_coords = np.ones((image_coords.shape[0], 3))
-    homogeneous_coords[:, :2] = image_coords
-    homogeneous_coords = np.transpose(homogeneous_coords)
-
-    camera_frame_ray_vector = np.linalg.inv(camera_intrinsics) @ homogeneous_coords
-
-    translation = camera_in_frame_pose[0:3, 3]
-    rotation_matrix = camera_in_frame_pose[0:3, 0:3]
-
-    world_frame_ray_vectors = rotation_matrix @ camera_frame_ray_vector
-    world_frame_ray_vectors = np.transpose(world_frame_ray_vectors)
-    t = (height - translation[2]) / world_frame_ray_vectors[:, 2]
-    points = t[:, np.newaxis] * world_frame_ray_vectors + translation
-    return points
+    return Reprojector(camera_intrinsics, camera_in_frame_pose=camera_in_frame_pose).pixels_to_z_plane(
+        image_coords, height
+    )
 
 
 def reproject_to_frame(
     coordinates: Vector2DArrayType,
-    camera_intrinsics: CameraIntrinsicsMatrixType,
+    camera_intrinsics: IntrinsicsType,
     camera_in_frame_pose: HomogeneousMatrixType,
     depth_map: NumpyDepthMapType,
     mask_size: int = 11,
@@ -55,29 +51,15 @@ def reproject_to_frame(
 ) -> np.ndarray:
     """
     Reprojects coordinates on the image plane to a base frame, as defined by the camera in frame pose.
-    Args:
-    Returns: (3, N) np.array containing the coordinates of the point in the camera frame. Each column is a set of
-                coordinates.
-    """
-    # TODO: make this more generic for 2D as well  (HomogeneousPoints class)
-    homogeneous_coords = np.ones((coordinates.shape[0], 3))
-    homogeneous_coords[:, :2] = coordinates
-    homogeneous_coords = np.transpose(homogeneous_coords)
-    rays_in_camera_frame = (
-        np.linalg.inv(camera_intrinsics) @ homogeneous_coords
-    )  # shape is cast by numpy to column vector!
-
-    z_values_in_camera_frame = extract_depth_from_depthmap_heuristic(
-        coordinates, depth_map, mask_size, depth_percentile
-    )
+    The depth of each point is taken from the depth map with extract_depth_from_depthmap_heuristic.
 
-    t = z_values_in_camera_frame / rays_in_camera_frame[2, :]
+    Use a Reprojector instead to reproject points of the same camera multiple times.
 
-    positions_in_camera_frame = t * rays_in_camera_frame
-
-    homogeneous_positions_in_camera_frame = _HomogeneousPoints(positions_in_camera_frame.T).homogeneous_points.T
-    homogeneous_positions_in_frame = camera_in_frame_pose @ homogeneous_positions_in_camera_frame
-    return homogeneous_positions_in_frame[:3, ...].T
+    Returns: (N, 3) np.array containing the coordinates of the points in the frame.
+    """
+    return Reprojector(camera_intrinsics, camera_in_frame_pose=camera_in_frame_pose).pixels_to_3d(
+        depth_map, coordinates, mask_size, depth_percentile
+    )
 
 
 def extract_depth_from_depthmap_heuristic(
@@ -98,6 +80,10 @@ def extract_depth_from_depthmap_heuristic(
 
     Also note that this function assumes there are no negative infinity values (no objects closer than 30cm!)
 
+    Regions of points near the border of the depth map only contain the pixels inside the depth map, NaN values are ignored.
+    All regions are gathered and reduced in a single vectorized operation, use DepthHeuristicCache if the depth of many points
+    is queried on the same depth map.
+
     Returns:
         (np.ndarray) a 1D array of the depth values for the specified coordinates
     """
@@ -106,30 +92,125 @@ def extract_depth_from_depthmap_heuristic(
     assert (
         depth_percentile < 0.25
     ), "For straight corners, about 75 percent of the region will be background.. Are your sure you want the percentile to be lower?"
+    _check_coordinates_in_bounds(coordinates, depth_map)
+    depth_regions = _gather_depth_regions(coordinates.astype(np.intp), depth_map, mask_size)
+    return _nanquantile_of_rows(depth_regions, depth_percentile)
+
+
+def _check_coordinates_in_bounds(coordinates: Vector2DArrayType, depth_map: NumpyDepthMapType) -> None:
     # check all coordinates are within the size of the depth map to avoid unwanted wrapping of the array indices
     assert np.max(coordinates[:, 1]) < depth_map.shape[0], "V coordinates out of bounds"
     assert np.max(coordinates[:, 0]) < depth_map.shape[1], "U coordinates out of bounds"
     assert np.min(coordinates) >= 0, "coordinates out of bounds"
 
-    # convert coordinates to integers
-    coordinates = coordinates.astype(np.uint32)
 
-    # extract depth values by taking the percentile of the depth values in a region around the point
-    depth_regions = np.empty((coordinates.shape[0], (mask_size) ** 2))
-    for i in range(coordinates.shape[0]):
-        depth_region = depth_map[
-            coordinates[i, 1] - mask_size // 2 : coordinates[i, 1] + mask_size // 2 + 1,
-            coordinates[i, 0] - mask_size // 2 : coordinates[i, 0] + mask_size // 2 + 1,
-        ]
-        depth_regions[i, :] = depth_region.flatten()
-    depth_values = np.nanquantile(depth_regions, depth_percentile, axis=1)
+def filter_depth_map_heuristic(depth_map: NumpyDepthMapType, mask_size: int = 11, median_size: int = 5) -> np.ndarray:
+    """A per-pixel approximation of extract_depth_from_depthmap_heuristic for all pixels of the depth map at once.
+
+    Instead of a low percentile of the (mask_size x mask_size) region, this takes the minimum of the region
+    after a (median_size x median_size) median filter, which removes the isolated noisy pixels that the percentile ignores.
+    Both steps are OpenCV filters, which take a few tens of milliseconds for a 2K depth map, whereas an exact percentile filter
+    takes seconds. Regions of points near the border only contain the pixels inside the depth map, NaN values are ignored.
+
+    Args:
+        median_size: 3 or 5, the sizes for which OpenCV supports median filters of float images.
+
+    Returns:
+        (H,W) float32 array with the filtered depth of each pixel, NaN for pixels without valid depth in their region.
+    """
+    assert mask_size % 2, "only odd sized markers allowed"
+    assert median_size in (3, 5), "OpenCV only supports median filters of size 3 or 5 for float images"
+    # invalid values are set to infinity, so that the minimum ignores them (as does the default border value of erode)
+    filtered_depth_map = np.where(np.isfinite(depth_map), depth_map, np.inf).astype(np.float32)
+    filtered_depth_map = cv2.medianBlur(filtered_depth_map, median_size)
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (mask_size, mask_size))
+    filtered_depth_map = cv2.erode(filtered_depth_map, kernel, borderType=cv2.BORDER_CONSTANT, borderValue=np.inf)
+    filtered_depth_map[np.isinf(filtered_depth_map)] = np.nan
+    return filtered_depth_map
+
+
+def _gather_depth_regions(coordinates: np.ndarray, depth_map: NumpyDepthMapType, mask_size: int) -> np.ndarray:
+    """Gather the (mask_size x mask_size) region around each (u,v) coordinate in a single indexing operation.
+
+    Returns:
+        (N, mask_size**2) float array, pixels of the regions that fall outside of the depth map are NaN.
+    """
+    height, width = depth_map.shape[:2]
+    offsets = np.arange(mask_size) - mask_size // 2
+    # (N, mask_size, 1) rows and (N, 1, mask_size) columns, which broadcast to the (N, mask_size, mask_size) regions
+    rows = coordinates[:, 1, np.newaxis, np.newaxis] + offsets[np.newaxis, :, np.newaxis]
+    columns = coordinates[:, 0, np.newaxis, np.newaxis] + offsets[np.newaxis, np.newaxis, :]
+    is_outside = (rows < 0) | (rows >= height) | (columns < 0) | (columns >= width)
+
+    regions = depth_map[np.clip(rows, 0, height - 1), np.clip(columns, 0, width - 1)].astype(np.float64)
+    regions[is_outside] = np.nan
+    return regions.reshape(coordinates.shape[0], mask_size**2)
+
+
+def _nanquantile_of_rows(values: np.ndarray, quantile: float) -> np.ndarray:
+    """Same as np.nanquantile(values, quantile, axis=1) (with linear interpolation), but vectorized over the rows.
+    np.nanquantile loops over the rows in python as soon as there is a NaN value in the array."""
+    sorted_values = np.sort(values, axis=1)  # NaNs are sorted to the end
+    n_valid = np.count_nonzero(~np.isnan(values), axis=1)
+    position = quantile * (np.maximum(n_valid, 1) - 1)
+    lower_index = np.floor(position).astype(np.intp)
+    upper_index = np.minimum(lower_index + 1, np.maximum(n_valid - 1, 0))
+    lower = np.take_along_axis(sorted_values, lower_index[:, np.newaxis], axis=1)[:, 0]
+    upper = np.take_along_axis(sorted_values, upper_index[:, np.newaxis], axis=1)[:, 0]
+    quantiles = lower + (upper - lower) * (position - lower_index)
+    # rows without any valid value
+    quantiles[n_valid == 0] = np.nan
+    return quantiles
 
-    return depth_values
+
+class DepthHeuristicCache:
+    """Caches the depth heuristic for a depth map, per pixel.
+
+    Use this when the depth of many (possibly overlapping) sets of points is queried on the same depth map,
+    e.g. dense keypoints of multiple detectors. By default, the exact results of extract_depth_from_depthmap_heuristic are
+    memoized: only pixels that were not queried before are computed, so this only helps if pixels are queried repeatedly.
+    With precompute=True, the filtered depth of all pixels is computed up front with filter_depth_map_heuristic,
+    after which each query is a single lookup. This is faster as soon as more than a few thousand distinct pixels are queried
+    (e.g. about 50 ms for a 2K depth map, compared to 3 ms per 1000 points), but it approximates the percentile.
+    The depth map should not be modified while the cache is used.
+    """
+
+    def __init__(
+        self,
+        depth_map: NumpyDepthMapType,
+        mask_size: int = 11,
+        depth_percentile: float = 0.05,
+        precompute: bool = False,
+    ) -> None:
+        self.depth_map = depth_map
+        self.mask_size = mask_size
+        self.depth_percentile = depth_percentile
+        if precompute:
+            self._depths = filter_depth_map_heuristic(depth_map, mask_size)
+            self._is_cached = np.ones(depth_map.shape[:2], dtype=bool)
+        else:
+            self._depths = np.full(depth_map.shape[:2], np.nan)
+            self._is_cached = np.zeros(depth_map.shape[:2], dtype=bool)
+
+    def extract_depth(self, coordinates: Vector2DArrayType) -> np.ndarray:
+        """the same as extract_depth_from_depthmap_heuristic(coordinates, depth_map, mask_size, depth_percentile),
+        or filter_depth_map_heuristic if the cache was precomputed."""
+        _check_coordinates_in_bounds(coordinates, self.depth_map)
+        pixels = coordinates.astype(np.intp)
+        is_new = ~self._is_cached[pixels[:, 1], pixels[:, 0]]
+        if np.any(is_new):
+            new_pixels = np.unique(pixels[is_new], axis=0)
+            depths = extract_depth_from_depthmap_heuristic(
+                new_pixels, self.depth_map, self.mask_size, self.depth_percentile
+            )
+            self._depths[new_pixels[:, 1], new_pixels[:, 0]] = depths
+            self._is_cached[new_pixels[:, 1], new_pixels[:, 0]] = True
+        return self._depths[pixels[:, 1], pixels[:, 0]]
 
 
 def project_frame_to_image_plane(
     positions_in_frame: Union[Vector3DArrayType, Vector3DType],
-    camera_matrix: CameraIntrinsicsMatrixType,
+    camera_matrix: IntrinsicsType,
     frame_to_camera_transform: Optional[HomogeneousMatrixType] = None,
 ) -> Vector2DArrayType:
     """Projects an array of points from a 3D world frame to the 2D image plane.
@@ -139,6 +220,8 @@ def project_frame_to_image_plane(
 
     Projecting from the camera frame is also a special case, in this case the frame_to_camera_transform is the identity matrix.
     If no is given, this function assumes that the points are already in the camera frame.
+
+    If the camera_matrix is a CameraCalibration with distortion coefficients, the points are projected onto the distorted image.
     """
     # TODO: should we add assert statements to validate the input?
 
@@ -150,8 +233,395 @@ def project_frame_to_image_plane(
     homogeneous_positions_in_world_frame = _HomogeneousPoints(positions_in_frame).homogeneous_points
     homogeneous_positions_in_world_frame = homogeneous_positions_in_world_frame.T
     homogeneous_positions_in_camera_frame = frame_to_camera_transform @ homogeneous_positions_in_world_frame
-    homogeneous_positions_on_image_plane = camera_matrix @ homogeneous_positions_in_camera_frame[:3, ...]
+    homogeneous_positions_on_image_plane = (
+        get_intrinsics_matrix(camera_matrix) @ homogeneous_positions_in_camera_frame[:3, ...]
+    )
     positions_on_image_plane = (
         homogeneous_positions_on_image_plane[:2, ...] / homogeneous_positions_on_image_plane[2, ...]
     )
-    return positions_on_image_plane.T
+    return distort_pixels(positions_on_image_plane.T, camera_matrix)
+
+
+def _get_distortion_coefficients(camera_intrinsics: IntrinsicsType) -> Optional[np.ndarray]:
+    """the distortion coefficients of a calibration, None if the calibration has no distortion or for intrinsics matrices."""
+    if isinstance(camera_intrinsics, CameraCalibration) and camera_intrinsics.has_distortion:
+        return camera_intrinsics.distortion_coefficients
+    return None
+
+
+_UNDISTORTION_CRITERIA = (cv2.TERM_CRITERIA_COUNT | cv2.TERM_CRITERIA_EPS, 20, 1e-8)
+"""termination criteria of the iterative undistortion, the default 5 iterations are not precise for strong distortion."""
+
+
+def undistort_pixels(pixels: Vector2DArrayType, camera_intrinsics: IntrinsicsType) -> Vector2DArrayType:
+    """Maps (u,v) pixels of the distorted image to the image of the ideal pinhole camera with the same intrinsics matrix.
+
+    The pixels are returned as is if the intrinsics have no distortion (cf. CameraCalibration.has_distortion).
+    """
+    distortion_coefficients = _get_distortion_coefficients(camera_intrinsics)
+    if distortion_coefficients is None:
+        return pixels
+    intrinsics_matrix = get_intrinsics_matrix(camera_intrinsics)
+    distorted_pixels = np.asarray(pixels, dtype=np.float64).reshape(-1, 1, 2)
+    undistorted_pixels = cv2.undistortPointsIter(
+        distorted_pixels,
+        intrinsics_matrix,
+        distortion_coefficients,
+        R=None,
+        P=intrinsics_matrix,
+        criteria=_UNDISTORTION_CRITERIA,
+    )
+    return undistorted_pixels.reshape(-1, 2)
+
+
+def distort_pixels(pixels: Vector2DArrayType, camera_intrinsics: IntrinsicsType) -> Vector2DArrayType:
+    """Maps (u,v) pixels of the ideal pinhole camera to the distorted image, the inverse of undistort_pixels."""
+    distortion_coefficients = _get_distortion_coefficients(camera_intrinsics)
+    if distortion_coefficients is None:
+        return pixels
+    intrinsics_matrix = np.asarray(get_intrinsics_matrix(camera_intrinsics), dtype=np.float64)
+    pixels = np.asarray(pixels, dtype=np.float64).reshape(-1, 2)
+    # the intrinsics matrix is upper triangular, so the normalized coordinates are solved for without inverting it
+    (fx, skew, cx), (_, fy, cy) = intrinsics_matrix[:2]
+    normalized_coordinates = np.empty_like(pixels)
+    normalized_coordinates[:, 1] = (pixels[:, 1] - cy) / fy
+    normalized_coordinates[:, 0] = (pixels[:, 0] - cx - skew * normalized_coordinates[:, 1]) / fx
+    return distort_normalized_coordinates(normalized_coordinates, intrinsics_matrix, distortion_coefficients)
+
+
+def distort_normalized_coordinates(
+    normalized_coordinates: Vector2DArrayType,
+    intrinsics_matrix: CameraIntrinsicsMatrixType,
+    distortion_coefficients: np.ndarray,
+) -> Vector2DArrayType:
+    """Projects (x,y) normalized image coordinates, i.e. the rays (x,y,1) in the camera frame, onto the distorted image."""
+    rays = np.ones((len(normalized_coordinates), 3))
+    rays[:, :2] = normalized_coordinates
+    distorted_pixels, _ = cv2.projectPoints(rays, np.zeros(3), np.zeros(3), intrinsics_matrix, distortion_coefficients)
+    return distorted_pixels.reshape(-1, 2)
+
+
+@dataclass
+class MultiCameraProjection:
+    """Projections of M points into N cameras, cf. project_frame_to_image_planes."""
+
+    pixels: np.ndarray
+    """(N, M, 2) (u,v) coordinates of the points on the image plane of each camera (NaN for points in the camera plane)."""
+    depths: np.ndarray
+    """(N, M) z-coordinates of the points in the camera frames."""
+    is_in_front: np.ndarray
+    """(N, M) boolean mask of the points in front of each camera."""
+    is_in_frustum: np.ndarray
+    """(N, M) boolean mask of the points in front of each camera that project inside its image."""
+    is_visible: Optional[np.ndarray] = None
+    """(N, M) boolean mask of the points in the frustum that are not occluded according to the depth maps,
+    None if no depth maps were given."""
+
+    def cameras_that_see(self, point_index: int) -> np.ndarray:
+        """indices of the cameras that see a point, using the occlusion test if depth maps were given."""
+        mask = self.is_visible if self.is_visible is not None else self.is_in_frustum
+        return np.flatnonzero(mask[:, point_index])
+
+
+def project_frame_to_image_planes(
+    positions_in_frame: Vector3DArrayType,
+    camera_intrinsics: Sequence[IntrinsicsType],
+    frame_to_camera_transforms: Union[Sequence[HomogeneousMatrixType], np.ndarray],
+    resolutions: Optional[Sequence[Tuple[int, int]]] = None,
+    depth_maps: Optional[Sequence[NumpyDepthMapType]] = None,
+    depth_tolerance: float = 0.01,
+) -> MultiCameraProjection:
+    """Projects M points from a 3D frame to the image planes of N cameras at once, cf. project_frame_to_image_plane.
+
+    The transforms and projections of all points into all cameras are computed in a single batched operation,
+    only the distortion of CameraCalibrations with distortion coefficients is applied per camera.
+    Next to the pixel coordinates, this determines which points are in front of each camera and inside its image.
+    If depth maps are given, points in the frustum are also tested for occlusion against the depth map of the camera (z-buffer):
+    a point is occluded if the depth map has a valid depth at its pixel that is smaller than the depth of the point.
+
+    Args:
+        positions_in_frame: (M, 3) points in the frame.
+        camera_intrinsics: the intrinsics matrices of the N cameras.
+        frame_to_camera_transforms: the N (4, 4) poses of the frame in the camera frames, i.e. the inverse extrinsics matrices.
+        resolutions: (width, height) of the images of the cameras, required for the frustum masks unless the intrinsics
+            are CameraCalibrations or depth maps are given.
+        depth_maps: optional (H,W) depth maps of the cameras for the occlusion test.
+        depth_tolerance: distance (in meters) that a point can be behind the depth map and still be considered visible,
+            to account for noise on the depth maps and for points on the surface.
+
+    Returns:
+        MultiCameraProjection with the pixel coordinates, depths and visibility masks.
+    """
+    n_cameras = len(camera_intrinsics)
+    if len(frame_to_camera_transforms) != n_cameras:
+        raise ValueError("the number of transforms does not match the number of cameras")
+    if depth_maps is not None and len(depth_maps) != n_cameras:
+        raise ValueError("the number of depth maps does not match the number of cameras")
+    calibrations = [intrinsics for intrinsics in camera_intrinsics if isinstance(intrinsics, CameraCalibration)]
+    if resolutions is None:
+        if depth_maps is not None:
+            resolutions = [(depth_map.shape[1], depth_map.shape[0]) for depth_map in depth_maps]
+        elif len(calibrations) == n_cameras:
+            resolutions = [calibration.resolution for calibration in calibrations]
+        else:
+            raise ValueError(
+                "the resolutions of the cameras are required to determine which points are in their frustum"
+            )
+
+    points = np.asarray(positions_in_frame, dtype=np.float64).reshape(-1, 3)
+    intrinsics_matrices = np.stack([get_intrinsics_matrix(intrinsics) for intrinsics in camera_intrinsics])
+    transforms = np.asarray(frame_to_camera_transforms, dtype=np.float64)
+
+    # (N, M, 3) points in the camera frames and on the (homogeneous) image planes
+    points_in_cameras = np.einsum("nij,mj->nmi", transforms[:, :3, :3], points) + transforms[:, np.newaxis, :3, 3]
+    projections = np.einsum("nij,nmj->nmi", intrinsics_matrices, points_in_cameras)
+    depths = points_in_cameras[..., 2]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pixels = projections[..., :2] / projections[..., 2:]
+
+    for camera_index, intrinsics in enumerate(camera_intrinsics):
+        if _get_distortion_coefficients(intrinsics) is not None:
+            is_finite = np.isfinite(pixels[camera_index]).all(axis=-1)
+            pixels[camera_index, is_finite] = distort_pixels(pixels[camera_index, is_finite], intrinsics)
+
+    sizes = np.array(resolutions, dtype=np.float64)[:, np.newaxis, :]
+    is_in_front = depths > 0
+    with np.errstate(invalid="ignore"):
+        is_in_frustum = is_in_front & np.all((pixels >= 0) & (pixels < sizes), axis=-1)
+
+    is_visible = None
+    if depth_maps is not None:
+        is_visible = is_in_frustum.copy()
+        for camera_index, depth_map in enumerate(depth_maps):
+            point_indices = np.flatnonzero(is_in_frustum[camera_index])
+            pixel_indices = pixels[camera_index, point_indices].astype(np.intp)
+            map_depths = depth_map[pixel_indices[:, 1], pixel_indices[:, 0]]
+            with np.errstate(invalid="ignore"):
+                # pixels without a valid depth (NaN, inf or <= 0) do not occlude anything
+                is_occluded = np.isfinite(map_depths) & (map_depths > 0)
+                is_occluded &= depths[camera_index, point_indices] > map_depths + depth_tolerance
+            is_visible[camera_index, point_indices[is_occluded]] = False
+
+    return MultiCameraProjection(pixels, depths, is_in_front, is_in_frustum, is_visible)
+
+
+def get_pixel_ray_grid(
+    camera_intrinsics: IntrinsicsType, resolution: Tuple[int, int], dtype: DTypeLike = np.float32
+) -> np.ndarray:
+    """Get the rays through all pixels of the image plane, scaled to z=1 in the camera frame.
+
+    Multiplying this grid with a depth map gives the 3D positions of all pixels in the camera frame.
+    The grid is cached per (intrinsics, resolution, dtype), so only the first call for a camera allocates memory.
+
+    Args:
+        camera_intrinsics: the intrinsics matrix of the camera, the rays of a CameraCalibration with distortion coefficients
+            go through the pixels of the distorted image.
+        resolution: (width, height) of the image.
+        dtype: dtype of the grid.
+
+    Returns:
+        (H,W,3) read-only array with the ray (x,y,1) of each pixel.
+    """
+    intrinsics_matrix = get_intrinsics_matrix(camera_intrinsics)
+    distortion_coefficients = _get_distortion_coefficients(camera_intrinsics)
+    return _get_pixel_ray_grid(
+        tuple(np.asarray(intrinsics_matrix, dtype=np.float64).ravel()),
+        resolution,
+        np.dtype(dtype),
+        tuple(distortion_coefficients) if distortion_coefficients is not None else None,
+    )
+
+
+@lru_cache(maxsize=16)
+def _get_pixel_ray_grid(
+    camera_intrinsics: Tuple[float, ...],
+    resolution: Tuple[int, int],
+    dtype: np.dtype,
+    distortion_coefficients: Optional[Tuple[float, ...]] = None,
+) -> np.ndarray:
+    width, height = resolution
+    intrinsics = np.array(camera_intrinsics).reshape(3, 3)
+    u, v = np.meshgrid(np.arange(width), np.arange(height))
+    if distortion_coefficients is not None:
+        # the normalized image coordinates (x,y) of the undistorted pixels are the rays (x,y,1)
+        pixels = np.stack([u, v], axis=-1).reshape(-1, 1, 2).astype(np.float64)
+        normalized_coords = cv2.undistortPointsIter(
+            pixels, intrinsics, np.array(distortion_coefficients), None, None, _UNDISTORTION_CRITERIA
+        )
+        rays = np.ones((3, width * height))
+        rays[:2] = normalized_coords.reshape(-1, 2).T
+    else:
+        homogeneous_coords = np.stack([u, v, np.ones_like(u)], axis=-1).reshape(-1, 3).T
+        rays = np.linalg.inv(intrinsics) @ homogeneous_coords
+        rays = rays / rays[2, :]
+    grid = np.ascontiguousarray(rays.T.reshape(height, width, 3), dtype=dtype)
+    # the grid is shared between all callers, so make sure nobody can alter it.
+    grid.flags.writeable = False
+    return grid
+
+
+def unproject_depth_map(
+    depth_map: NumpyDepthMapType,
+    camera_intrinsics: IntrinsicsType,
+    rgb_image: Optional[Union[NumpyFloatImageType, NumpyIntImageType]] = None,
+    organized: bool = False,
+    stride: int = 1,
+    roi: Optional[Tuple[int, int, int, int]] = None,
+    dtype: DTypeLike = np.float32,
+) -> np.ndarray:
+    """Unproject all pixels of a depth map to (colored) points in the camera frame.
+
+    This takes a single multiplication of the depth map with the cached pixel ray grid (cf. get_pixel_ray_grid).
+
+    Args:
+        depth_map: (H,W) depth map, pixels without a valid depth should be NaN, inf or <= 0.
+        camera_intrinsics: the intrinsics matrix of the camera.
+        rgb_image: optional (H,W,3) RGB image that is aligned with the depth map, in uint8 or float (0-1) format.
+        organized: if True, return an (h,w,3/6) array with NaN for all invalid pixels,
+            otherwise return an (N,3/6) array with only the valid pixels.
+        stride: only use every stride-th pixel in both directions.
+        roi: optional region of interest (x, y, w, h) in pixels, with the same convention as the Crop transform.
+        dtype: dtype of the points, float32 is half the size and usually precise enough.
+
+    Returns:
+        the points (x,y,z) or colored points (x,y,z,r,g,b) with colors in the range [0, 1].
+    """
+    height, width = depth_map.shape[:2]
+    rays = get_pixel_ray_grid(camera_intrinsics, (width, height), dtype)
+
+    x, y, w, h = roi if roi is not None else (0, 0, width, height)
+    region = (slice(y, y + h, stride), slice(x, x + w, stride))
+    rays = rays[region]
+    depths = depth_map[region]
+
+    n_channels = 3 if rgb_image is None else 6
+    points = np.empty((*rays.shape[:2], n_channels), dtype=dtype)
+    np.multiply(rays, depths[..., np.newaxis], out=points[..., :3])
+    if rgb_image is not None:
+        colors = rgb_image[region]
+        if np.issubdtype(colors.dtype, np.integer):
+            np.multiply(colors, 1 / 255.0, out=points[..., 3:], casting="unsafe")
+        else:
+            points[..., 3:] = colors
+
+    with np.errstate(invalid="ignore"):
+        valid = np.isfinite(depths) & (depths > 0)
+    if organized:
+        points[~valid, :3] = np.nan
+        return points
+    return points[valid]
+
+
+class Reprojector:
+    """Reprojects pixels of a camera to 3D, with everything that only depends on the camera computed once.
+
+    The inverse of the intrinsics matrix (combined with the rotation of the camera pose) and the ray through each pixel
+    are computed on construction, so reprojecting a batch of pixels takes a single matrix multiplication
+    and no matrix inversions, which makes this the preferred option for reprojecting points of a camera in a loop.
+
+    The points are expressed in the frame of the camera_in_frame_pose, or in the camera frame if no pose is given.
+    The pose can be updated (e.g. for a camera on a robot arm) without recomputing the inverse intrinsics.
+
+    If the intrinsics are a CameraCalibration with distortion coefficients, the pixels are undistorted before reprojecting.
+    The ray table takes the distortion into account as well, so reprojecting depth maps remains a single multiplication.
+    Alternatively, the images can be undistorted first with an Undistorter (see undistortion.py), whose calibration has no distortion.
+    """
+
+    def __init__(
+        self,
+        camera_intrinsics: IntrinsicsType,
+        resolution: Optional[Tuple[int, int]] = None,
+        camera_in_frame_pose: Optional[HomogeneousMatrixType] = None,
+    ) -> None:
+        """
+        Args:
+            camera_intrinsics: the intrinsics matrix of the camera.
+            resolution: (width, height) of the images, required for the pixel ray table that is used to reproject
+                entire depth maps. Defaults to the resolution of the calibration if the intrinsics are a CameraCalibration.
+            camera_in_frame_pose: pose of the camera in the frame to reproject to, e.g. the extrinsics matrix for the world frame.
+        """
+        if resolution is None and isinstance(camera_intrinsics, CameraCalibration):
+            resolution = camera_intrinsics.resolution
+        self.camera_intrinsics = camera_intrinsics
+        self.intrinsics_matrix = np.array(get_intrinsics_matrix(camera_intrinsics), dtype=np.float64)
+        self.inverse_intrinsics_matrix = np.linalg.inv(self.intrinsics_matrix)
+        self.resolution = resolution
+        # (H,W,3) rays through all pixels in the camera frame
+        self.ray_table = get_pixel_ray_grid(camera_intrinsics, resolution) if resolution is not None else None
+        self.camera_in_frame_pose = camera_in_frame_pose
+
+    @property
+    def camera_in_frame_pose(self) -> Optional[HomogeneousMatrixType]:
+        return self._camera_in_frame_pose
+
+    @camera_in_frame_pose.setter
+    def camera_in_frame_pose(self, camera_in_frame_pose: Optional[HomogeneousMatrixType]) -> None:
+        self._camera_in_frame_pose = camera_in_frame_pose
+        if camera_in_frame_pose is None:
+            self._pixel_to_ray_matrix = self.inverse_intrinsics_matrix
+            self.camera_position = np.zeros(3)
+        else:
+            self._pixel_to_ray_matrix = camera_in_frame_pose[:3, :3] @ self.inverse_intrinsics_matrix
+            self.camera_position = np.array(camera_in_frame_pose[:3, 3], dtype=np.float64)
+        # the ray table in the frame is only computed when a depth map is reprojected with this pose
+        self._frame_ray_table: Optional[np.ndarray] = None
+
+    def pixels_to_rays(self, pixels: Vector2DArrayType) -> Vector3DArrayType:
+        """Get the rays from the camera through the (u,v) pixels, expressed in the frame.
+
+        The rays are scaled to z=1 in the camera frame, so the point at depth d on a ray is camera_position + d * ray.
+
+        Returns:
+            (N, 3) array with the direction of each ray.
+        """
+        pixels = np.asarray(undistort_pixels(pixels, self.camera_intrinsics), dtype=np.float64)
+        # equivalent to (M @ [u, v, 1]^T)^T without building the homogeneous coordinates
+        return pixels @ self._pixel_to_ray_matrix[:, :2].T + self._pixel_to_ray_matrix[:, 2]
+
+    def pixels_to_z_plane(self, pixels: Vector2DArrayType, height: float = 0.0) -> Vector3DArrayType:
+        """Reprojects pixels to the Z=height plane of the frame, cf. reproject_to_frame_z_plane.
+
+        Returns:
+            (N, 3) array with the positions on the plane.
+        """
+        rays = self.pixels_to_rays(pixels)
+        t = (height - self.camera_position[2]) / rays[:, 2]
+        return t[:, np.newaxis] * rays + self.camera_position
+
+    def pixels_to_3d(
+        self,
+        depth_map: NumpyDepthMapType,
+        pixels: Optional[Vector2DArrayType] = None,
+        mask_size: int = 11,
+        depth_percentile: float = 0.05,
+    ) -> np.ndarray:
+        """Reprojects pixels to 3D using the depth map.
+
+        Args:
+            depth_map: (H,W) depth map of the camera.
+            pixels: (N, 2) array of (u,v) pixels, for which the depth is taken with extract_depth_from_depthmap_heuristic
+                (with mask_size and depth_percentile), cf. reproject_to_frame.
+                If None, all pixels of the depth map are reprojected with the ray table (requires the resolution).
+
+        Returns:
+            (N, 3) array with the positions of the pixels, or the (H,W,3) float32 positions of all pixels
+            if no pixels are given. Pixels without a valid depth are reprojected as is (NaN, inf, or onto the camera position).
+        """
+        if pixels is not None:
+            depths = extract_depth_from_depthmap_heuristic(pixels, depth_map, mask_size, depth_percentile)
+            return self.pixels_to_rays(pixels) * depths[:, np.newaxis] + self.camera_position
+
+        if self.ray_table is None:
+            raise ValueError("the resolution of the Reprojector is required to reproject entire depth maps")
+        if depth_map.shape[:2] != self.ray_table.shape[:2]:
+            raise ValueError(
+                f"depth map of shape {depth_map.shape[:2]} does not match the resolution {self.resolution} of the Reprojector"
+            )
+        if self._camera_in_frame_pose is None:
+            return self.ray_table * depth_map[..., np.newaxis]
+        if self._frame_ray_table is None:
+            rotation = self._camera_in_frame_pose[:3, :3].astype(self.ray_table.dtype)
+            self._frame_ray_table = self.ray_table @ rotation.T
+        points = self._frame_ray_table * depth_map[..., np.newaxis]
+        points += self.camera_position.astype(points.dtype)
+        return points
@@ -0,0 +1,94 @@
+"""Lazy snapshots of a single grabbed frame, see `Camera.capture()`."""
+from __future__ import annotations
+
+from typing import Callable, Dict, Optional, Sequence
+
+import numpy as np
+from airo_camera_toolkit.utils import ImageConverter
+from airo_typing import ColoredPointCloudType, NumpyDepthMapType, NumpyFloatImageType, NumpyIntImageType
+
+
+class FrameSnapshot:
+    """All modalities of a single grabbed frame.
+
+    Each modality is retrieved from the memory buffer of the camera on first access and memoized,
+    so that each retrieval happens at most once per grab and all modalities are guaranteed to come from the same frame.
+
+    The retrieved arrays are copied, as camera SDKs often reuse their memory buffers for subsequent retrievals.
+    Modalities that were not accessed before the camera grabs its next frame can no longer be retrieved,
+    accessing them raises a RuntimeError.
+    """
+
+    def __init__(
+        self,
+        retrievers: Dict[str, Callable[[], np.ndarray]],
+        is_current_frame: Callable[[], bool],
+        timestamp: float,
+        data: Optional[Dict[str, np.ndarray]] = None,
+    ) -> None:
+        """
+        Args:
+            retrievers: maps each modality name to a function that retrieves it from the memory buffer of the camera.
+            is_current_frame: returns False once the camera has grabbed a new frame.
+            timestamp: capture time of the frame, cf. Camera._retrieve_timestamp().
+            data: modalities that are already available, e.g. from the buffer of the acquisition thread.
+        """
+        self._retrievers = retrievers
+        self._is_current_frame = is_current_frame
+        self.timestamp = timestamp
+        self._data: Dict[str, np.ndarray] = dict(data) if data is not None else {}
+
+    def _get(self, modality: str) -> np.ndarray:
+        if modality in self._data:
+            return self._data[modality]
+        if modality not in self._retrievers:
+            raise ValueError(f"modality {modality} is not available for this camera (or with its current settings)")
+        if not self._is_current_frame():
+            raise RuntimeError(
+                f"cannot retrieve {modality}, the camera has grabbed a new frame since this snapshot was captured"
+            )
+        self._data[modality] = np.array(self._retrievers[modality]())
+        return self._data[modality]
+
+    def __getitem__(self, modality: str) -> np.ndarray:
+        """Access a modality by its name, e.g. snapshot["depth_map"]."""
+        return self._get(modality)
+
+    def retrieve(self, modalities: Sequence[str]) -> None:
+        """Retrieve the modalities now instead of on first access, e.g. to retrieve them in a worker thread."""
+        for modality in modalities:
+            self._get(modality)
+
+    @property
+    def rgb_image_as_int(self) -> NumpyIntImageType:
+        return self._get("rgb")
+
+    @property
+    def rgb_image(self) -> NumpyFloatImageType:
+        if "rgb_float" not in self._data:
+            self._data["rgb_float"] = ImageConverter.from_numpy_int_format(self.rgb_image_as_int).image_in_numpy_format
+        return self._data["rgb_float"]
+
+    @property
+    def right_rgb_image_as_int(self) -> NumpyIntImageType:
+        return self._get("rgb_right")
+
+    @property
+    def right_rgb_image(self) -> NumpyFloatImageType:
+        if "rgb_right_float" not in self._data:
+            self._data["rgb_right_float"] = ImageConverter.from_numpy_int_format(
+                self.right_rgb_image_as_int
+            ).image_in_numpy_format
+        return self._data["rgb_right_float"]
+
+    @property
+    def depth_map(self) -> NumpyDepthMapType:
+        return self._get("depth_map")
+
+    @property
+    def depth_image(self) -> NumpyIntImageType:
+        return self._get("depth_image")
+
+    @property
+    def colored_point_cloud(self) -> ColoredPointCloudType:
+        return self._get("colored_point_cloud")
@@ -0,0 +1,238 @@
+"""Fusion of depth maps of (multiple) calibrated cameras into a truncated signed distance function (TSDF) volume.
+
+Each voxel of the volume stores the weighted average of the truncated signed distances to the surfaces that were observed by
+the cameras, which averages out the noise of the individual depth maps. The memory is bounded by the size of the volume,
+regardless of the number of depth maps that are integrated. Point clouds and heightmaps of the surfaces can be extracted at any time.
+"""
+from __future__ import annotations
+
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+from airo_camera_toolkit.camera_calibration import IntrinsicsType, get_intrinsics_matrix
+from airo_camera_toolkit.reprojection import _get_distortion_coefficients, distort_normalized_coordinates
+from airo_typing import HomogeneousMatrixType, NumpyDepthMapType, PointCloudType, Vector3DType
+
+
+class TSDFVolume:
+    """Axis-aligned TSDF volume in the world frame, into which depth maps are integrated incrementally on the CPU.
+
+    The integration projects all voxels into the depth map. Because the voxels form a regular grid, the (homogeneous) projections
+    of the voxels are sums of per-axis offsets, so the projection is a handful of vectorized operations on slabs of the volume
+    (which bounds the size of the temporary arrays) without any per-voxel matrix multiplication.
+
+    The TSDF values are normalized by the truncation distance: 1 is (at least) the truncation distance in front of a surface,
+    -1 is (at least) the truncation distance behind it. Voxels that were never observed have weight 0.
+    """
+
+    def __init__(
+        self,
+        min_corner: Vector3DType,
+        max_corner: Vector3DType,
+        voxel_size: float,
+        truncation_distance: Optional[float] = None,
+        max_weight: float = 64.0,
+        max_voxels_per_slab: int = 2**20,
+    ) -> None:
+        """
+        Args:
+            min_corner: corner of the volume with the smallest coordinates, in the world frame.
+            max_corner: corner of the volume with the largest coordinates, in the world frame.
+            voxel_size: edge length of the (cubic) voxels.
+            truncation_distance: distance to the surface beyond which the signed distances are truncated, defaults to 3 voxels.
+            max_weight: maximal weight of a voxel, lower values make the volume adapt faster to changes in the scene.
+            max_voxels_per_slab: the volume is integrated in slabs of at most this many voxels, to bound the memory usage.
+        """
+        self.min_corner = np.asarray(min_corner, dtype=np.float64)
+        self.voxel_size = voxel_size
+        self.truncation_distance = truncation_distance if truncation_distance is not None else 3 * voxel_size
+        self.max_weight = max_weight
+        shape = np.ceil((np.asarray(max_corner) - self.min_corner) / voxel_size).astype(int)
+        self.shape = (int(shape[0]), int(shape[1]), int(shape[2]))
+        self._slab_size = max(1, max_voxels_per_slab // (self.shape[1] * self.shape[2]))
+
+        self.tsdf = np.ones(self.shape, dtype=np.float32)
+        self.weights = np.zeros(self.shape, dtype=np.float32)
+        # the world coordinates of the voxel centers along each axis
+        self._axis_coordinates = [
+            self.min_corner[axis] + (np.arange(self.shape[axis]) + 0.5) * voxel_size for axis in range(3)
+        ]
+
+    def reset(self) -> None:
+        self.tsdf.fill(1.0)
+        self.weights.fill(0.0)
+
+    def integrate(
+        self,
+        depth_map: NumpyDepthMapType,
+        camera_intrinsics: IntrinsicsType,
+        camera_in_world_pose: HomogeneousMatrixType,
+        max_depth: Optional[float] = None,
+    ) -> None:
+        """Integrates a depth map into the volume.
+
+        Args:
+            depth_map: (H,W) depth map, pixels without a valid depth should be NaN, inf or <= 0.
+            camera_intrinsics: the intrinsics of the camera, CameraCalibrations with distortion coefficients are supported.
+            camera_in_world_pose: the pose of the camera in the world frame (the extrinsics matrix).
+            max_depth: depths beyond this distance are ignored, e.g. because they are too noisy.
+        """
+        intrinsics_matrix = np.asarray(get_intrinsics_matrix(camera_intrinsics), dtype=np.float64)
+        distortion_coefficients = _get_distortion_coefficients(camera_intrinsics)
+        world_to_camera_transform = np.linalg.inv(camera_in_world_pose)[:3]
+        # the (3,4) projection matrix from the world frame to the (homogeneous) image plane. With distortion,
+        # the voxels are projected onto the normalized image plane, from which the distortion model projects them into the image.
+        projection_matrix = world_to_camera_transform
+        if distortion_coefficients is None:
+            projection_matrix = intrinsics_matrix @ world_to_camera_transform
+
+        # (u*z, v*z, z) of voxel (i,j,k) = x_offsets[i] + y_offsets[j] + z_offsets[k], each (n, 3)
+        x_offsets = self._axis_coordinates[0][:, np.newaxis] * projection_matrix[:, 0] + projection_matrix[:, 3]
+        y_offsets = self._axis_coordinates[1][:, np.newaxis] * projection_matrix[:, 1]
+        z_offsets = self._axis_coordinates[2][:, np.newaxis] * projection_matrix[:, 2]
+        yz_offsets = y_offsets[:, np.newaxis, :] + z_offsets[np.newaxis, :, :]
+
+        for x_start in range(0, self.shape[0], self._slab_size):
+            x_end = min(x_start + self._slab_size, self.shape[0])
+            projections = x_offsets[x_start:x_end, np.newaxis, np.newaxis, :] + yz_offsets
+            self._integrate_slab(
+                slice(x_start, x_end), projections, depth_map, intrinsics_matrix, distortion_coefficients, max_depth
+            )
+
+    def _integrate_slab(
+        self,
+        slab: slice,
+        projections: np.ndarray,
+        depth_map: NumpyDepthMapType,
+        intrinsics_matrix: np.ndarray,
+        distortion_coefficients: Optional[np.ndarray],
+        max_depth: Optional[float],
+    ) -> None:
+        height, width = depth_map.shape[:2]
+        # the z-coordinate in the camera frame is the last homogeneous coordinate
+        voxel_indices = np.nonzero(projections[..., 2] > 0)
+        projections = projections[voxel_indices]
+        z = projections[:, 2]
+        pixels = projections[:, :2] / z[:, np.newaxis]
+        if distortion_coefficients is not None:
+            pixels = distort_normalized_coordinates(pixels, intrinsics_matrix, distortion_coefficients)
+
+        pixel_indices = np.rint(pixels).astype(np.intp)
+        is_in_image = (
+            (pixel_indices[:, 0] >= 0)
+            & (pixel_indices[:, 0] < width)
+            & (pixel_indices[:, 1] >= 0)
+            & (pixel_indices[:, 1] < height)
+        )
+        depths = depth_map[pixel_indices[is_in_image, 1], pixel_indices[is_in_image, 0]]
+        signed_distances = depths - z[is_in_image]
+        with np.errstate(invalid="ignore"):
+            is_valid = np.isfinite(depths) & (depths > 0) & (signed_distances >= -self.truncation_distance)
+            if max_depth is not None:
+                is_valid &= depths <= max_depth
+
+        # indices in the slab of the voxels that are updated
+        update_indices = tuple(indices[is_in_image][is_valid] for indices in voxel_indices)
+        new_tsdf = np.minimum(1.0, signed_distances[is_valid] / self.truncation_distance)
+
+        tsdf = self.tsdf[slab]
+        weights = self.weights[slab]
+        old_weights = weights[update_indices]
+        tsdf[update_indices] = (tsdf[update_indices] * old_weights + new_tsdf) / (old_weights + 1)
+        weights[update_indices] = np.minimum(old_weights + 1, self.max_weight)
+
+    def integrate_frames(
+        self, frames: Iterable[Tuple[NumpyDepthMapType, IntrinsicsType, HomogeneousMatrixType]]
+    ) -> None:
+        """integrates (depth map, intrinsics, camera pose in the world frame) tuples, e.g. of the cameras of a MultiCameraRig."""
+        for depth_map, camera_intrinsics, camera_in_world_pose in frames:
+            self.integrate(depth_map, camera_intrinsics, camera_in_world_pose)
+
+    def voxel_centers(self) -> np.ndarray:
+        """(X,Y,Z,3) world coordinates of the centers of all voxels."""
+        return np.stack(np.meshgrid(*self._axis_coordinates, indexing="ij"), axis=-1)
+
+    def extract_point_cloud(self, min_weight: float = 1.0) -> PointCloudType:
+        """Extracts the points on the surfaces: the zero crossings of the TSDF between neighboring voxels along each axis.
+
+        Args:
+            min_weight: minimal weight of both voxels of a zero crossing, higher values only keep surfaces that were observed more often.
+
+        Returns:
+            (N,3) points in the world frame.
+        """
+        point_clouds = []
+        for axis in range(3):
+            crossings = self._zero_crossings(axis, min_weight, positive_side=None)
+            voxel_indices = np.nonzero(~np.isnan(crossings))
+            points = np.stack(
+                [self._axis_coordinates[i][voxel_indices[i]] for i in range(3)], axis=1
+            )  # the centers of the first voxels of the crossings
+            points[:, axis] += crossings[voxel_indices] * self.voxel_size
+            point_clouds.append(points)
+        return np.concatenate(point_clouds)
+
+    def extract_heightmap(self, min_weight: float = 1.0) -> np.ndarray:
+        """Extracts the height of the highest surface above each (x,y) cell of the volume, as seen from above.
+
+        Cell (i,j) of the heightmap is centered at min_corner[:2] + (i + 0.5, j + 0.5) * voxel_size.
+
+        Returns:
+            (X,Y) heights in the world frame, NaN for cells without a surface.
+        """
+        # a surface that faces upwards has free space (positive TSDF) above it
+        crossings = self._zero_crossings(2, min_weight, positive_side=1)
+        heights = self._axis_coordinates[2][:-1] + crossings * self.voxel_size
+        # fmax ignores the NaNs, unlike max
+        return np.fmax.reduce(heights, axis=2, initial=np.nan)
+
+    def _zero_crossings(self, axis: int, min_weight: float, positive_side: Optional[int]) -> np.ndarray:
+        """Fraction of the voxel size between the centers of voxel n and n+1 along the axis at which the TSDF is zero.
+
+        Args:
+            positive_side: 1 to only keep crossings where voxel n+1 is positive, 0 for voxel n, None for both.
+
+        Returns:
+            array that is one shorter along the axis than the volume, NaN for voxel pairs without zero crossing.
+        """
+        n = self.shape[axis]
+        first = [slice(None)] * 3
+        second = [slice(None)] * 3
+        first[axis] = slice(0, n - 1)
+        second[axis] = slice(1, n)
+        tsdf_first, tsdf_second = self.tsdf[tuple(first)], self.tsdf[tuple(second)]
+        is_observed = (self.weights[tuple(first)] >= min_weight) & (self.weights[tuple(second)] >= min_weight)
+
+        if positive_side is None:
+            is_crossing = (tsdf_first > 0) != (tsdf_second > 0)
+        elif positive_side == 1:
+            is_crossing = (tsdf_first <= 0) & (tsdf_second > 0)
+        else:
+            is_crossing = (tsdf_first > 0) & (tsdf_second <= 0)
+        # a sign change between truncated values (e.g. at the border between observed and occluded space) is not a surface
+        is_crossing &= is_observed & (np.abs(tsdf_first - tsdf_second) < 2.0)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            fractions = tsdf_first / (tsdf_first - tsdf_second)
+        return np.where(is_crossing, fractions, np.nan)
+
+
+if __name__ == "__main__":
+    """fuses the depth maps of a ZED camera that looks down on a table into a TSDF volume and shows the heightmap."""
+    import time
+
+    import cv2
+    from airo_camera_toolkit.cameras.zed2i import Zed2i
+
+    # the camera is 80 cm above the table, which is the XY plane of the world frame
+    camera_in_world_pose = np.array([[1.0, 0, 0, 0], [0, -1.0, 0, 0], [0, 0, -1.0, 0.8], [0, 0, 0, 1.0]])
+    volume = TSDFVolume(np.array([-0.4, -0.3, -0.05]), np.array([0.4, 0.3, 0.3]), voxel_size=0.005)
+    with Zed2i(Zed2i.RESOLUTION_720, fps=30, depth_mode=Zed2i.NEURAL_DEPTH_MODE) as zed:
+        while True:
+            start = time.perf_counter()
+            volume.integrate(zed.get_depth_map(), zed.calibration, camera_in_world_pose, max_depth=1.0)
+            print(f"integration took {(time.perf_counter() - start) * 1000:.1f} ms")
+            heightmap = np.nan_to_num(volume.extract_heightmap(), nan=0.0)
+            cv2.imshow("heightmap", (heightmap.T / 0.3).clip(0.0, 1.0))
+            if cv2.waitKey(1) == ord("q"):
+                break
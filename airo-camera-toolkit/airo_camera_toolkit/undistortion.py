@@ -0,0 +1,134 @@
+"""Undistortion of camera images with cached remap tables.
+
+The reprojection functions assume pinhole images. Cameras whose images are distorted (e.g. the color stream of the Realsense)
+can either be used with a distortion-aware CameraCalibration in the reprojection functions,
+or their images can be undistorted first with an Undistorter, after which the (distortion-free) calibration of the Undistorter
+is used for the reprojection. The remap tables are computed once per calibration, so undistorting runs at frame rate.
+"""
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+from airo_camera_toolkit.camera_calibration import CameraCalibration
+from airo_typing import CameraIntrinsicsMatrixType, NumpyDepthMapType
+
+
+def get_undistortion_maps(
+    calibration: CameraCalibration, new_intrinsics_matrix: Optional[CameraIntrinsicsMatrixType] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Get the remap tables (cf. cv2.initUndistortRectifyMap) to undistort the images of a camera with cv2.remap.
+
+    The maps are cached per (intrinsics, distortion, resolution, new intrinsics), so only the first call for a camera computes them.
+    They are in the fixed-point format (CV_16SC2), which is the fastest format for cv2.remap.
+
+    Args:
+        calibration: calibration of the camera, with distortion coefficients.
+        new_intrinsics_matrix: intrinsics matrix of the undistorted images, defaults to the intrinsics matrix of the camera.
+
+    Returns:
+        the two read-only maps for cv2.remap.
+    """
+    if calibration.distortion_coefficients is None:
+        raise ValueError("the calibration has no distortion coefficients")
+    if new_intrinsics_matrix is None:
+        new_intrinsics_matrix = calibration.intrinsics_matrix
+    return _get_undistortion_maps(
+        tuple(np.asarray(calibration.intrinsics_matrix, dtype=np.float64).ravel()),
+        tuple(calibration.distortion_coefficients),
+        calibration.resolution,
+        tuple(np.asarray(new_intrinsics_matrix, dtype=np.float64).ravel()),
+    )
+
+
+@lru_cache(maxsize=16)
+def _get_undistortion_maps(
+    intrinsics: Tuple[float, ...],
+    distortion_coefficients: Tuple[float, ...],
+    resolution: Tuple[int, int],
+    new_intrinsics: Tuple[float, ...],
+) -> Tuple[np.ndarray, np.ndarray]:
+    map1, map2 = cv2.initUndistortRectifyMap(
+        np.array(intrinsics).reshape(3, 3),
+        np.array(distortion_coefficients),
+        None,
+        np.array(new_intrinsics).reshape(3, 3),
+        resolution,
+        cv2.CV_16SC2,
+    )
+    # the maps are shared between all callers, so make sure nobody can alter them.
+    map1.flags.writeable = False
+    map2.flags.writeable = False
+    return map1, map2
+
+
+class Undistorter:
+    """Streaming undistortion of the images of a camera.
+
+    The remap tables are computed on construction and reused for every frame, which takes a single cv2.remap call.
+    The undistorted images follow the pinhole model with the intrinsics of `calibration`,
+    so they can be used with the reprojection functions. Calibrations without distortion are passed through as is.
+    """
+
+    def __init__(
+        self, calibration: CameraCalibration, new_intrinsics_matrix: Optional[CameraIntrinsicsMatrixType] = None
+    ) -> None:
+        """
+        Args:
+            calibration: calibration of the camera, e.g. camera.calibration (or camera.calibration.right_view() for the right view).
+            new_intrinsics_matrix: intrinsics matrix of the undistorted images, defaults to the intrinsics matrix of the camera.
+                Use cv2.getOptimalNewCameraMatrix to determine a matrix that keeps all pixels of the distorted images.
+        """
+        self.distorted_calibration = calibration
+        if new_intrinsics_matrix is None:
+            new_intrinsics_matrix = calibration.intrinsics_matrix
+        self._maps = get_undistortion_maps(calibration, new_intrinsics_matrix) if calibration.has_distortion else None
+        self.calibration = CameraCalibration(calibration.resolution, new_intrinsics_matrix)
+        """the calibration of the undistorted images."""
+
+    def undistort(
+        self, frame: np.ndarray, out: Optional[np.ndarray] = None, interpolation: int = cv2.INTER_LINEAR
+    ) -> np.ndarray:
+        """Undistorts an image of the camera (in any number of channels and dtype that cv2.remap supports).
+
+        Args:
+            frame: the (H,W) or (H,W,C) image, with the resolution of the calibration.
+            out: optional array to write the undistorted image into, to avoid allocating a new image for every frame.
+            interpolation: cv2 interpolation flag.
+        """
+        if frame.shape[1::-1] != self.calibration.resolution:
+            raise ValueError(
+                f"frame of shape {frame.shape} does not match the resolution {self.calibration.resolution} of the calibration"
+            )
+        if self._maps is None:
+            if out is None:
+                return frame
+            np.copyto(out, frame)
+            return out
+        return cv2.remap(frame, self._maps[0], self._maps[1], interpolation, dst=out)
+
+    def undistort_depth_map(self, depth_map: NumpyDepthMapType, out: Optional[np.ndarray] = None) -> NumpyDepthMapType:
+        """Undistorts a depth map that is aligned with the images of the camera.
+
+        Nearest-neighbour interpolation is used, to avoid depths that lie in between foreground and background at object edges.
+        """
+        return self.undistort(depth_map, out, cv2.INTER_NEAREST)
+
+
+if __name__ == "__main__":
+    """undistorts the images of a Realsense camera and shows them next to the distorted images."""
+    from airo_camera_toolkit.cameras.realsense import Realsense
+    from airo_camera_toolkit.utils import ImageConverter
+
+    camera = Realsense()
+    undistorter = Undistorter(camera.calibration)
+    print(f"distortion coefficients: {camera.calibration.distortion_coefficients}")
+    undistorted_image = None
+    while True:
+        image = ImageConverter.from_numpy_int_format(camera.get_rgb_image_as_int()).image_in_opencv_format
+        undistorted_image = undistorter.undistort(image, out=undistorted_image)
+        cv2.imshow("distorted | undistorted", np.hstack([image, undistorted_image]))
+        if cv2.waitKey(1) == ord("q"):
+            break
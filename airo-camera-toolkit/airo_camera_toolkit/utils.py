@@ -1,7 +1,11 @@
 from __future__ import annotations
 
+from typing import Dict, List, Optional, Tuple
+
+import cv2
 import numpy as np
 from airo_typing import NumpyFloatImageType, NumpyIntImageType, OpenCVIntImageType, TorchFloatImageType
+from numpy.typing import DTypeLike
 
 
 def is_image_array(image: object) -> bool:
@@ -47,76 +51,258 @@ def is_int_image_array(image: np.ndarray) -> bool:
     return valid
 
 
+def check_out_buffer(out: np.ndarray, shape: Tuple[int, ...], dtype: DTypeLike = np.uint8) -> None:
+    """Raise a ValueError if an `out` array does not have the given shape and dtype or is not C-contiguous.
+
+    OpenCV functions silently allocate a new array if their dst does not match, which would leave `out` unchanged.
+    """
+    if out.shape != tuple(shape) or out.dtype != np.dtype(dtype) or not out.flags.c_contiguous:
+        raise ValueError(
+            f"out should be a C-contiguous {np.dtype(dtype)} array of shape {tuple(shape)}, "
+            f"got a {'' if out.flags.c_contiguous else 'non-contiguous '}{out.dtype} array of shape {out.shape}"
+        )
+
+
+class ImageBufferPool:
+    """Round-robin pool of preallocated, C-contiguous arrays, to pass as `out` argument to e.g. `RGBCamera.get_rgb_image_as_int()`.
+
+    This makes the lifetime of the buffers explicit: an array returned by get() is reused after `n_buffers` more calls for the same shape and dtype,
+    so make sure you no longer need (or have copied) the data by then.
+    """
+
+    def __init__(self, n_buffers: int = 2) -> None:
+        assert n_buffers > 0
+        self.n_buffers = n_buffers
+        self._buffers: Dict[Tuple[Tuple[int, ...], np.dtype], List[np.ndarray]] = {}
+        self._next_index: Dict[Tuple[Tuple[int, ...], np.dtype], int] = {}
+
+    def get(self, shape: Tuple[int, ...], dtype: DTypeLike = np.uint8) -> np.ndarray:
+        """Get the next buffer of the given shape and dtype, allocating it the first time."""
+        key = (tuple(shape), np.dtype(dtype))
+        if key not in self._buffers:
+            self._buffers[key] = []
+            self._next_index[key] = 0
+        buffers = self._buffers[key]
+        index = self._next_index[key]
+        if index == len(buffers):
+            buffers.append(np.empty(shape, dtype=dtype))
+        self._next_index[key] = (index + 1) % self.n_buffers
+        return buffers[index]
+
+
 class ImageConverter:
     """
     Utility class to convert between numpy arrays of different image formats.
 
+    Each conversion is done in a single pass over the image, directly from the format of the input image,
+    and the result is cached, so requesting the same format again is free.
+    The input image itself is never modified and is not returned either: requesting the input format returns a copy.
+    Keep in mind that the returned arrays are shared, each format returns the same cached array on each access.
+    Copy them before modifying them in place, or use the to_*_format methods with an `out` array.
+
     Only supports cpu-located  images.
     Convert cuda images to cpu images (if you can afford it) or re-implement with torch.
     """
 
-    def __init__(self, image_in_numpy_float_format: NumpyFloatImageType) -> None:
-        assert is_float_image_array(image_in_numpy_float_format)
-        assert image_in_numpy_float_format.shape[2] == 3
+    NUMPY_FORMAT = "numpy"
+    NUMPY_INT_FORMAT = "numpy_int"
+    OPENCV_FORMAT = "opencv"
+    TORCH_FORMAT = "torch"
+
+    # (is channel first, is BGR, is float) for each format
+    _FORMAT_PROPERTIES = {
+        NUMPY_FORMAT: (False, False, True),
+        NUMPY_INT_FORMAT: (False, False, False),
+        OPENCV_FORMAT: (False, True, False),
+        TORCH_FORMAT: (True, False, True),
+    }
 
-        self._image_in_numpy_float_format = image_in_numpy_float_format
+    def __init__(self, image: np.ndarray, image_format: str = NUMPY_FORMAT) -> None:
+        """
+        Args:
+            image: the image, use the from_*_format classmethods to validate it against the format.
+            image_format: one of the ImageConverter.*_FORMAT constants.
+        """
+        if image_format not in self._FORMAT_PROPERTIES:
+            raise ValueError(f"unknown image format {image_format}")
+        self._image_format = image_format
+        self._image = image
+        # the input format is not cached upfront, so that it is copied on first access like the other formats
+        self._cache: Dict[str, np.ndarray] = {}
 
     @classmethod
     def from_numpy_format(cls, image: NumpyFloatImageType) -> ImageConverter:
         assert is_float_image_array(image)
         assert image.shape[2] == 3
-        # create copy to avoid altering the input image
-        image = np.copy(image)
-        return ImageConverter(image)
+        return ImageConverter(image, cls.NUMPY_FORMAT)
 
     @classmethod
     def from_numpy_int_format(cls, image: NumpyIntImageType) -> ImageConverter:
         assert is_int_image_array(image)
         assert image.shape[2] == 3
-        # convert to floats (creates a copy)
-        image = image.astype(np.float32) / 255.0
-        return ImageConverter(image)
+        return ImageConverter(image, cls.NUMPY_INT_FORMAT)
 
     @classmethod
     def from_opencv_format(cls, image: OpenCVIntImageType) -> ImageConverter:
         assert is_int_image_array(image)
         assert image.shape[2] == 3
-
-        # convert to float (creates copy)
-        # can take a few ms..
-
-        image = image.astype(np.float32) / 255.0
-        # convert BGR to RGB
-        image = image[:, :, ::-1]
-
-        return ImageConverter(image)
+        return ImageConverter(image, cls.OPENCV_FORMAT)
 
     @classmethod
     def from_torch_format(cls, image: TorchFloatImageType) -> ImageConverter:
         assert is_float_image_array(image)
         assert image.shape[0] == 3
-
-        # create copy to avoid altering the input image
-        image = np.copy(image)
-        # channel first to channel last
-        image = np.transpose(image, (1, 2, 0))
-        return ImageConverter(image)
+        return ImageConverter(image, cls.TORCH_FORMAT)
 
     @property
     def image_in_numpy_format(self) -> NumpyFloatImageType:
-        return self._image_in_numpy_float_format
+        return self.to_format(self.NUMPY_FORMAT)
 
     @property
     def image_in_opencv_format(self) -> OpenCVIntImageType:
-        image = self._image_in_numpy_float_format[:, :, ::-1]
-        # can take up to a few ms..
-        image *= 255.0
-        return image.astype(np.uint8)
+        return self.to_format(self.OPENCV_FORMAT)
 
     @property
     def image_in_torch_format(self) -> TorchFloatImageType:
-        return np.transpose(self._image_in_numpy_float_format, (2, 0, 1))
+        return self.to_format(self.TORCH_FORMAT)
 
     @property
     def image_in_numpy_int_format(self) -> NumpyIntImageType:
-        return (self._image_in_numpy_float_format * 255.0).astype(np.uint8)
+        return self.to_format(self.NUMPY_INT_FORMAT)
+
+    def to_numpy_format(self, out: Optional[NumpyFloatImageType] = None) -> NumpyFloatImageType:
+        return self.to_format(self.NUMPY_FORMAT, out)
+
+    def to_opencv_format(self, out: Optional[OpenCVIntImageType] = None) -> OpenCVIntImageType:
+        return self.to_format(self.OPENCV_FORMAT, out)
+
+    def to_torch_format(self, out: Optional[TorchFloatImageType] = None) -> TorchFloatImageType:
+        return self.to_format(self.TORCH_FORMAT, out)
+
+    def to_numpy_int_format(self, out: Optional[NumpyIntImageType] = None) -> NumpyIntImageType:
+        return self.to_format(self.NUMPY_INT_FORMAT, out)
+
+    def to_format(self, image_format: str, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """Get the image in the specified format.
+
+        Args:
+            image_format: one of the ImageConverter.*_FORMAT constants.
+            out: optional (C-contiguous) array to write the converted image into, it should have the shape of the target format
+                and uint8 dtype for int formats or a float dtype for float formats. If not provided, the result is cached.
+        """
+        if image_format not in self._FORMAT_PROPERTIES:
+            raise ValueError(f"unknown image format {image_format}")
+        if out is None:
+            if image_format not in self._cache:
+                self._cache[image_format] = self._convert(image_format, None)
+            return self._cache[image_format]
+        self._check_out_buffer(image_format, out)
+        if image_format in self._cache:
+            np.copyto(out, self._cache[image_format])
+            return out
+        return self._convert(image_format, out)
+
+    def _check_out_buffer(self, image_format: str, out: np.ndarray) -> None:
+        """Raise a ValueError if `out` cannot hold the image in the given format, cf. check_out_buffer."""
+        source_channel_first, _, _ = self._FORMAT_PROPERTIES[self._image_format]
+        target_channel_first, _, target_float = self._FORMAT_PROPERTIES[image_format]
+        height, width = self._image.shape[1:] if source_channel_first else self._image.shape[:2]
+        shape = (3, height, width) if target_channel_first else (height, width, 3)
+        if target_float and not np.issubdtype(out.dtype, np.floating):
+            raise ValueError(f"out should have a float dtype for the {image_format} format, got {out.dtype}")
+        check_out_buffer(out, shape, out.dtype if target_float else np.uint8)
+
+    def _convert(self, image_format: str, out: Optional[np.ndarray]) -> np.ndarray:
+        source_channel_first, source_bgr, source_float = self._FORMAT_PROPERTIES[self._image_format]
+        target_channel_first, target_bgr, target_float = self._FORMAT_PROPERTIES[image_format]
+        image = self._image
+
+        # RGB <-> BGR for contiguous uint8 images: cv2 is a lot faster than copying a reversed numpy view.
+        if (
+            not source_float
+            and not target_float
+            and source_bgr != target_bgr
+            and image.flags.c_contiguous
+            and image.dtype == np.uint8
+        ):
+            return cv2.cvtColor(image, cv2.COLOR_RGB2BGR, dst=out)
+
+        # create a view with the layout and channel order of the target format, this does not touch the data
+        view = image
+        if source_channel_first:
+            view = view.transpose(1, 2, 0)
+        if source_bgr != target_bgr:
+            view = view[..., ::-1]
+        if target_channel_first:
+            view = view.transpose(2, 0, 1)
+
+        # a single pass over the data to create a contiguous array in the target format
+        if source_float and not target_float:
+            if out is None:
+                out = np.empty(view.shape, dtype=np.uint8)
+            np.multiply(view, 255.0, out=out, casting="unsafe")
+        elif not source_float and target_float:
+            if out is None:
+                out = np.empty(view.shape, dtype=np.float32)
+            np.divide(view, 255.0, out=out, casting="unsafe")
+        else:
+            if out is None:
+                out = np.empty(view.shape, dtype=image.dtype)
+            np.copyto(out, view)
+        return out
+
+
+if __name__ == "__main__":
+    """measures how many bytes are allocated per frame when retrieving an RGB image from a camera buffer
+    and passing it to a downstream cv2 function (here a conversion to grayscale).
+
+    The camera buffer is simulated with a BGRA array, which is the format of the ZED SDK buffers (the Realsense buffers are BGR).
+    Allocations are measured with tracemalloc, which also tracks the arrays that OpenCV allocates through numpy,
+    e.g. the copy it silently makes of arrays with negative strides.
+
+    Results for a 2K frame (2208x1242):
+    - view with negative strides:   ~11.0 MB per frame (8.2MB hidden copy by cv2 + the gray image)
+    - cvtColor into a new array:     ~11.0 MB per frame (8.2MB RGB image + the gray image), but without hidden copies and stale views
+    - cvtColor into a pooled buffer: ~2.7 MB per frame (only the gray image)
+    """
+    import tracemalloc
+    from typing import Callable
+
+    def measure_allocated_bytes(func: Callable[[], None], n_frames: int = 10) -> float:
+        """returns the average peak memory that is allocated by each call to func."""
+        for _ in range(3):
+            func()  # warm up, e.g. to allocate all pooled buffers
+        peaks = []
+        tracemalloc.start()
+        for _ in range(n_frames):
+            tracemalloc.reset_peak()
+            start, _ = tracemalloc.get_traced_memory()
+            func()
+            _, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - start)
+        tracemalloc.stop()
+        return float(np.mean(peaks))
+
+    width, height = 2208, 1242
+    sdk_buffer = np.random.randint(0, 255, (height, width, 4), dtype=np.uint8)
+    pool = ImageBufferPool()
+
+    def retrieve_as_view() -> None:
+        image = sdk_buffer[..., :3][..., ::-1]
+        cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+
+    def retrieve_with_cvtcolor() -> None:
+        image = cv2.cvtColor(sdk_buffer, cv2.COLOR_BGRA2RGB)
+        cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+
+    def retrieve_into_pooled_buffer() -> None:
+        image = cv2.cvtColor(sdk_buffer, cv2.COLOR_BGRA2RGB, dst=pool.get((height, width, 3)))
+        cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+
+    print(f"frame of {width}x{height}, RGB image is {width * height * 3 / 1e6:.1f} MB")
+    for name, func in [
+        ("view with negative strides", retrieve_as_view),
+        ("cvtColor into a new array", retrieve_with_cvtcolor),
+        ("cvtColor into a pooled buffer", retrieve_into_pooled_buffer),
+    ]:
+        print(f"{name:<30}: {measure_allocated_bytes(func) / 1e6:.1f} MB allocated per frame")
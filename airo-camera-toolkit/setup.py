@@ -16,6 +16,7 @@ setuptools.setup(
         "rerun-sdk",
         "click==8.1.3",  # 8.1.4 breaks mypy
         "loguru",
+        "scipy",
     ],
     extras_require={
         "external": [
@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+from airo_camera_toolkit.acquisition import FrameRingBuffer
+from airo_camera_toolkit.cameras.fake import FakeStereoRGBDCamera
+
+
+def _frame(value: int):
+    return {"rgb": np.full((4, 5, 3), value, dtype=np.uint8)}
+
+
+def test_latest_only_buffer_returns_newest_frame():
+    buffer = FrameRingBuffer(size=3, policy=FrameRingBuffer.LATEST_ONLY)
+    for i in range(5):
+        buffer.write(_frame(i))
+    frame = buffer.read()
+    assert frame.sequence_number == 4
+    assert (frame.data["rgb"] == 4).all()
+    # 4 frames were overwritten before they could be read
+    assert buffer.dropped_frames == 4
+
+    # without waiting, the same frame is returned again
+    assert buffer.read().sequence_number == 4
+    with pytest.raises(TimeoutError):
+        buffer.read(wait_for_new_frame=True, timeout=0.01)
+
+
+def test_queue_all_buffer_returns_frames_in_order():
+    buffer = FrameRingBuffer(size=3, policy=FrameRingBuffer.QUEUE_ALL)
+    buffer.write(_frame(0))
+    buffer.write(_frame(1))
+    assert buffer.read().sequence_number == 0
+    buffer.write(_frame(2))
+    buffer.write(_frame(3))
+    assert [buffer.read().sequence_number for _ in range(3)] == [1, 2, 3]
+    assert buffer.dropped_frames == 0
+
+    with pytest.raises(TimeoutError):
+        buffer.read(timeout=0.01)
+
+    # overflow the buffer, the oldest frames are dropped
+    for i in range(4, 9):
+        buffer.write(_frame(i))
+    assert buffer.dropped_frames == 2
+    assert [buffer.read().sequence_number for _ in range(3)] == [6, 7, 8]
+
+
+def test_buffer_reuses_preallocated_slots():
+    buffer = FrameRingBuffer(size=2, copy_on_read=False)
+    buffer.write(_frame(0))
+    first_slot = buffer.read().data["rgb"]
+    buffer.write(_frame(1))
+    buffer.write(_frame(2))
+    # the producer wrapped around and wrote into the same memory
+    assert buffer.read().data["rgb"] is first_slot
+    assert (first_slot == 2).all()
+
+
+def test_acquisition_thread_on_fake_camera():
+    with FakeStereoRGBDCamera(resolution=(64, 48), fps=200) as camera:
+        camera.start_acquisition_thread(policy=FrameRingBuffer.QUEUE_ALL, buffer_size=50)
+        assert camera.is_acquisition_thread_running
+        with pytest.raises(RuntimeError):
+            camera.start_acquisition_thread()
+
+        frames = [camera.get_buffered_frame(timeout=1.0) for _ in range(5)]
+        assert [frame.sequence_number for frame in frames] == list(range(5))
+        for frame in frames:
+            assert set(frame.data.keys()) == {"rgb", "rgb_right", "depth_map", "depth_image"}
+            # the copies in the buffer are not overwritten by later grabs
+            assert frame.data["rgb"][0, 0, 0] == frame.sequence_number
+
+        assert camera.get_rgb_image().dtype == np.float32
+        assert camera.get_rgb_image(view=camera.RIGHT_RGB).shape == (48, 64, 3)
+        assert camera.get_depth_map().shape == (48, 64)
+
+        camera.stop_acquisition_thread()
+        assert not camera.is_acquisition_thread_running
+        # grabs are blocking again
+        assert camera.get_rgb_image_as_int().shape == (48, 64, 3)
+
+
+def test_acquisition_thread_modalities():
+    with FakeStereoRGBDCamera(resolution=(64, 48), fps=0) as camera:
+        with pytest.raises(ValueError):
+            camera.start_acquisition_thread(modalities=["thermal"])
+        camera.start_acquisition_thread(modalities=["rgb"], wait_for_new_frame=True)
+        assert camera.get_rgb_image_as_int().shape == (48, 64, 3)
+        with pytest.raises(ValueError):
+            camera.get_depth_map()
+
+
+def test_acquisition_thread_propagates_errors():
+    camera = FakeStereoRGBDCamera(resolution=(64, 48), fps=0)
+
+    def failing_grab() -> None:
+        raise IndexError("Could not grab new camera frame")
+
+    camera._grab_images = failing_grab  # type: ignore
+    camera.start_acquisition_thread()
+    with pytest.raises(RuntimeError):
+        camera.get_rgb_image()
+    camera.stop_acquisition_thread()
@@ -0,0 +1,40 @@
+import json
+
+import pytest
+from airo_camera_toolkit.benchmark import StageTimer, benchmark_camera
+from airo_camera_toolkit.cameras.fake import FakeStereoRGBDCamera
+from airo_camera_toolkit.image_transforms import Resize
+from airo_camera_toolkit.utils import ImageConverter
+
+
+def test_stage_timer_summary():
+    timer = StageTimer()
+    for _ in range(10):
+        with timer.measure("grab"):
+            pass
+    summary = timer.summary()["grab"]
+    assert summary["n"] == 10
+    assert summary["p50_ms"] <= summary["p95_ms"] <= summary["p99_ms"] <= summary["max_ms"]
+
+
+def test_benchmark_camera():
+    camera = FakeStereoRGBDCamera(resolution=(64, 48), fps=0)
+    transforms = [Resize((48, 64, 3), 24, 32)]
+    result = benchmark_camera(camera, n_frames=5, depth=True, transforms=transforms)
+    assert set(result["stages"].keys()) == {"grab", "retrieve_rgb", "retrieve_depth", "convert", "transform", "total"}
+    assert result["output_resolution"] == [32, 24]
+    assert result["fps"] > 0
+    # the results can be stored as JSON
+    json.dumps(result)
+
+    result = benchmark_camera(camera, n_frames=5, rgb_as_int=False, output_format=ImageConverter.TORCH_FORMAT)
+    assert "retrieve_depth" not in result["stages"]
+    assert result["output_resolution"] == [64, 48]
+
+    camera.start_acquisition_thread()
+    with pytest.raises(RuntimeError):
+        benchmark_camera(camera)
+    camera.stop_acquisition_thread()
+
+    with pytest.raises(ValueError):
+        benchmark_camera(camera, n_frames=0)
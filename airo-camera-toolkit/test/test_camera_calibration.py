@@ -0,0 +1,58 @@
+from test.test_config import _ImageTestValues
+
+import numpy as np
+import pytest
+from airo_camera_toolkit.camera_calibration import CameraCalibration
+from airo_camera_toolkit.cameras.fake import FakeStereoRGBDCamera
+from airo_camera_toolkit.reprojection import project_frame_to_image_plane
+from airo_dataset_tools.data_parsers.camera_intrinsics import (
+    CameraIntrinsics,
+    FocalLengths,
+    PrincipalPoint,
+    Resolution,
+)
+
+
+def test_calibration_arrays_are_read_only():
+    intrinsics = _ImageTestValues._intrinsics_matrix.copy()
+    calibration = CameraCalibration(_ImageTestValues._image_dims, intrinsics, distortion_coefficients=[0.0] * 5)
+    assert not calibration.intrinsics_matrix.flags.writeable
+    assert not calibration.has_distortion
+    assert not calibration.is_stereo
+    # the calibration does not share memory with the input
+    intrinsics[0, 0] = 1.0
+    assert calibration.intrinsics_matrix[0, 0] == _ImageTestValues._intrinsics_matrix[0, 0]
+    with pytest.raises(ValueError):
+        calibration.right_view()
+
+
+def test_reprojection_accepts_calibration():
+    calibration = CameraCalibration(_ImageTestValues._image_dims, _ImageTestValues._intrinsics_matrix)
+    projected_points = project_frame_to_image_plane(_ImageTestValues._positions_in_camera_frame, calibration)
+    assert np.isclose(projected_points, _ImageTestValues._positions_on_image_plane, atol=1e-2).all()
+
+
+def test_camera_calibration_is_cached():
+    camera = FakeStereoRGBDCamera(resolution=(64, 48), fps=0)
+    assert camera.calibration is camera.calibration
+    assert camera.calibration.is_stereo
+    assert camera.calibration.resolution == (64, 48)
+    assert camera.intrinsics_matrix() is camera.calibration.intrinsics_matrix
+    assert np.isclose(camera.pose_of_right_view_in_left_view[0, 3], 0.12)
+
+
+def test_calibration_from_camera_intrinsics():
+    camera_intrinsics = CameraIntrinsics(
+        image_resolution=Resolution(width=640, height=480),
+        focal_lengths_in_pixels=FocalLengths(fx=500.0, fy=501.0),
+        principal_point_in_pixels=PrincipalPoint(cx=320.0, cy=240.0),
+        radial_distortion_coefficients=[-0.1, 0.02, 0.003],
+        tangential_distortion_coefficients=[0.001, -0.002],
+    )
+    calibration = CameraCalibration.from_camera_intrinsics(camera_intrinsics)
+    assert calibration.resolution == (640, 480)
+    assert np.allclose(calibration.intrinsics_matrix, [[500.0, 0.0, 320.0], [0.0, 501.0, 240.0], [0.0, 0.0, 1.0]])
+    # OpenCV order: k1, k2, p1, p2, k3
+    assert np.allclose(calibration.distortion_coefficients, [-0.1, 0.02, 0.001, -0.002, 0.003])
+
+    assert calibration.to_camera_intrinsics() == camera_intrinsics
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+from airo_camera_toolkit.cameras.fake import FakeStereoRGBDCamera
+from airo_camera_toolkit.depth_filtering import TemporalDepthFilter, TemporallyFilteredDepthCamera
+
+
+def test_temporal_depth_filter_matches_nanmedian():
+    rng = np.random.default_rng(0)
+    depth_filter = TemporalDepthFilter(window_size=4, ema_alpha=0.5)
+    depth_maps = rng.random((10, 6, 8)).astype(np.float32)
+    depth_maps[rng.random(depth_maps.shape) < 0.3] = np.nan
+    depth_maps[0, 0, 0] = np.inf
+    depth_maps[1, 0, 0] = 0.0
+    depth_maps[:, 1, 1] = np.nan
+
+    for i, depth_map in enumerate(depth_maps):
+        depth_filter.update(depth_map)
+        window = depth_maps[max(0, i - 3) : i + 1].copy()
+        window[~np.isfinite(window) | (window <= 0)] = np.nan
+        with np.errstate(invalid="ignore"), pytest.warns(RuntimeWarning):
+            assert np.allclose(depth_filter.median(), np.nanmedian(window, axis=0), equal_nan=True)
+        assert np.array_equal(depth_filter.valid_count, np.count_nonzero(~np.isnan(window), axis=0))
+
+    assert np.isnan(depth_filter.ema[1, 1])
+    assert np.isnan(depth_filter.filtered_depth_map(TemporalDepthFilter.EMA, min_valid_count=4)).sum() >= 1
+    with pytest.raises(ValueError):
+        depth_filter.update(np.ones((3, 3)))
+
+
+def test_temporal_depth_filter_ema():
+    depth_filter = TemporalDepthFilter(window_size=2, ema_alpha=0.5)
+    depth_filter.update(np.full((2, 2), 1.0))
+    depth_filter.update(np.full((2, 2), np.nan))
+    depth_filter.update(np.full((2, 2), 2.0))
+    # invalid depth maps do not change the average
+    assert np.allclose(depth_filter.ema, 1.5)
+    assert np.allclose(depth_filter.median(), 2.0)
+
+
+def test_temporally_filtered_depth_camera():
+    fake_camera = FakeStereoRGBDCamera(resolution=(64, 48), fps=0, depth=2.0)
+    with TemporallyFilteredDepthCamera(fake_camera, window_size=3) as camera:
+        assert np.allclose(camera.get_depth_map(), 2.0)
+        assert camera.filter.n_updates == 1
+        snapshot = camera.capture()
+        assert np.allclose(snapshot.depth_map, 2.0)
+        assert snapshot.timestamp == fake_camera._retrieve_timestamp()
+        assert camera.intrinsics_matrix() is fake_camera.intrinsics_matrix()
+        assert camera.get_depth_image().shape == (48, 64, 3)
@@ -2,13 +2,19 @@ from test.test_config import _CalibrationTest
 
 import cv2
 import numpy as np
+import pytest
 from airo_camera_toolkit.calibration.fiducial_markers import (
     AIRO_DEFAULT_ARUCO_DICT,
     AIRO_DEFAULT_CHARUCO_BOARD,
+    ArucoMarkerDetectionResult,
+    FiducialDetector,
+    benchmark_pyramid_detection,
     detect_aruco_markers,
     detect_charuco_corners,
     get_pose_of_charuco_board,
     get_poses_of_aruco_markers,
+    get_stacked_poses_of_aruco_markers,
+    solve_pnp_batch,
 )
 
 
@@ -78,3 +84,162 @@ def test_charuco_pose_estimation_on_marker_image():
     # which where measured by hand
     assert np.isclose(pose[:3, :3], np.eye(3), atol=1e-4).all()
     assert np.isclose(pose[:3, 3], np.array([0.01, 0.01, 0]), atol=1e-3).all()
+
+
+def _board_in_larger_image(x: int, y: int) -> np.ndarray:
+    """the default charuco board at 30% of its resolution, at (x, y) in a 2K image."""
+    charuco_board_image = cv2.imread(str(_CalibrationTest._default_charuco_board_path))
+    board = cv2.resize(charuco_board_image, None, fx=0.3, fy=0.3, interpolation=cv2.INTER_AREA)
+    image = np.full((1242, 2208, 3), 255, dtype=np.uint8)
+    image[y : y + board.shape[0], x : x + board.shape[1]] = board
+    return image
+
+
+def test_fiducial_detector_matches_detection_functions():
+    charuco_board_image = cv2.imread(str(_CalibrationTest._default_charuco_board_path))
+    detector = FiducialDetector(AIRO_DEFAULT_ARUCO_DICT, AIRO_DEFAULT_CHARUCO_BOARD)
+    markers, charuco_corners = detector.detect(charuco_board_image)
+
+    expected_markers = detect_aruco_markers(charuco_board_image, AIRO_DEFAULT_ARUCO_DICT)
+    assert markers is not None and expected_markers is not None
+    assert np.array_equal(markers.ids, expected_markers.ids)
+    assert np.allclose(markers.corners, expected_markers.corners, atol=0.1)
+
+    expected_charuco_corners = detect_charuco_corners(
+        charuco_board_image, expected_markers, AIRO_DEFAULT_CHARUCO_BOARD
+    )
+    assert charuco_corners is not None and expected_charuco_corners is not None
+    assert np.array_equal(charuco_corners.ids, expected_charuco_corners.ids)
+    assert np.allclose(charuco_corners.corners, expected_charuco_corners.corners, atol=0.1)
+
+    empty_marker_image = cv2.imread(str(_CalibrationTest._empty_image_path))
+    assert detector.detect(empty_marker_image) == (None, None)
+
+
+def test_fiducial_detector_tracking():
+    detector = FiducialDetector(AIRO_DEFAULT_ARUCO_DICT, roi_padding=0.2)
+    image = _board_in_larger_image(400, 300)
+    markers = detector.detect_aruco_markers(image)
+    assert markers is not None and len(markers.ids) == 17
+    assert detector.roi is not None
+    x_min, y_min, x_max, y_max = detector.roi
+    assert 0 < x_min < 400 and 0 < y_min < 300 and x_max < 1300 and y_max < 1000
+
+    # the markers are found in the ROI, in the coordinates of the full image
+    tracked_markers = detector.detect_aruco_markers(image)
+    assert tracked_markers is not None
+    assert np.array_equal(tracked_markers.ids, markers.ids)
+    assert np.allclose(tracked_markers.corners, markers.corners, atol=0.1)
+
+    # the board moves out of the ROI: the detector falls back to the full image
+    moved_image = _board_in_larger_image(1200, 500)
+    moved_markers = detector.detect_aruco_markers(moved_image)
+    assert moved_markers is not None and len(moved_markers.ids) == 17
+    assert np.allclose(
+        moved_markers.corners.reshape(-1, 2).min(axis=0),
+        markers.corners.reshape(-1, 2).min(axis=0) + (800, 200),
+        atol=1.0,
+    )
+
+    # the markers are lost: the ROI is reset
+    assert detector.detect_aruco_markers(np.full_like(image, 255)) is None
+    assert detector.roi is None
+
+
+def test_fiducial_detector_without_board():
+    detector = FiducialDetector(AIRO_DEFAULT_ARUCO_DICT)
+    with pytest.raises(ValueError):
+        detector.detect(_board_in_larger_image(0, 0))
+
+
+def test_pyramid_detection():
+    charuco_board_image = cv2.imread(str(_CalibrationTest._default_charuco_board_path))
+    images = [charuco_board_image, _board_in_larger_image(400, 300)]
+    results = benchmark_pyramid_detection(images, pyramid_levels=(1, 2), n_repeats=1, tolerance=0.2)
+    assert len(results) == 6
+    for result in results:
+        assert result["max_corner_error_px"] <= 0.2
+        # on the smaller board in the 2K image, the markers are too small to all be detected on the second pyramid level
+        if result["image"] == 0 or result["pyramid_levels"] < 2:
+            assert result["n_markers"] == 17
+            assert result["within_tolerance"], result
+
+    empty_marker_image = cv2.imread(str(_CalibrationTest._empty_image_path))
+    assert detect_aruco_markers(empty_marker_image, AIRO_DEFAULT_ARUCO_DICT, pyramid_levels=1) is None
+
+    detector = FiducialDetector(AIRO_DEFAULT_ARUCO_DICT, AIRO_DEFAULT_CHARUCO_BOARD, pyramid_levels=1)
+    markers, charuco_corners = detector.detect(charuco_board_image)
+    assert markers is not None and len(markers.ids) == 17
+    assert charuco_corners is not None
+    # tracked detection on the ROI
+    assert detector.detect_aruco_markers(charuco_board_image) is not None
+
+
+def _marker_detections_and_intrinsics():
+    charuco_board_image = cv2.imread(str(_CalibrationTest._default_charuco_board_path))
+    detections = detect_aruco_markers(charuco_board_image, AIRO_DEFAULT_ARUCO_DICT)
+    assert detections is not None
+    intrinsics = np.array([[1000.0, 0.0, 1180.0], [0.0, 1000.0, 860.0], [0.0, 0.0, 1.0]])
+    return detections, intrinsics
+
+
+def test_poses_of_aruco_markers_match_opencv():
+    detections, intrinsics = _marker_detections_and_intrinsics()
+    rvecs, tvecs, _ = cv2.aruco.estimatePoseSingleMarkers(detections.corners, 0.031, intrinsics, None)
+    poses = get_poses_of_aruco_markers(detections, 0.031, intrinsics)
+    assert poses is not None
+    for pose, rvec, tvec in zip(poses, rvecs, tvecs):
+        rotation_matrix, _ = cv2.Rodrigues(rvec[0])
+        assert np.allclose(pose[:3, :3], rotation_matrix, atol=1e-9)
+        assert np.allclose(pose[:3, 3], tvec[0])
+        assert np.allclose(pose[3], [0, 0, 0, 1])
+
+
+def test_stacked_poses_of_aruco_markers():
+    detections, intrinsics = _marker_detections_and_intrinsics()
+    poses = get_poses_of_aruco_markers(detections, 0.031, intrinsics)
+    stacked_poses, reprojection_errors = get_stacked_poses_of_aruco_markers(detections, 0.031, intrinsics)
+    assert stacked_poses.shape == (17, 4, 4)
+    assert np.allclose(stacked_poses, np.array(poses), atol=1e-6)
+    # the corners of the rendered board are detected with sub-pixel accuracy
+    assert reprojection_errors.shape == (17,)
+    assert np.all(reprojection_errors < 0.1)
+
+    # corrupting the corners of a marker increases its reprojection error
+    corrupted_detections = ArucoMarkerDetectionResult(detections.corners.copy(), detections.ids, detections.image)
+    corrupted_detections.corners[0, 0, 0] += 5.0
+    _, corrupted_errors = get_stacked_poses_of_aruco_markers(corrupted_detections, 0.031, intrinsics)
+    assert corrupted_errors[0] > 1.0
+    assert np.allclose(corrupted_errors[1:], reprojection_errors[1:])
+
+    parallel_poses, parallel_errors = get_stacked_poses_of_aruco_markers(detections, 0.031, intrinsics, num_workers=4)
+    assert np.array_equal(parallel_poses, stacked_poses)
+    assert np.array_equal(parallel_errors, reprojection_errors)
+
+
+def test_solve_pnp_batch_with_distortion():
+    detections, intrinsics = _marker_detections_and_intrinsics()
+    dist_coeffs = np.array([0.1, -0.05, 0.0, 0.0, 0.01])
+    poses, _ = get_stacked_poses_of_aruco_markers(detections, 0.031, intrinsics)
+    half_size = 0.031 / 2
+    marker_points = np.array(
+        [
+            [-half_size, half_size, 0.0],
+            [half_size, half_size, 0.0],
+            [half_size, -half_size, 0.0],
+            [-half_size, -half_size, 0.0],
+        ]
+    )
+    # project the markers with a distorted camera and recover the poses from the projections
+    image_points = [
+        cv2.projectPoints(marker_points, cv2.Rodrigues(pose[:3, :3])[0], pose[:3, 3], intrinsics, dist_coeffs)[0]
+        for pose in poses
+    ]
+    recovered_poses, reprojection_errors = solve_pnp_batch(
+        [marker_points] * len(poses), image_points, intrinsics, dist_coeffs, num_workers=2
+    )
+    assert np.allclose(recovered_poses, poses, atol=1e-4)
+    assert np.all(reprojection_errors < 1e-3)
+
+    with pytest.raises(ValueError):
+        solve_pnp_batch([marker_points], [], intrinsics)
@@ -1,11 +1,11 @@
 import pathlib
-from typing import Tuple
+from typing import List, Tuple
 
 import cv2
 import numpy as np
 import pytest
-from airo_camera_toolkit.image_transforms import Crop, Resize, Rotate90
-from airo_camera_toolkit.image_transforms.image_transform import ImageTransform
+from airo_camera_toolkit.image_transforms import ComposedTransform, Crop, Resize, Rotate90
+from airo_camera_toolkit.image_transforms.image_transform import ImagePointType, ImageShapeType, ImageTransform
 
 GRADIENT_IMAGE_PATH = pathlib.Path(__file__).parent / "data" / "gradient.jpg"
 
@@ -84,3 +84,205 @@ def test_rotate_transform_image():
             transformed_image[transformed_point[1], transformed_point[0]],
             image[test_pixel_coords[1], test_pixel_coords[0]],
         ).all()
+
+
+def _composed_transforms(image_shape: Tuple[int, int, int]) -> List[ComposedTransform]:
+    crop = Crop(image_shape, x=100, y=50, h=400, w=600)
+    resize = Resize(crop.shape, h=200, w=300, round_transformed_points=False)
+    return [
+        ComposedTransform([crop, Rotate90(crop.shape, 1), Crop((600, 400, 3), x=10, y=20, h=300, w=200)]),
+        ComposedTransform([crop, resize, Crop(resize.shape, x=7, y=3, h=150, w=200)]),
+        ComposedTransform([crop, resize, Rotate90(resize.shape, -1)]),
+    ]
+
+
+def _sequential_transform_image(transform: ComposedTransform, image: np.ndarray) -> np.ndarray:
+    for sub_transform in transform.transforms:
+        image = sub_transform.transform_image(image)
+    return image
+
+
+def test_composed_transform_image():
+    image = cv2.imread(str(GRADIENT_IMAGE_PATH))
+    image[::7, ::5] = 0  # add some high frequency details, the gradient is very smooth
+    for transform in _composed_transforms(image.shape):
+        transformed_image = transform.transform_image(image)
+        expected_image = _sequential_transform_image(transform, image)
+        assert transformed_image.shape == expected_image.shape == transform.shape
+        # the resized images can be slightly different due to the different interpolation implementations
+        difference = np.abs(transformed_image.astype(int) - expected_image.astype(int))
+        assert np.mean(difference) < 1.0
+
+    # crops and rotations are exact
+    crop_and_rotate = _composed_transforms(image.shape)[0]
+    assert np.array_equal(crop_and_rotate.transform_image(image), _sequential_transform_image(crop_and_rotate, image))
+    # single channel images keep their channel dimension
+    gray_image = image[..., :1]
+    assert _composed_transforms(gray_image.shape)[2].transform_image(gray_image).shape == (300, 200, 1)
+
+
+def test_composed_transform_points(capsys):
+    image_shape = (1080, 1920, 3)
+    for transform in _composed_transforms(image_shape):
+        point = (450, 200)
+        expected_point = point
+        for sub_transform in transform.transforms:
+            expected_point = sub_transform.transform_point(expected_point)
+        transformed_point = transform.transform_point(point)
+        assert np.allclose(transformed_point, expected_point)
+        assert np.allclose(transform.reverse_transform_point(transformed_point), point)
+
+    # integer points of integer transforms remain integers
+    transformed_point = _composed_transforms(image_shape)[0].transform_point((450, 200))
+    assert all(isinstance(coordinate, int) for coordinate in transformed_point)
+    # also if they are numpy integers, e.g. taken from an array of points
+    transformed_point = _composed_transforms(image_shape)[0].transform_point(tuple(np.array([450, 200])))
+    assert all(isinstance(coordinate, int) for coordinate in transformed_point)
+    assert capsys.readouterr().out == ""
+
+    # points outside the crop raise, as when the transforms are applied one by one
+    crop_and_rotate = _composed_transforms(image_shape)[0]
+    with pytest.raises(AssertionError):
+        crop_and_rotate.transform_point((0, 0))
+    with pytest.raises(AssertionError):
+        ComposedTransform(crop_and_rotate.transforms[:2]).transform_point((0, 0))
+
+
+class _Flip(ImageTransform):
+    """a transform without an affine matrix"""
+
+    @property
+    def shape(self) -> ImageShapeType:
+        return self._input_shape
+
+    def transform_image(self, image: np.ndarray) -> np.ndarray:
+        return image[:, ::-1].copy()
+
+    def transform_point(self, point: ImagePointType) -> ImagePointType:
+        return self._input_w - 1 - point[0], point[1]
+
+    def reverse_transform_point(self, point: ImagePointType) -> ImagePointType:
+        return self.transform_point(point)
+
+
+def test_composed_transform_without_affine_matrix():
+    image = cv2.imread(str(GRADIENT_IMAGE_PATH))
+    crop = Crop(image.shape, x=100, y=50, h=400, w=600)
+    transform = ComposedTransform([crop, _Flip(crop.shape)])
+    expected_image = _sequential_transform_image(transform, image)
+    assert np.array_equal(transform.transform_image(image), expected_image)
+    assert np.array_equal(transform.transform_images([image, image])[1], expected_image)
+    assert transform.transform_point((450, 200)) == (249, 150)
+    assert transform.reverse_transform_point((249, 150)) == (450, 200)
+    with pytest.raises(NotImplementedError):
+        transform.affine_matrix
+
+
+def test_transform_points():
+    image_shape = (1080, 1920, 3)
+    crop = Crop(image_shape, x=100, y=50, h=400, w=600)
+    transforms = [
+        crop,
+        Resize(image_shape, h=540, w=960),
+        Resize(image_shape, h=500, w=700, round_transformed_points=False),
+        Rotate90(image_shape, 1),
+        Rotate90(image_shape, -1),
+    ] + _composed_transforms(image_shape)
+    points = np.array([[450, 200], [400, 100], [500, 250]])  # inside the crops of all transforms
+    for transform in transforms:
+        transformed_points, is_valid = transform.transform_points(points)
+        assert is_valid.all()
+        for point, transformed_point in zip(points, transformed_points):
+            expected_point = transform.transform_point(tuple(int(coordinate) for coordinate in point))
+            assert np.allclose(transformed_point, expected_point)
+
+        reversed_points, is_valid = transform.reverse_transform_points(
+            transformed_points, round_transformed_points=False
+        )
+        assert is_valid.all()
+        assert np.allclose(reversed_points, points, atol=2.0)
+
+
+def test_transform_points_validity_and_rounding():
+    crop = Crop((1080, 1920, 3), x=100, y=50, h=400, w=600)
+    points = np.array([[450, 200], [50, 200], [450, 500], [-1, 0]])
+    transformed_points, is_valid = crop.transform_points(points)
+    assert np.array_equal(is_valid, [True, False, False, False])
+    assert transformed_points.dtype == points.dtype
+    assert np.array_equal(transformed_points, points - [100, 50])
+
+    resize = Resize((1080, 1920, 3), h=500, w=700)
+    float_points, _ = resize.transform_points(points, round_transformed_points=False)
+    rounded_points, _ = resize.transform_points(points)
+    assert np.issubdtype(float_points.dtype, np.floating)
+    assert np.issubdtype(rounded_points.dtype, np.integer)
+    assert np.array_equal(rounded_points, np.rint(float_points))
+
+    with pytest.raises(ValueError):
+        crop.transform_points(np.zeros((3, 3)))
+
+
+def test_transform_points_borders_and_unsigned_points():
+    crop = Crop((1080, 1920, 3), x=100, y=50, h=400, w=600)
+    # the borders are exclusive, as in transform_point
+    points = np.array([[100, 50], [699, 449], [700, 200], [450, 450]], dtype=np.uint16)
+    transformed_points, is_valid = crop.transform_points(points)
+    assert np.array_equal(is_valid, [True, True, False, False])
+    crop.transform_point((699, 449))
+    with pytest.raises(AssertionError):
+        crop.transform_point((700, 200))
+
+    # points left of the crop get negative coordinates, instead of wrapping around in the unsigned dtype
+    transformed_points, is_valid = crop.transform_points(np.array([[50, 20]], dtype=np.uint16))
+    assert np.array_equal(transformed_points, [[-50, -30]])
+    assert np.issubdtype(transformed_points.dtype, np.signedinteger)
+    assert not is_valid[0]
+
+
+def test_transform_images():
+    image = cv2.imread(str(GRADIENT_IMAGE_PATH))[:1080, :1920]
+    images = np.stack([image, image[::-1], 255 - image])
+    transforms = [
+        Crop(image.shape, x=100, y=50, h=400, w=600),
+        Resize(image.shape, h=300, w=500),
+        Rotate90(image.shape, 1),
+    ] + _composed_transforms(image.shape)
+    for transform in transforms:
+        expected_images = np.stack([transform.transform_image(image) for image in images])
+        assert np.array_equal(transform.transform_images(images), expected_images)
+        assert np.array_equal(transform.transform_images(list(images), num_workers=1), expected_images)
+
+        out = np.zeros_like(expected_images)
+        assert transform.transform_images(images, out=out) is out
+        assert np.array_equal(out, expected_images)
+
+    # single channel images
+    gray_images = images[..., :1]
+    transform = _composed_transforms(gray_images.shape[1:])[2]
+    transformed_images = transform.transform_images(gray_images)
+    assert transformed_images.shape == (3, 300, 200, 1)
+    assert np.array_equal(transformed_images[1], transform.transform_image(gray_images[1]))
+
+    with pytest.raises(ValueError):
+        transform.transform_images(images[:, :100])
+    with pytest.raises(ValueError):
+        transform.transform_images(gray_images, out=np.zeros((2, 300, 200, 1), dtype=np.uint8))
+
+
+def test_transform_images_views():
+    image = cv2.imread(str(GRADIENT_IMAGE_PATH))[:1080, :1920]
+    images = np.stack([image, image[::-1]])
+    for transform in [Crop(image.shape, x=100, y=50, h=400, w=600, copy=False), Rotate90(image.shape, -1, copy=False)]:
+        transformed_images = transform.transform_images(images)
+        assert np.shares_memory(transformed_images, images)
+        assert np.shares_memory(transform.transform_image(image), image)
+        copied_transform = type(transform)(image.shape, **_transform_arguments(transform))
+        assert np.array_equal(transformed_images, copied_transform.transform_images(images))
+        assert not np.shares_memory(copied_transform.transform_images(images), images)
+
+
+def _transform_arguments(transform: ImageTransform) -> dict:
+    if isinstance(transform, Crop):
+        return {"x": transform.x, "y": transform.y, "h": transform.h, "w": transform.w}
+    assert isinstance(transform, Rotate90)
+    return {"num_rotations": transform._num_rotations}
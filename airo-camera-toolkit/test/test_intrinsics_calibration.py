@@ -0,0 +1,74 @@
+import os
+
+import cv2
+import numpy as np
+from airo_camera_toolkit.calibration.fiducial_markers import AIRO_DEFAULT_CHARUCO_BOARD
+from airo_camera_toolkit.calibration.intrinsics_calibration import (
+    BLURRY,
+    DUPLICATE,
+    calibrate_intrinsics_from_images,
+    get_image_sources,
+    save_camera_intrinsics,
+)
+from airo_dataset_tools.data_parsers.camera_intrinsics import CameraIntrinsics
+from scipy.spatial.transform import Rotation
+
+INTRINSICS_MATRIX = np.array([[600.0, 0.0, 320.0], [0.0, 600.0, 240.0], [0.0, 0.0, 1.0]])
+
+
+def _render_board_views(directory: str) -> None:
+    """render the default charuco board (0.28 x 0.20 m) as seen from several orientations by a camera without distortion."""
+    board_image = AIRO_DEFAULT_CHARUCO_BOARD.generateImage((1400, 1000))
+    board_image = cv2.copyMakeBorder(board_image, 100, 100, 100, 100, cv2.BORDER_CONSTANT, value=255)
+    # from the pixels of the board image to the board plane, in meters
+    pixels_to_meters = np.array([[0.0002, 0.0, -0.02], [0.0, 0.0002, -0.02], [0.0, 0.0, 1.0]])
+    board_center = np.array([0.14, 0.10, 0.0])
+    rotation_vectors = [
+        [0.0, 0.0, 0.0],
+        [0.4, 0.0, 0.0],
+        [-0.4, 0.0, 0.0],
+        [0.0, 0.4, 0.0],
+        [0.0, -0.4, 0.0],
+        [0.3, 0.3, 0.2],
+        [-0.3, 0.3, -0.2],
+        [0.3, -0.3, 0.1],
+        [-0.3, -0.3, 0.0],
+    ]
+    for i, rotation_vector in enumerate(rotation_vectors):
+        rotation = Rotation.from_rotvec(rotation_vector).as_matrix()
+        translation = np.array([0.0, 0.0, 0.55]) - rotation @ board_center
+        homography = (
+            INTRINSICS_MATRIX @ np.column_stack([rotation[:, 0], rotation[:, 1], translation]) @ pixels_to_meters
+        )
+        image = cv2.warpPerspective(board_image, homography, (640, 480), flags=cv2.INTER_AREA, borderValue=128)
+        cv2.imwrite(os.path.join(directory, f"view_{i:02d}.png"), image)
+
+    image = cv2.imread(os.path.join(directory, "view_01.png"))
+    cv2.imwrite(os.path.join(directory, "view_blurry.png"), cv2.GaussianBlur(image, (0, 0), 1.5))
+    cv2.imwrite(os.path.join(directory, "view_duplicate.png"), image)
+
+
+def test_calibrate_intrinsics_from_images(tmp_path):
+    _render_board_views(str(tmp_path))
+    sources = get_image_sources(str(tmp_path))
+    assert len(sources) == 11
+
+    result = calibrate_intrinsics_from_images(sources, num_workers=2)
+    assert [os.path.basename(source) for source in result.rejected_views[BLURRY]] == ["view_blurry.png"]
+    assert [os.path.basename(source) for source in result.rejected_views[DUPLICATE]] == ["view_duplicate.png"]
+    assert len(result.views) == 9
+    assert result.reprojection_error < 0.5
+
+    calibration = result.calibration
+    assert calibration.resolution == (640, 480)
+    assert np.allclose(calibration.intrinsics_matrix, INTRINSICS_MATRIX, atol=10.0)
+
+    intrinsics_path = str(tmp_path / "camera_intrinsics.json")
+    save_camera_intrinsics(calibration, intrinsics_path)
+    camera_intrinsics = CameraIntrinsics.parse_file(intrinsics_path)
+    assert camera_intrinsics.image_resolution.width == 640
+    assert np.isclose(camera_intrinsics.focal_lengths_in_pixels.fx, calibration.intrinsics_matrix[0, 0])
+    assert np.allclose(
+        calibration.to_camera_intrinsics().radial_distortion_coefficients,
+        camera_intrinsics.radial_distortion_coefficients,
+    )
@@ -0,0 +1,73 @@
+from typing import List
+
+import numpy as np
+import pytest
+from airo_camera_toolkit.cameras.fake import FakeStereoRGBDCamera
+from airo_camera_toolkit.multi_camera_rig import MultiCameraRig
+
+
+class _ScriptedTimestampsCamera(FakeStereoRGBDCamera):
+    """returns the given timestamps for its consecutive frames."""
+
+    def __init__(self, timestamps: List[float]) -> None:
+        super().__init__(resolution=(64, 48), fps=0)
+        self.timestamps = timestamps
+
+    def _retrieve_timestamp(self) -> float:
+        return self.timestamps[self.frame_index]
+
+
+def test_rig_with_synchronized_cameras():
+    cameras = [FakeStereoRGBDCamera(resolution=(64, 48), fps=100, latency=0.002 * i) for i in range(3)]
+    with MultiCameraRig(cameras, max_skew=0.001) as rig:
+        for _ in range(5):
+            frame_set = rig.capture()
+            assert frame_set.is_synchronized
+            assert frame_set.skew == pytest.approx(0.0)
+            assert len(frame_set) == 3
+            assert frame_set[0].rgb_image_as_int.shape == (48, 64, 3)
+
+        assert rig.unsynchronized_frame_sets == 0
+        for statistics in rig.statistics:
+            assert statistics.n_frames == 5
+            assert statistics.fps > 0
+            assert statistics.max_skew == pytest.approx(0.0)
+
+
+def test_rig_regrabs_lagging_cameras():
+    cameras = [_ScriptedTimestampsCamera([1.0, 2.0]), _ScriptedTimestampsCamera([0.9, 0.95, 1.0, 1.05])]
+    rig = MultiCameraRig(cameras, max_skew=0.01, max_regrabs=3)
+    frame_set = rig.capture()
+    assert frame_set.is_synchronized
+    assert np.allclose(frame_set.timestamps, [1.0, 1.0])
+    statistics = rig.statistics
+    assert statistics[0].dropped_frames == 0
+    assert statistics[1].dropped_frames == 2
+    rig.close()
+
+
+def test_rig_does_not_regrab_when_it_cannot_align():
+    # the second camera is half a frame period behind, grabbing again would only increase the skew
+    cameras = [_ScriptedTimestampsCamera([1.0, 2.0]), _ScriptedTimestampsCamera([0.94, 0.98])]
+    rig = MultiCameraRig(cameras, max_skew=0.01, max_regrabs=3)
+    frame_set = rig.capture()
+    # the frame period was not known yet, so the second camera grabbed once
+    assert frame_set.timestamps[1] == pytest.approx(0.98)
+    assert not frame_set.is_synchronized
+    assert rig.unsynchronized_frame_sets == 1
+    assert rig.statistics[1].dropped_frames == 1
+    rig.close()
+
+
+def test_rig_retrieves_modalities_in_worker_threads():
+    cameras = [FakeStereoRGBDCamera(resolution=(64, 48), fps=0) for _ in range(2)]
+    with MultiCameraRig(cameras) as rig:
+        frame_set = rig.capture(modalities=["rgb"])
+        rig.capture()
+        # the prefetched modality remains available after the next grab, the others do not
+        assert frame_set[1].rgb_image_as_int.shape == (48, 64, 3)
+        with pytest.raises(RuntimeError):
+            frame_set[1].depth_map
+
+    with pytest.raises(ValueError):
+        MultiCameraRig([])
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+from airo_camera_toolkit.point_clouds import (
+    PointCloudFilter,
+    crop_box,
+    crop_oriented_box,
+    remove_radius_outliers,
+    remove_statistical_outliers,
+    voxel_downsample,
+)
+
+
+def _grid_point_cloud() -> np.ndarray:
+    """colored points on a regular 1cm grid in the [0, 0.1) cube."""
+    coordinates = np.arange(10) * 0.01 + 0.005
+    x, y, z = np.meshgrid(coordinates, coordinates, coordinates, indexing="ij")
+    points = np.stack([x.ravel(), y.ravel(), z.ravel()], axis=1)
+    return np.concatenate([points, np.repeat(points[:, :1] * 10, 3, axis=1)], axis=1).astype(np.float32)
+
+
+def test_crop_box():
+    point_cloud = _grid_point_cloud()
+    cropped = crop_box(point_cloud, (0.0, 0.0, 0.0), (0.05, 0.1, 0.1))
+    assert cropped.shape == (500, 6)
+    assert np.all(cropped[:, 0] <= 0.05)
+
+    # a box that is rotated 90 degrees around z, so that its x axis is the y axis of the points
+    box_pose = np.array([[0.0, -1.0, 0.0, 0.05], [1.0, 0.0, 0.0, 0.025], [0.0, 0.0, 1.0, 0.05], [0.0, 0.0, 0.0, 1.0]])
+    cropped = crop_oriented_box(point_cloud, box_pose, (0.05, 0.2, 0.2))
+    assert cropped.shape == (500, 6)
+    assert np.all(cropped[:, 1] <= 0.05)
+
+
+def test_voxel_downsample():
+    point_cloud = _grid_point_cloud()
+    downsampled = voxel_downsample(point_cloud, 0.02)
+    assert downsampled.shape == (125, 6)
+    assert downsampled.dtype == np.float32
+    # the points and colors are averaged over each 2x2x2 block of points
+    first_voxel = downsampled[np.argmin(downsampled[:, :3].sum(axis=1))]
+    assert np.allclose(first_voxel, [0.01, 0.01, 0.01, 0.1, 0.1, 0.1])
+    assert np.isclose(downsampled[:, 3].mean(), point_cloud[:, 3].mean())
+
+    # sparse points in a large volume are hashed instead of indexed in a dense grid
+    sparse_point_cloud = np.array([[0.0, 0.0, 0.0], [0.001, 0.0, 0.0], [100.0, 100.0, 100.0]])
+    assert np.allclose(voxel_downsample(sparse_point_cloud, 0.01), [[0.0005, 0.0, 0.0], [100.0, 100.0, 100.0]])
+    assert voxel_downsample(np.empty((0, 6)), 0.01).shape == (0, 6)
+
+    # the linear index of a grid of more than 2^63 voxels would overflow int64
+    far_point_cloud = np.array([[0.0, 0.0, 0.0], [0.0001, 0.0, 0.0], [1e5, 1e5, 1e5]])
+    assert np.allclose(voxel_downsample(far_point_cloud, 1e-4), far_point_cloud)
+    # points without depth are dropped instead of ending up in garbage voxels
+    point_cloud_with_nan = np.array([[0.0, 0.0, 0.0], [np.nan, np.nan, np.nan], [0.001, 0.0, np.inf]])
+    assert np.allclose(voxel_downsample(point_cloud_with_nan, 0.01), [[0.0, 0.0, 0.0]])
+
+
+def test_outlier_removal():
+    point_cloud = _grid_point_cloud()
+    outlier = np.array([[1.0, 1.0, 1.0, 0.0, 0.0, 0.0]], dtype=np.float32)
+    point_cloud_with_outlier = np.concatenate([point_cloud, outlier])
+
+    assert np.array_equal(remove_radius_outliers(point_cloud_with_outlier, 0.011, 2), point_cloud)
+    assert np.array_equal(remove_statistical_outliers(point_cloud_with_outlier, 6), point_cloud)
+
+
+def test_point_cloud_filter():
+    point_cloud = _grid_point_cloud()
+    point_cloud_filter = PointCloudFilter(
+        min_corner=(0.0, 0.0, 0.0),
+        max_corner=(0.1, 0.1, 0.1),
+        box_pose=np.eye(4),
+        box_size=(0.1, 0.1, 0.1),
+        voxel_size=0.02,
+        outlier_radius=0.03,
+        min_neighbors=1,
+    )
+    filtered = point_cloud_filter(np.concatenate([point_cloud, [[1.0, 1.0, 1.0, 0.0, 0.0, 0.0]]]))
+    # the oriented box is centered at the origin
+    assert filtered.shape == (27, 6)
+    assert np.all(filtered[:, :3] < 0.05)
+
+    # the non-finite points are removed, also without crops
+    point_cloud_with_nan = np.concatenate([point_cloud, np.full((1, 6), np.nan, dtype=np.float32)])
+    assert np.array_equal(PointCloudFilter(outlier_radius=0.011, min_neighbors=2)(point_cloud_with_nan), point_cloud)
+
+    with pytest.raises(ValueError):
+        PointCloudFilter(min_corner=(0.0, 0.0, 0.0))
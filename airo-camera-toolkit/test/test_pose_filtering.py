@@ -0,0 +1,106 @@
+import numpy as np
+from airo_camera_toolkit.calibration.pose_filtering import MarkerPoseFilter, OneEuroPoseFilter
+from scipy.spatial.transform import Rotation
+
+
+def _pose(rotation_vector: np.ndarray, translation: np.ndarray) -> np.ndarray:
+    pose = np.eye(4)
+    pose[:3, :3] = Rotation.from_rotvec(rotation_vector).as_matrix()
+    pose[:3, 3] = translation
+    return pose
+
+
+def _noisy_poses(n_poses: int, rng: np.random.Generator, translation_noise: float = 0.002) -> np.ndarray:
+    rotation_vector = np.array([0.1, -0.3, 0.2])
+    translation = np.array([0.1, 0.2, 0.6])
+    return np.array(
+        [
+            _pose(rotation_vector + rng.normal(0, 0.01, 3), translation + rng.normal(0, translation_noise, 3))
+            for _ in range(n_poses)
+        ]
+    )
+
+
+def test_one_euro_filter_reduces_jitter():
+    rng = np.random.default_rng(2023)
+    poses = _noisy_poses(200, rng)
+    pose_filter = OneEuroPoseFilter()
+    filtered_poses = np.array([pose_filter.update(pose, i / 30) for i, pose in enumerate(poses)])
+
+    # skip the first poses, in which the filter converges
+    raw_jitter = np.std(poses[50:, :3, 3], axis=0).mean()
+    filtered_jitter = np.std(filtered_poses[50:, :3, 3], axis=0).mean()
+    assert filtered_jitter < raw_jitter / 3
+    assert np.allclose(filtered_poses[50:, :3, 3].mean(axis=0), [0.1, 0.2, 0.6], atol=1e-3)
+    for filtered_pose in filtered_poses:
+        # the orientations remain rotation matrices
+        assert np.allclose(filtered_pose[:3, :3] @ filtered_pose[:3, :3].T, np.eye(3), atol=1e-9)
+
+
+def test_one_euro_filter_follows_motion():
+    pose_filter = OneEuroPoseFilter()
+    pose = _pose(np.zeros(3), np.zeros(3))
+    pose_filter.update(pose, 0.0)
+    moved_pose = _pose(np.array([0.0, 0.0, 0.5]), np.array([0.2, 0.0, 0.0]))
+    for i in range(1, 60):
+        filtered_pose = pose_filter.update(moved_pose, i / 30)
+    assert np.allclose(filtered_pose, moved_pose, atol=1e-3)
+
+
+def test_one_euro_filter_quaternion_sign():
+    # rotations around 180 degrees, of which the quaternions flip sign
+    pose_filter = OneEuroPoseFilter()
+    for i, angle in enumerate(np.linspace(np.pi - 0.05, np.pi + 0.05, 11)):
+        pose = _pose(np.array([0.0, 0.0, angle]), np.zeros(3))
+        filtered_pose = pose_filter.update(pose, i / 30)
+        angle_difference = Rotation.from_matrix(filtered_pose[:3, :3].T @ pose[:3, :3]).magnitude()
+        assert angle_difference < 0.1
+
+
+def test_marker_pose_filter_rejects_outliers():
+    rng = np.random.default_rng(2023)
+    poses = _noisy_poses(30, rng, translation_noise=0.0)
+    pose_filter = MarkerPoseFilter(max_consecutive_outliers=3)
+    for i, pose in enumerate(poses[:20]):
+        pose_filter.update([7], pose[np.newaxis], i / 30)
+    filtered_pose = pose_filter.get_pose(7)
+    assert filtered_pose is not None
+
+    # a single jump is rejected
+    jumped_pose = poses[20].copy()
+    jumped_pose[:3, 3] += [0.3, 0.0, 0.0]
+    filtered_poses = pose_filter.update([7], jumped_pose[np.newaxis], 20 / 30)
+    assert np.allclose(filtered_poses[7], filtered_pose)
+
+    # as well as measurements with a large reprojection error
+    filtered_poses = pose_filter.update([7], poses[21][np.newaxis], 21 / 30, reprojection_errors=np.array([10.0]))
+    assert np.allclose(filtered_poses[7], filtered_pose)
+
+    # a jump that persists is accepted as a motion
+    for i in range(22, 25):
+        filtered_poses = pose_filter.update([7], jumped_pose[np.newaxis], i / 30)
+    assert np.allclose(filtered_poses[7], jumped_pose)
+
+
+def test_marker_pose_filter_dropouts():
+    pose_filter = MarkerPoseFilter(max_dropout_time=0.5)
+    pose_a = _pose(np.zeros(3), np.array([0.0, 0.0, 0.5]))
+    pose_b = _pose(np.array([0.0, 0.2, 0.0]), np.array([0.1, 0.0, 0.5]))
+    filtered_poses = pose_filter.update(np.array([1, 2]), np.stack([pose_a, pose_b]), 0.0)
+    assert set(filtered_poses.keys()) == {1, 2}
+    assert np.allclose(filtered_poses[2], pose_b)
+
+    # marker 2 is occluded: it keeps its last pose until it is forgotten
+    filtered_poses = pose_filter.update([1], pose_a[np.newaxis], 0.3)
+    assert set(filtered_poses.keys()) == {1, 2}
+    filtered_poses = pose_filter.update([1], pose_a[np.newaxis], 0.6)
+    assert set(filtered_poses.keys()) == {1}
+    assert pose_filter.get_pose(2) is None
+
+    # after the dropout, marker 2 restarts at its new pose instead of smoothing from its old pose
+    moved_pose_b = _pose(np.zeros(3), np.array([0.5, 0.0, 0.5]))
+    filtered_poses = pose_filter.update([1, 2], np.stack([pose_a, moved_pose_b]), 0.7)
+    assert np.allclose(filtered_poses[2], moved_pose_b)
+
+    pose_filter.reset()
+    assert pose_filter.poses == {}
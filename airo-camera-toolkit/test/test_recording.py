@@ -0,0 +1,96 @@
+import os
+
+import numpy as np
+import pytest
+from airo_camera_toolkit.cameras.fake import FakeStereoRGBDCamera
+from airo_camera_toolkit.cameras.replay import ReplayCamera
+from airo_camera_toolkit.recording import CameraRecorder, FrameStore
+
+
+def _record(path: str, n_frames: int, **kwargs) -> FakeStereoRGBDCamera:
+    camera = FakeStereoRGBDCamera(resolution=(64, 48), fps=0, depth=2.0)
+    with CameraRecorder(camera, path, **kwargs) as recorder:
+        recorder.record(n_frames)
+        assert recorder.n_recorded_frames == n_frames
+    return camera
+
+
+def test_record_and_replay(tmp_path):
+    path = str(tmp_path / "recording")
+    camera = _record(path, 5, chunk_size=2)
+    # 5 frames in chunks of 2 frames
+    assert sorted(filename for filename in os.listdir(path) if filename.startswith("rgb")) == [
+        "rgb_00000.bin",
+        "rgb_00001.bin",
+        "rgb_00002.bin",
+    ]
+
+    replay_camera = ReplayCamera(path, realtime=False)
+    assert len(replay_camera) == 5
+    assert replay_camera.recorded_modalities == ("rgb", "depth_map")
+    assert np.allclose(replay_camera.intrinsics_matrix(), camera.intrinsics_matrix())
+    assert replay_camera.calibration.resolution == (64, 48)
+
+    for frame_index in range(5):
+        image = replay_camera.get_rgb_image_as_int()
+        assert image.shape == (48, 64, 3)
+        assert image[0, 0, 0] == frame_index
+        # zero-copy, read-only view on the recording
+        assert not image.flags.writeable
+
+    with pytest.raises(IndexError):
+        replay_camera.get_depth_map()
+
+
+def test_replay_through_snapshots(tmp_path):
+    path = str(tmp_path / "recording")
+    _record(path, 3)
+    replay_camera = ReplayCamera(path, realtime=False, loop=True)
+    timestamps = FrameStore(path).timestamps
+    assert np.all(np.diff(timestamps) >= 0)
+
+    snapshots = [replay_camera.capture() for _ in range(4)]
+    # the camera loops back to the first frame
+    assert snapshots[3].timestamp == timestamps[0]
+    assert np.isclose(snapshots[3].depth_map, 2.0).all()
+    assert snapshots[3].colored_point_cloud.shape == (48 * 64, 6)
+    with pytest.raises(ValueError):
+        snapshots[3].depth_image
+
+
+def test_recorder_does_not_overwrite_recordings(tmp_path):
+    path = str(tmp_path / "recording")
+    _record(path, 1)
+    with pytest.raises(FileExistsError):
+        CameraRecorder(FakeStereoRGBDCamera(fps=0), path)
+
+
+class _CameraWithoutCalibration(FakeStereoRGBDCamera):
+    @property
+    def calibration(self):
+        raise NotImplementedError
+
+
+def test_record_camera_without_calibration(tmp_path):
+    camera = _CameraWithoutCalibration(resolution=(64, 48), fps=0)
+    with CameraRecorder(camera, str(tmp_path / "recording")) as recorder:
+        recorder.record(2)
+    store = FrameStore(str(tmp_path / "recording"))
+    assert store.calibration.resolution == (64, 48)
+    assert np.allclose(store.calibration.intrinsics_matrix, camera.intrinsics_matrix())
+
+
+@pytest.mark.parametrize("camera_type", [FakeStereoRGBDCamera, _CameraWithoutCalibration])
+def test_recording_without_frames(tmp_path, camera_type):
+    path = str(tmp_path / "recording")
+    with CameraRecorder(camera_type(resolution=(64, 48), fps=0), path):
+        pass
+    store = FrameStore(path)
+    assert len(store) == 0
+    assert store.timestamps.shape == (0,)
+    assert store.modalities == ("rgb", "depth_map")
+    assert (store.calibration is None) == (camera_type is _CameraWithoutCalibration)
+    with pytest.raises(IndexError):
+        store.get("rgb", 0)
+    with pytest.raises(ValueError):
+        ReplayCamera(path)
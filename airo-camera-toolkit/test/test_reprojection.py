@@ -1,10 +1,21 @@
 from test.test_config import _ImageTestValues
 
+import cv2
 import numpy as np
+import pytest
+from airo_camera_toolkit.camera_calibration import CameraCalibration
 from airo_camera_toolkit.reprojection import (
+    DepthHeuristicCache,
+    Reprojector,
+    distort_pixels,
     extract_depth_from_depthmap_heuristic,
+    get_pixel_ray_grid,
     project_frame_to_image_plane,
+    project_frame_to_image_planes,
     reproject_to_frame,
+    reproject_to_frame_z_plane,
+    undistort_pixels,
+    unproject_depth_map,
 )
 from PIL import Image
 
@@ -52,6 +63,43 @@ def test_depth_heuristic():
     assert np.isclose(depths, _ImageTestValues._depth_z_values, atol=1e-2).all()
 
 
+def test_depth_heuristic_matches_nanquantile_and_handles_borders():
+    rng = np.random.default_rng(0)
+    depth_map = rng.uniform(0.5, 2.0, (40, 60))
+    depth_map[rng.random((40, 60)) < 0.2] = np.nan
+    coordinates = np.array([[0, 0], [59, 39], [2, 30], [30, 20]])
+    depths = extract_depth_from_depthmap_heuristic(coordinates, depth_map, mask_size=7, depth_percentile=0.1)
+    for (u, v), depth in zip(coordinates, depths):
+        # the region is cropped at the border of the depth map
+        region = depth_map[max(v - 3, 0) : v + 4, max(u - 3, 0) : u + 4]
+        assert np.isclose(depth, np.nanquantile(region, 0.1))
+
+    cache = DepthHeuristicCache(depth_map, mask_size=7, depth_percentile=0.1)
+    assert np.allclose(cache.extract_depth(coordinates[:2]), depths[:2])
+    assert np.allclose(cache.extract_depth(coordinates), depths)
+    # negative coordinates do not wrap around to the cached pixels on the other side of the depth map
+    cache.extract_depth(np.array([[59, 5]]))
+    with pytest.raises(AssertionError):
+        cache.extract_depth(np.array([[-1, 5]]))
+
+
+def test_precomputed_depth_heuristic():
+    # a table at 1 m with noise and an object at 0.5 m, the heuristic picks the nearest object around its border
+    rng = np.random.default_rng(0)
+    depth_map = rng.normal(1.0, 0.002, (60, 80)).astype(np.float32)
+    depth_map[20:40, 30:50] = 0.5
+    depth_map[rng.random((60, 80)) < 0.1] = np.nan
+    depth_map[5, 5] = 0.1  # a single noisy pixel
+    coordinates = np.array([[0, 0], [79, 59], [5, 5], [40, 30], [28, 30], [60, 10]])
+    expected_depths = extract_depth_from_depthmap_heuristic(coordinates, depth_map, mask_size=7)
+
+    cache = DepthHeuristicCache(depth_map, mask_size=7, precompute=True)
+    depths = cache.extract_depth(coordinates)
+    assert np.allclose(depths, expected_depths, atol=0.01)
+    with pytest.raises(AssertionError):
+        cache.extract_depth(np.array([[80, 0]]))
+
+
 def test_reproject_world_frame():
     depth_map = _load_depthmap()
     reprojected_points = reproject_to_frame(
@@ -69,3 +117,148 @@ def test_reproject_camera_frame():
         _ImageTestValues._positions_on_image_plane, _ImageTestValues._intrinsics_matrix, np.eye(4), depth_map
     )
     assert np.isclose(reprojected_points, _ImageTestValues._positions_in_camera_frame, atol=1e-2).all()
+
+
+def test_unproject_depth_map():
+    depth_map = _load_depthmap()
+    intrinsics = _ImageTestValues._intrinsics_matrix
+    points = unproject_depth_map(depth_map, intrinsics, organized=True, dtype=np.float64)
+    assert points.shape == (*depth_map.shape, 3)
+    u, v = 100, 200
+    expected = reproject_to_frame(
+        np.array([[u, v]]), intrinsics, np.eye(4), depth_map, mask_size=1, depth_percentile=0.0
+    )
+    assert np.isclose(points[v, u], expected[0]).all()
+
+    # the ray grid is cached per intrinsics and resolution
+    grid = get_pixel_ray_grid(intrinsics, (depth_map.shape[1], depth_map.shape[0]))
+    assert grid is get_pixel_ray_grid(intrinsics.copy(), (depth_map.shape[1], depth_map.shape[0]))
+    assert not grid.flags.writeable
+
+
+def test_unproject_depth_map_options():
+    depth_map = np.ones((6, 8), dtype=np.float32)
+    depth_map[0, 0] = np.nan
+    depth_map[1, 1] = 0.0
+    rgb_image = np.full((6, 8, 3), 255, dtype=np.uint8)
+    intrinsics = np.array([[8.0, 0.0, 4.0], [0.0, 8.0, 3.0], [0.0, 0.0, 1.0]])
+
+    points = unproject_depth_map(depth_map, intrinsics, rgb_image)
+    assert points.shape == (46, 6)
+    assert points.dtype == np.float32
+    assert np.isclose(points[:, 3:], 1.0).all()
+
+    organized_points = unproject_depth_map(depth_map, intrinsics, rgb_image, organized=True)
+    assert organized_points.shape == (6, 8, 6)
+    assert np.isnan(organized_points[0, 0, :3]).all()
+
+    roi_points = unproject_depth_map(depth_map, intrinsics, organized=True, stride=2, roi=(4, 2, 4, 4))
+    assert roi_points.shape == (2, 2, 3)
+    assert np.isclose(roi_points[0, 0], [0.0, -1 / 8, 1.0]).all()
+
+
+def test_reprojector():
+    depth_map = _load_depthmap()
+    intrinsics = _ImageTestValues._intrinsics_matrix
+    extrinsics = _ImageTestValues._extrinsics_matrix
+    pixels = _ImageTestValues._positions_on_image_plane
+    reprojector = Reprojector(intrinsics, (depth_map.shape[1], depth_map.shape[0]), extrinsics)
+
+    points = reprojector.pixels_to_3d(depth_map, pixels)
+    assert np.isclose(points, _ImageTestValues._positions_in_world_frame, atol=1e-2).all()
+    assert np.isclose(
+        reprojector.pixels_to_z_plane(pixels, 0.2), _ImageTestValues._positions_in_world_frame, atol=1e-3
+    ).all()
+    assert np.isclose(
+        reprojector.pixels_to_z_plane(pixels), reproject_to_frame_z_plane(pixels, intrinsics, extrinsics)
+    ).all()
+
+    # the pose can be changed, e.g. to reproject to the camera frame
+    reprojector.camera_in_frame_pose = None
+    assert np.isclose(
+        reprojector.pixels_to_3d(depth_map, pixels), _ImageTestValues._positions_in_camera_frame, atol=1e-2
+    ).all()
+
+
+def test_reprojector_depth_map():
+    depth_map = _load_depthmap()
+    intrinsics = _ImageTestValues._intrinsics_matrix
+    extrinsics = _ImageTestValues._extrinsics_matrix
+    reprojector = Reprojector(intrinsics, (depth_map.shape[1], depth_map.shape[0]), extrinsics)
+
+    points = reprojector.pixels_to_3d(depth_map)
+    assert points.shape == (*depth_map.shape, 3)
+    u, v = 100, 200
+    expected = reprojector.pixels_to_3d(depth_map, np.array([[u, v]]), mask_size=1, depth_percentile=0.0)
+    assert np.isclose(points[v, u], expected[0], atol=1e-5).all()
+
+    with pytest.raises(ValueError):
+        reprojector.pixels_to_3d(depth_map[:10])
+    with pytest.raises(ValueError):
+        Reprojector(intrinsics).pixels_to_3d(depth_map)
+
+
+def test_project_frame_to_image_planes():
+    intrinsics = _ImageTestValues._intrinsics_matrix
+    world_pose_in_camera_frame = np.linalg.inv(_ImageTestValues._extrinsics_matrix)
+    # the second camera is turned around, the points are behind it
+    turned_around = np.diag([1.0, -1.0, -1.0, 1.0]) @ world_pose_in_camera_frame
+    points = np.concatenate([_ImageTestValues._positions_in_world_frame, [[5.0, 0.0, 0.0]]])
+
+    projection = project_frame_to_image_planes(
+        points, [intrinsics, intrinsics], [world_pose_in_camera_frame, turned_around], resolutions=[(400, 300)] * 2
+    )
+    assert projection.pixels.shape == (2, 3, 2)
+    assert np.isclose(projection.pixels[0, :2], _ImageTestValues._positions_on_image_plane, atol=1e-2).all()
+    assert np.isclose(
+        projection.pixels[0, 0], project_frame_to_image_plane(points[:1], intrinsics, world_pose_in_camera_frame)
+    ).all()
+    assert projection.is_in_front[0].all() and not projection.is_in_front[1].any()
+    # the last point is outside the image
+    assert projection.is_in_frustum.tolist() == [[True, True, False], [False, False, False]]
+    assert projection.is_visible is None
+    assert projection.cameras_that_see(0).tolist() == [0]
+
+
+def test_project_frame_to_image_planes_occlusion():
+    depth_map = _load_depthmap()
+    intrinsics = _ImageTestValues._intrinsics_matrix
+    world_pose_in_camera_frame = np.linalg.inv(_ImageTestValues._extrinsics_matrix)
+    # the top corners of the cube are visible, its center is occluded by the cube itself
+    points = np.concatenate([_ImageTestValues._positions_in_world_frame, [[0.0, 0.0, 0.1]]])
+
+    projection = project_frame_to_image_planes(
+        points, [intrinsics], [world_pose_in_camera_frame], depth_maps=[depth_map]
+    )
+    assert projection.is_in_frustum.all()
+    assert projection.is_visible is not None
+    assert projection.is_visible.tolist() == [[True, True, False]]
+    assert projection.cameras_that_see(2).size == 0
+
+
+def test_reprojection_with_distortion():
+    intrinsics = _ImageTestValues._intrinsics_matrix
+    calibration = CameraCalibration(_ImageTestValues._image_dims, intrinsics, [-0.2, 0.05, 0.001, -0.002, 0.0])
+    points = _ImageTestValues._positions_in_camera_frame
+
+    pixels = project_frame_to_image_plane(points, calibration)
+    assert np.isclose(
+        pixels,
+        cv2.projectPoints(points, np.zeros(3), np.zeros(3), intrinsics, calibration.distortion_coefficients)[0][:, 0],
+    ).all()
+    assert np.isclose(undistort_pixels(pixels, calibration), project_frame_to_image_plane(points, intrinsics)).all()
+    assert np.isclose(distort_pixels(undistort_pixels(pixels, calibration), calibration), pixels).all()
+
+    # reprojecting the distorted pixels to the plane of the points gives the points again
+    reprojector = Reprojector(calibration)
+    assert np.isclose(reprojector.pixels_to_z_plane(pixels, points[0, 2]), points).all()
+
+    # the ray table also takes the distortion into account
+    u, v = np.round(pixels[0]).astype(int)
+    depth_map = np.ones(calibration.resolution[::-1], dtype=np.float32)
+    assert np.isclose(
+        reprojector.pixels_to_3d(depth_map)[v, u], reprojector.pixels_to_rays(np.array([[u, v]]))[0]
+    ).all()
+
+    projection = project_frame_to_image_planes(points, [calibration, calibration], [np.eye(4), np.eye(4)])
+    assert np.isclose(projection.pixels[0], pixels).all()
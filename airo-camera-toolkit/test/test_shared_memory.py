@@ -0,0 +1,86 @@
+import uuid
+
+import numpy as np
+import pytest
+from airo_camera_toolkit.cameras.fake import FakeStereoRGBDCamera
+from airo_camera_toolkit.cameras.shared_memory import SharedMemoryCamera, SharedMemoryCameraPublisher
+
+
+def _publisher(n_slots: int = 3) -> SharedMemoryCameraPublisher:
+    camera = FakeStereoRGBDCamera(resolution=(64, 48), fps=0, depth=2.0)
+    return SharedMemoryCameraPublisher(camera, f"airo-test-{uuid.uuid4().hex[:8]}", n_slots=n_slots)
+
+
+def test_shared_memory_camera_reads_published_frames():
+    with _publisher() as publisher, SharedMemoryCamera(publisher.name, timeout=0.01) as camera:
+        assert set(camera.published_modalities) == {"rgb", "depth_map", "depth_image", "rgb_right"}
+        assert np.allclose(camera.intrinsics_matrix(), publisher.camera.intrinsics_matrix())
+
+        # the frame that was published on construction
+        image = camera.get_rgb_image_as_int()
+        assert image[0, 0, 0] == 0
+        # zero-copy, read-only views on the shared memory
+        assert not image.flags.writeable
+        with pytest.raises(TimeoutError):
+            camera.get_rgb_image_as_int()
+
+        publisher.publish_frame()
+        publisher.publish_frame()
+        # readers always get the latest frame
+        snapshot = camera.capture()
+        assert snapshot.rgb_image_as_int[0, 0, 0] == 2
+        assert np.isclose(snapshot.depth_map, 2.0).all()
+        assert snapshot.timestamp == publisher.camera._retrieve_timestamp()
+        assert snapshot.colored_point_cloud.shape == (48 * 64, 6)
+
+
+def test_shared_memory_camera_detects_overwritten_frames():
+    with _publisher(n_slots=2) as publisher, SharedMemoryCamera(publisher.name) as camera:
+        image = camera.get_rgb_image_as_int()
+        publisher.publish_frame()
+        assert camera.is_frame_valid()
+        publisher.publish_frame()
+        # the slot of the frame was overwritten
+        assert not camera.is_frame_valid()
+        assert image[0, 0, 0] == 2
+        with pytest.raises(RuntimeError):
+            camera._retrieve_depth_map()
+
+
+def test_shared_memory_camera_with_publisher_thread():
+    publisher = _publisher()
+    camera = SharedMemoryCamera(publisher.name, zero_copy=False)
+    publisher.start()
+    images = [camera.get_rgb_image_as_int() for _ in range(3)]
+    # each grab returns a newer frame
+    assert images[0][0, 0, 0] < images[1][0, 0, 0] < images[2][0, 0, 0]
+    assert images[0].flags.writeable
+    publisher.close()
+    with pytest.raises(IndexError):
+        camera.get_rgb_image_as_int()
+    camera.close()
+
+
+class _OverwrittenWhileCopied(np.ndarray):
+    """a view on a slot of which the publisher starts overwriting the slot while it is copied."""
+
+    publisher_slot = None
+
+    def copy(self, order="C"):  # type: ignore[override]
+        self.publisher_slot.sequence_number[0] = -1
+        return np.ndarray.copy(self, order)
+
+
+def test_shared_memory_camera_checks_snapshot_copies():
+    with _publisher() as publisher, SharedMemoryCamera(publisher.name) as camera:
+        publisher.publish_frame()
+        snapshot = camera.capture()
+        # zero_copy only applies to the get_* methods, snapshots are always copied
+        assert snapshot.depth_map.flags.writeable
+
+        publisher.publish_frame()
+        snapshot = camera.capture()
+        _OverwrittenWhileCopied.publisher_slot = publisher._slots[camera._sequence_number % len(publisher._slots)]
+        camera._slot.data["rgb"] = camera._slot.data["rgb"].view(_OverwrittenWhileCopied)
+        with pytest.raises(RuntimeError):
+            snapshot.rgb_image_as_int
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+from airo_camera_toolkit.cameras.fake import FakeStereoRGBDCamera
+
+
+class _CountingFakeCamera(FakeStereoRGBDCamera):
+    def __init__(self) -> None:
+        super().__init__(resolution=(64, 48), fps=0)
+        self.n_grabs = 0
+        self.n_rgb_retrievals = 0
+
+    def _grab_images(self) -> None:
+        self.n_grabs += 1
+        super()._grab_images()
+
+    def _retrieve_rgb_image_as_int(self, view: str = FakeStereoRGBDCamera.LEFT_RGB) -> np.ndarray:
+        self.n_rgb_retrievals += 1
+        return super()._retrieve_rgb_image_as_int(view)
+
+
+def test_snapshot_grabs_once_and_memoizes():
+    camera = _CountingFakeCamera()
+    snapshot = camera.capture()
+    assert camera.n_grabs == 1
+    assert camera.n_rgb_retrievals == 0
+
+    rgb = snapshot.rgb_image_as_int
+    assert snapshot.rgb_image_as_int is rgb
+    assert snapshot.rgb_image.dtype == np.float32
+    assert camera.n_rgb_retrievals == 1
+
+    assert snapshot.right_rgb_image.shape == (48, 64, 3)
+    assert snapshot.depth_map.shape == (48, 64)
+    assert snapshot.depth_image.shape == (48, 64, 3)
+    assert camera.n_grabs == 1
+
+
+def test_snapshot_modalities_come_from_the_same_frame():
+    camera = FakeStereoRGBDCamera(resolution=(64, 48), fps=0)
+    snapshot = camera.capture()
+    left = snapshot.rgb_image_as_int
+    # retrieved modalities are copies, grabbing again does not alter them
+    camera.capture()
+    assert left[0, 0, 0] == 0
+    # modalities that were not retrieved before the next grab are no longer available
+    with pytest.raises(RuntimeError):
+        snapshot.right_rgb_image_as_int
+
+
+def test_snapshot_from_acquisition_thread():
+    with FakeStereoRGBDCamera(resolution=(64, 48), fps=0) as camera:
+        camera.start_acquisition_thread(modalities=["rgb", "depth_map"])
+        snapshot = camera.capture()
+        assert snapshot.rgb_image_as_int.shape == (48, 64, 3)
+        assert snapshot.depth_map.shape == (48, 64)
+        with pytest.raises(ValueError):
+            snapshot.depth_image
+
+
+def test_default_colored_point_cloud():
+    camera = FakeStereoRGBDCamera(resolution=(64, 48), fps=0, depth=2.0)
+    point_cloud = camera.capture().colored_point_cloud
+    assert point_cloud.shape == (64 * 48, 6)
+    assert np.isclose(point_cloud[:, 2], 2.0).all()
+    assert camera.get_colored_point_cloud().shape == (64 * 48, 6)
+
+
+def test_rgb_retrieval_into_out_buffer():
+    camera = FakeStereoRGBDCamera(resolution=(64, 48), fps=0)
+    out = np.empty((48, 64, 3), dtype=np.uint8)
+    image = camera.get_rgb_image_as_int(out=out)
+    assert image is out
+    assert out[0, 0, 0] == 0
+    # retrieved images do not share memory with the camera buffers
+    other_image = camera.get_rgb_image_as_int()
+    assert other_image.flags.c_contiguous
+    assert out[0, 0, 0] == 0 and other_image[0, 0, 0] == 1
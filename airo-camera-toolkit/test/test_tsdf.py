@@ -0,0 +1,67 @@
+import numpy as np
+from airo_camera_toolkit.camera_calibration import CameraCalibration
+from airo_camera_toolkit.reprojection import get_pixel_ray_grid
+from airo_camera_toolkit.tsdf import TSDFVolume
+
+_INTRINSICS = np.array([[100.0, 0.0, 80.0], [0.0, 100.0, 60.0], [0.0, 0.0, 1.0]])
+_RESOLUTION = (160, 120)
+
+
+def _camera_pose(x: float) -> np.ndarray:
+    """a camera at 1m above the table (the XY plane), looking down."""
+    return np.array([[1.0, 0.0, 0.0, x], [0.0, -1.0, 0.0, 0.0], [0.0, 0.0, -1.0, 1.0], [0.0, 0.0, 0.0, 1.0]])
+
+
+def _depth_map(x: float, noise: float = 0.0, seed: int = 0) -> np.ndarray:
+    """depth map of the table with a 10x10x10 cm box centered at the origin."""
+    rays = get_pixel_ray_grid(_INTRINSICS, _RESOLUTION, np.float64)
+    depth_map = np.ones(rays.shape[:2])
+    # the points on the top of the box at depth 0.9
+    x_top, y_top = x + 0.9 * rays[..., 0], -0.9 * rays[..., 1]
+    depth_map[(np.abs(x_top) < 0.05) & (np.abs(y_top) < 0.05)] = 0.9
+    depth_map += np.random.default_rng(seed).normal(0.0, noise, depth_map.shape)
+    depth_map[0, 0] = np.nan
+    return depth_map.astype(np.float32)
+
+
+def test_tsdf_heightmap_of_multiple_views():
+    volume = TSDFVolume((-0.2, -0.2, -0.05), (0.2, 0.2, 0.2), voxel_size=0.01, max_voxels_per_slab=1000)
+    assert volume.shape == (40, 40, 25)
+    frames = [
+        (_depth_map(x, noise=0.005, seed=i), _INTRINSICS, _camera_pose(x)) for i, x in enumerate([-0.1, 0.0, 0.1])
+    ]
+    volume.integrate_frames(frames)
+    assert volume.weights.max() == 3
+
+    heightmap = volume.extract_heightmap()
+    assert heightmap.shape == (40, 40)
+    # the table around the box and the top of the box
+    assert np.abs(heightmap[:10, :10] - 0.0).max() < 0.01
+    assert np.abs(heightmap[17:23, 17:23] - 0.1).max() < 0.01
+
+
+def test_tsdf_point_cloud():
+    volume = TSDFVolume((-0.2, -0.2, -0.05), (0.2, 0.2, 0.2), voxel_size=0.01)
+    volume.integrate(_depth_map(0.0), _INTRINSICS, _camera_pose(0.0))
+    point_cloud = volume.extract_point_cloud()
+    on_table = (np.abs(point_cloud[:, 0]) > 0.07) | (np.abs(point_cloud[:, 1]) > 0.07)
+    assert np.abs(point_cloud[on_table, 2]).max() < 0.005
+    assert np.abs(point_cloud[~on_table, 2] - 0.1).min() < 0.005
+
+    # voxels behind the surfaces and outside of the view are not observed
+    assert volume.weights[:, :, 0].sum() == 0
+    volume.reset()
+    assert len(volume.extract_point_cloud()) == 0
+
+
+def test_tsdf_with_distortion():
+    # negligible distortion, to compare the distorted projection with the projection of the intrinsics matrix
+    calibration = CameraCalibration(_RESOLUTION, _INTRINSICS, np.array([1e-12, 0.0, 0.0, 0.0]))
+    assert calibration.has_distortion
+    volumes = []
+    for intrinsics in [_INTRINSICS, calibration]:
+        volume = TSDFVolume((-0.2, -0.2, -0.05), (0.2, 0.2, 0.2), voxel_size=0.01, max_voxels_per_slab=1000)
+        volume.integrate(_depth_map(0.0), intrinsics, _camera_pose(0.0))
+        volumes.append(volume)
+    assert np.array_equal(volumes[0].weights, volumes[1].weights)
+    assert np.allclose(volumes[0].tsdf, volumes[1].tsdf)
@@ -0,0 +1,56 @@
+from test.test_config import _ImageTestValues
+
+import numpy as np
+import pytest
+from airo_camera_toolkit.camera_calibration import CameraCalibration
+from airo_camera_toolkit.reprojection import distort_pixels
+from airo_camera_toolkit.undistortion import Undistorter, get_undistortion_maps
+
+_DISTORTION_COEFFICIENTS = [-0.2, 0.05, 0.001, -0.002, 0.0]
+
+
+def _distorted_calibration() -> CameraCalibration:
+    return CameraCalibration(
+        _ImageTestValues._image_dims, _ImageTestValues._intrinsics_matrix, _DISTORTION_COEFFICIENTS
+    )
+
+
+def test_undistortion_maps_are_cached():
+    calibration = _distorted_calibration()
+    maps = get_undistortion_maps(calibration)
+    assert maps[0] is get_undistortion_maps(_distorted_calibration())[0]
+    assert not maps[0].flags.writeable
+    with pytest.raises(ValueError):
+        get_undistortion_maps(CameraCalibration(_ImageTestValues._image_dims, _ImageTestValues._intrinsics_matrix))
+
+
+def test_undistorter():
+    calibration = _distorted_calibration()
+    undistorter = Undistorter(calibration)
+    assert not undistorter.calibration.has_distortion
+    width, height = calibration.resolution
+
+    # a bright spot in the distorted image ends up at the undistorted pixel
+    undistorted_pixel = np.array([[60.0, 40.0]])
+    u, v = np.round(distort_pixels(undistorted_pixel, calibration)[0]).astype(int)
+    image = np.zeros((height, width, 3), dtype=np.uint8)
+    image[v - 1 : v + 2, u - 1 : u + 2] = 255
+    out = np.empty_like(image)
+    undistorted_image = undistorter.undistort(image, out=out)
+    assert undistorted_image is out
+    v_max, u_max = np.unravel_index(np.argmax(undistorted_image[..., 0]), (height, width))
+    assert np.abs(np.array([u_max, v_max]) - undistorted_pixel[0]).max() <= 2
+
+    depth_map = np.full((height, width), 2.0, dtype=np.float32)
+    depth_map[v - 1 : v + 2, u - 1 : u + 2] = 1.0
+    # no interpolated depths between 1 and 2
+    assert set(np.unique(undistorter.undistort_depth_map(depth_map))).issubset({0.0, 1.0, 2.0})
+
+    with pytest.raises(ValueError):
+        undistorter.undistort(image[:10])
+
+
+def test_undistorter_without_distortion():
+    calibration = CameraCalibration(_ImageTestValues._image_dims, _ImageTestValues._intrinsics_matrix)
+    image = np.zeros((*calibration.resolution[::-1], 3), dtype=np.uint8)
+    assert Undistorter(calibration).undistort(image) is image
@@ -1,5 +1,13 @@
 import numpy as np
-from airo_camera_toolkit.utils import ImageConverter, is_float_image_array, is_image_array, is_int_image_array
+import pytest
+from airo_camera_toolkit.utils import (
+    ImageBufferPool,
+    ImageConverter,
+    check_out_buffer,
+    is_float_image_array,
+    is_image_array,
+    is_int_image_array,
+)
 
 
 def test_image_format_checks():
@@ -39,3 +47,80 @@ def test_image_converter_conversions():
     opencv_shaped = np.random.randint(0, 255, (10, 10, 3), dtype=np.uint8)
     numpy_shaped = ImageConverter.from_opencv_format(opencv_shaped).image_in_numpy_format
     assert np.isclose(opencv_shaped, ImageConverter.from_numpy_format(numpy_shaped).image_in_opencv_format).all()
+
+
+def test_image_buffer_pool():
+    pool = ImageBufferPool(n_buffers=2)
+    first = pool.get((4, 5, 3))
+    second = pool.get((4, 5, 3))
+    assert first is not second
+    assert pool.get((4, 5, 3)) is first
+    assert first.flags.c_contiguous
+    assert pool.get((4, 5), np.float32).dtype == np.float32
+
+
+def test_check_out_buffer():
+    check_out_buffer(np.empty((4, 5, 3), dtype=np.uint8), (4, 5, 3))
+    # OpenCV would silently write into a new array for each of these
+    for out in [
+        np.empty((4, 5, 3), dtype=np.float32),
+        np.empty((5, 4, 3), dtype=np.uint8),
+        np.empty((4, 5, 4), dtype=np.uint8)[..., :3],
+    ]:
+        with pytest.raises(ValueError):
+            check_out_buffer(out, (4, 5, 3))
+
+
+def test_image_converter_int_float_round_trip_is_exact():
+    all_values = np.repeat(np.arange(256, dtype=np.uint8), 3).reshape(16, 16, 3)
+    float_image = ImageConverter.from_numpy_int_format(all_values).image_in_numpy_format
+    assert float_image.dtype == np.float32
+    assert (ImageConverter.from_numpy_format(float_image).image_in_numpy_int_format == all_values).all()
+    assert (ImageConverter.from_numpy_format(float_image).image_in_opencv_format == all_values[..., ::-1]).all()
+
+
+def test_image_converter_does_not_alter_its_state():
+    numpy_shaped = np.random.rand(10, 12, 3)
+    original = numpy_shaped.copy()
+    converter = ImageConverter.from_numpy_format(numpy_shaped)
+    first = converter.image_in_opencv_format.copy()
+    assert (converter.image_in_opencv_format == first).all()
+    assert (numpy_shaped == original).all()
+    # conversions are cached
+    assert converter.image_in_torch_format is converter.image_in_torch_format
+
+
+def test_image_converter_out_argument():
+    opencv_shaped = np.random.randint(0, 255, (10, 12, 3), dtype=np.uint8)
+    converter = ImageConverter.from_opencv_format(opencv_shaped)
+
+    out = np.empty((3, 10, 12), dtype=np.float32)
+    torch_shaped = converter.to_torch_format(out=out)
+    assert torch_shaped is out
+    assert np.isclose(out, np.transpose(opencv_shaped[..., ::-1], (2, 0, 1)) / 255.0).all()
+
+    int_out = np.empty((10, 12, 3), dtype=np.uint8)
+    assert converter.to_numpy_int_format(out=int_out) is int_out
+    assert (int_out == opencv_shaped[..., ::-1]).all()
+    assert (ImageConverter.from_torch_format(torch_shaped).image_in_opencv_format == opencv_shaped).all()
+
+
+def test_image_converter_does_not_alias_the_input_image():
+    opencv_shaped = np.random.randint(0, 255, (10, 12, 3), dtype=np.uint8)
+    converter = ImageConverter.from_opencv_format(opencv_shaped)
+    same_format = converter.image_in_opencv_format
+    assert not np.shares_memory(same_format, opencv_shaped)
+    assert (same_format == opencv_shaped).all()
+
+
+def test_image_converter_rejects_invalid_out_arrays():
+    converter = ImageConverter.from_opencv_format(np.zeros((10, 12, 3), dtype=np.uint8))
+    with pytest.raises(ValueError):
+        converter.to_numpy_int_format(out=np.empty((10, 12, 3), dtype=np.float32))
+    with pytest.raises(ValueError):
+        converter.to_numpy_int_format(out=np.empty((12, 10, 3), dtype=np.uint8))
+    with pytest.raises(ValueError):
+        converter.to_numpy_int_format(out=np.empty((10, 12, 4), dtype=np.uint8)[..., :3])
+    with pytest.raises(ValueError):
+        converter.to_torch_format(out=np.empty((3, 10, 12), dtype=np.uint8))
+    converter.to_torch_format(out=np.empty((3, 10, 12), dtype=np.float64))